@@ -0,0 +1,109 @@
+"""
+This file contains a stand-in for Google Cloud Speech, decoding the audio it receives as the service would (simulating
+its upload over a link of limited bandwidth), and recognizing a placeholder word for every second of audio.
+"""
+
+import io
+import time
+import numpy as np
+import soundfile as sf
+
+from types import SimpleNamespace
+from backend.recording.audio_encoding import AUDIO_ENCODINGS, encode_audio
+from typing import Any, Dict, List, Optional
+
+
+class FakeOperation:
+
+    def __init__(self, response: Any):
+        """
+        Completed long-running operation, as returned by FakeSpeechClient.
+        :param response: Response of the operation
+        """
+
+        self.__response = response
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        return self.__response
+
+
+class FakeSpeechClient:
+
+    def __init__(self, bandwidth: Optional[float] = None, word_duration: float = 1.0):
+        """
+        Local endpoint with the same long_running_recognize method of speech_v1.SpeechClient (see SpeechClient, client).
+        Audio is decoded according to the recognition config, so that mismatching configs are rejected.
+        :param bandwidth: Upload bandwidth (in bytes per second, default: None, no upload time)
+        :param word_duration: Duration of each placeholder word (in seconds, default: 1)
+        """
+
+        self.bandwidth = bandwidth
+        self.word_duration = word_duration
+        # Config and decoded format of each request received
+        self.requests: List[Dict[str, Any]] = []
+
+    def long_running_recognize(self, config: Dict[str, Any], audio: Dict[str, bytes]) -> FakeOperation:
+        """
+        Recognizes words in the audio content.
+        :param config: Recognition config (encoding, sample_rate_hertz)
+        :param audio: Audio, as a dictionary with its content
+        :return: FakeOperation, already completed
+        :raises ValueError if the content does not match the encoding or sampling rate of the config
+        """
+
+        content = audio["content"]
+        if self.bandwidth is not None:
+            time.sleep(len(content) / self.bandwidth)
+
+        encoding = config.get("encoding", "LINEAR16")
+        if encoding not in AUDIO_ENCODINGS:
+            raise ValueError("Unsupported audio encoding: {e}.".format(e=encoding))
+        audio_format, _ = AUDIO_ENCODINGS[encoding]
+        info = sf.info(io.BytesIO(content))
+        if info.format != audio_format:
+            raise ValueError("The audio content is {f}, not {e}.".format(f=info.format, e=encoding))
+        elif config.get("sample_rate_hertz", info.samplerate) != info.samplerate:
+            raise ValueError("The audio content is sampled at {r} Hz.".format(r=info.samplerate))
+
+        self.requests.append({"config": dict(config),
+                              "format": info.format,
+                              "samplerate": info.samplerate,
+                              "bytes": len(content),
+                              "duration": info.duration})
+        words = []
+        for i in range(int(info.duration // self.word_duration)):
+            start = i * self.word_duration
+            words.append(SimpleNamespace(word="word{i}".format(i=i),
+                                         start_time=self.__duration(start),
+                                         end_time=self.__duration(start + self.word_duration)))
+        alternative = SimpleNamespace(transcript=" ".join(w.word for w in words), words=words)
+        return FakeOperation(SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative])]))
+
+    @staticmethod
+    def __duration(seconds: float) -> SimpleNamespace:
+        """
+        Converts seconds into a protobuf Duration (seconds and nanoseconds).
+        :param seconds: Time in seconds
+        :return: Duration-like object
+        """
+
+        return SimpleNamespace(seconds=int(seconds), nanos=int(round((seconds % 1) * 1e9)))
+
+
+if __name__ == '__main__':
+    # Size and upload time of a 5 minute recording, for each encoding
+    rate = 16000
+    t = np.arange(5 * 60 * rate) / rate
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+               + 0.01 * np.random.default_rng(0).standard_normal(len(t))).astype(np.float32)
+    client = FakeSpeechClient(bandwidth=1_000_000)
+    for enc in AUDIO_ENCODINGS:
+        start_time = time.perf_counter()
+        data = encode_audio(samples, rate, enc)
+        encoded_time = time.perf_counter()
+        client.long_running_recognize(config={"encoding": enc, "sample_rate_hertz": rate}, audio={"content": data})
+        end_time = time.perf_counter()
+        print("{e}: {b} bytes, encoded in {c:.2f} s, request in {r:.2f} s".format(e=enc,
+                                                                                b=len(data),
+                                                                                c=encoded_time - start_time,
+                                                                                r=end_time - encoded_time))
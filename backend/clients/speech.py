@@ -4,57 +4,83 @@ This file contains the SpeechClient definition.
 
 import os
 from utils.config_helper import read_config
-from google.cloud import speech_v1
-from typing import Any, List, Union, Tuple
+from typing import Any, List, Union, Tuple, Optional
 
 
 class SpeechClient:
 
-    def __init__(self, language: str = "en-US"):
+    def __init__(self, language: str = "en-US", client: Optional[Any] = None):
         """
         Wrapper class for asynchronous, timestamp-enabled word recognition with Google Cloud Speech.
         :param language: Language used in the audio file (default: 'en-US')
+        :param client: Client sending requests, with the same long_running_recognize method of speech_v1.SpeechClient
+        (default: None, Google Cloud Speech; see FakeSpeechClient)
         """
 
-        # Let Google Cloud libraries pick up credentials from environment variables
-        config, _ = read_config()
-        os.environ["PROJECT_ID"] = config["project_id"]
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config["credentials"]
+        if client is None:
+            # Google Cloud libraries are only needed by the actual service, not by other clients (e.g. in tests)
+            from google.cloud import speech_v1
 
-        self.__gspeech_client = speech_v1.SpeechClient()
+            # Let Google Cloud libraries pick up credentials from environment variables
+            config, _ = read_config()
+            os.environ["PROJECT_ID"] = config["project_id"]
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config["credentials"]
+            client = speech_v1.SpeechClient()
+
+        self.__gspeech_client = client
         self.__speech_config = {"model": "default",  # 'default' model is optimized for long-form audio or dictation
                                 "enable_word_time_offsets": True,
                                 "language_code": language}
 
-    def process_audio(self, audio_path: str) -> Any:
+    def process_audio(self, audio_path: Optional[str] = None,
+                      audio_content: Optional[bytes] = None,
+                      encoding: str = "LINEAR16",
+                      sample_rate: Optional[int] = None) -> Any:
         """
         Sends a file for word recognition in an asynchronous fashion.
-        :param audio_path: Path to the audio file to process
+        :param audio_path: Path to the audio file to process (Optional if audio_content is provided)
+        :param audio_content: Content of the audio file to process, if only kept in memory (Optional)
+        :param encoding: Encoding of the audio file: 'LINEAR16' (WAV), 'FLAC' or 'OGG_OPUS' (default: 'LINEAR16', see
+        encode_audio); compressed files are smaller to upload
+        :param sample_rate: Sampling rate of the audio file (in Hertz), required for 'OGG_OPUS' (default: None, read
+        from the header of the file)
         :return: google.longrunning.Operation object to later poll for response
-        :raises FileNotFoundError, ValueError for invalid audio files
+        :raises FileNotFoundError, ValueError for invalid audio files, or 'OGG_OPUS' files without sampling rate
         """
 
-        if not os.path.exists(audio_path):
-            raise FileNotFoundError("Invalid audio file.")
-        elif not os.path.isfile(audio_path):
-            raise ValueError("The provided path is not a regular file.")
+        if encoding == "OGG_OPUS" and sample_rate is None:
+            raise ValueError("The sampling rate of Opus files must be provided.")
+
+        if audio_content is None:
+            if audio_path is None:
+                raise ValueError("Either a path or the content of the audio file must be provided.")
+            elif not os.path.exists(audio_path):
+                raise FileNotFoundError("Invalid audio file.")
+            elif not os.path.isfile(audio_path):
+                raise ValueError("The provided path is not a regular file.")
 
-        with open(audio_path, "rb") as audio_file:
-            audio_content = audio_file.read()
+            with open(audio_path, "rb") as audio_file:
+                audio_content = audio_file.read()
         audio = {"content": audio_content}
-        operation = self.__gspeech_client.long_running_recognize(config=self.__speech_config, audio=audio)
+        config = dict(self.__speech_config, encoding=encoding)
+        if sample_rate is not None:
+            config["sample_rate_hertz"] = sample_rate
+        operation = self.__gspeech_client.long_running_recognize(config=config, audio=audio)
 
         return operation
 
     @staticmethod
     def get_words(operation: Any,
-                  whole_transcript: bool = False
+                  whole_transcript: bool = False,
+                  offsets: Optional[Any] = None
                   ) -> Union[List[Tuple[str, float, float]], Tuple[str, List[Tuple[str, float, float]]]]:
         """
         Waits for the list of recognized words given the Operation object previously obtained from a process_audio
         request.
         :param operation: google.longrunning.Operation object to wait completion for
         :param whole_transcript: Additionally returns a single string containing the whole transcript (default: False)
+        :param offsets: OffsetMap of audio whose silences were removed before recognition, so that word timings refer to
+        the original recording (default: None, timings as recognized; see Audio.trim_silences)
         :return: whole_transcript = False:
                     - List containing Tuples (word: str, start_time: float, end_time: float)
                  whole_transcript = True:
@@ -69,9 +95,12 @@ class SpeechClient:
         for utterance in response.words:
             word = str(utterance.word)
             start_time = float(utterance.start_time.seconds)
-            start_time += float(utterance.start_time.nanos) / 10e9
+            start_time += float(utterance.start_time.nanos) / 1e9
             end_time = float(utterance.end_time.seconds)
-            end_time += float(utterance.end_time.nanos) / 10e9
+            end_time += float(utterance.end_time.nanos) / 1e9
+            if offsets is not None:
+                start_time = offsets.to_original(start_time)
+                end_time = offsets.to_original(end_time, end=True)
             words.append((word, start_time, end_time))
 
         if whole_transcript:
@@ -6,6 +6,7 @@ import os
 from copy import deepcopy
 from typing import Tuple, Optional, Any, Dict
 from backend.clients.gestures import Gesture
+from backend.recording.frame_ring import FrameRing
 
 
 class ModalityInput:
@@ -13,14 +14,14 @@ class ModalityInput:
     def __init__(self, path: Optional[str] = None, length: Optional[float] = None):
         """
         Abstraction for a general input token from a modality.
-        :param path: Path to the input token file
+        :param path: Path to the input token file (None for input tokens only kept in memory)
         :param length: Duration of the input token (in seconds)
         :raises FileNotFoundError, ValueError for invalid paths or length values
         """
 
-        if not os.path.exists(path):
+        if path is not None and not os.path.exists(path):
             raise FileNotFoundError("Invalid input file.")
-        elif not os.path.isfile(path):
+        elif path is not None and not os.path.isfile(path):
             raise ValueError("The provided path is not a regular file.")
         elif length is not None and length <= 0:
             raise ValueError("The file cannot have a duration less than 0.")
@@ -31,20 +32,34 @@ class ModalityInput:
 
 class AudioInput(ModalityInput):
 
-    def __init__(self, path: Optional[str] = None, length: Optional[float] = None, bit_rate: Optional[float] = None):
+    def __init__(self,
+                 path: Optional[str] = None,
+                 length: Optional[float] = None,
+                 bit_rate: Optional[float] = None,
+                 content: Optional[bytes] = None,
+                 encoding: str = "LINEAR16",
+                 offsets: Optional[Any] = None):
         """
         Audio input token.
-        :param path: Path to the input token file
+        :param path: Path to the input token file (Optional if content is provided)
         :param length: Duration of the audio input token (in seconds)
         :param bit_rate: Bit rate of the recording (ni Hertz)
-        :raises ValueError for invalid bit rate values (also see: ModalityInput)
+        :param content: Content of the audio file, if only kept in memory (Optional)
+        :param encoding: Encoding of content if provided, of the file otherwise (default: 'LINEAR16', see encode_audio)
+        :param offsets: OffsetMap of the audio, if its silences were removed (Optional, see Audio.trim_silences)
+        :raises ValueError for invalid bit rate values, or missing path and content (also see: ModalityInput)
         """
 
-        if bit_rate is not None and bit_rate <= 0:
+        if path is None and content is None:
+            raise ValueError("Either a path or the content of the audio must be provided.")
+        elif bit_rate is not None and bit_rate <= 0:
             raise ValueError("The file cannot have a bit rate less than 0.")
 
         super().__init__(path, length)
         self.bit_rate = bit_rate
+        self.content = content
+        self.encoding = encoding
+        self.offsets = offsets
 
 
 class VideoInput(ModalityInput):
@@ -53,17 +68,24 @@ class VideoInput(ModalityInput):
                  path: Optional[str] = None,
                  length: Optional[float] = None,
                  fps: Optional[float] = None,
-                 resolution: Optional[Tuple[int, int]] = None):
+                 resolution: Optional[Tuple[int, int]] = None,
+                 frames: Optional[FrameRing] = None,
+                 pipeline: Optional[Any] = None):
         """
         Video input token.
-        :param path: Path to the input token file
+        :param path: Path to the input token file (Optional if frames or pipeline are provided)
         :param length: Duration of the video input token (in seconds)
         :param fps: Frames per second of the recording
         :param resolution: Resolution of frames in the recording (as tuples in the format width x height)
-        :raises ValueError for invalid FPS and resolution values (also see: ModalityInput)
+        :param frames: Frames of the recording kept in memory, along with their capture timestamps (Optional)
+        :param pipeline: BusPipeline which processed the frames of the recording while they were recorded (Optional)
+        :raises ValueError for invalid FPS and resolution values, or missing path, frames and pipeline (also see:
+        ModalityInput)
         """
 
-        if fps is not None and fps <= 0:
+        if path is None and frames is None and pipeline is None:
+            raise ValueError("Either a path, the frames of the video or the pipeline processing them must be provided.")
+        elif fps is not None and fps <= 0:
             raise ValueError("The file cannot have less than 0 FPS.")
         elif resolution is not None and (resolution[0] == 0 or resolution[1] == 0):
             raise ValueError("The file cannot have a resolution wherein a side is equal to 0.")
@@ -71,6 +93,8 @@ class VideoInput(ModalityInput):
         super(VideoInput, self).__init__(path, length)
         self.fps = fps
         self.resolution = resolution
+        self.frames = frames
+        self.pipeline = pipeline
 
 
 class ModalityOutput:
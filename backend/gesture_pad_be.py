@@ -3,21 +3,28 @@ This file contains the code running in the back end of GesturePad.
 """
 
 import os
+import struct
 import imageio
 import math
 
 from utils.config_helper import read_config
 from backend.recording.audio import Audio
+from backend.recording.audio_stream import AudioStream
 from backend.recording.video import Video
+from backend.recording.camera_manager import CameraManager
 from backend.mediapipe.mediapipe_helper import MediaPipeHelper
+from backend.mediapipe.graph_config import GraphConfig
 from backend.mediapipe.gesture_identifier import GestureIdentifier
+from backend.mediapipe.landmark_source import LandmarkFrameSource
+from backend.mediapipe.frame_source import VideoFrameSource, RawFrameSource
+from backend.mediapipe.bus_pipeline import BusPipeline
 from backend.clients.speech import SpeechClient
 from backend.clients.gestures import Gesture, GESTURE_PAIR, GestureClient
 from backend.fusion.multimodal_types import ModalityOutput, AudioInput, WordOutput, VideoInput, GestureOutput
 from backend.fusion.multimodal_fuser import GesturePadFuser
 from backend.export.formats import HTMLFormat
 
-from typing import Tuple, List, Any, Optional
+from typing import Tuple, List, Any, Optional, Iterable
 
 
 class Backend:
@@ -30,7 +37,23 @@ class Backend:
                  gestures_dir: str,
                  gesture_prefix: str,
                  root_window: Optional[Any] = None,
-                 debug: bool = False):
+                 debug: bool = False,
+                 background_build: bool = False,
+                 persistent_mediapipe: bool = False,
+                 raw_frames: bool = False,
+                 landmark_coordinates: bool = False,
+                 mediapipe_cache_dir: Optional[str] = None,
+                 graph_config: Optional[GraphConfig] = None,
+                 keep_camera_warm: bool = False,
+                 camera_idle_timeout: Optional[float] = 60.0,
+                 in_memory_video: bool = False,
+                 archive_video: bool = False,
+                 live_pipeline: bool = False,
+                 in_memory_audio: bool = False,
+                 keep_microphone_open: bool = False,
+                 audio_pre_roll: float = 0.0,
+                 audio_encoding: str = "FLAC",
+                 trim_silences: bool = False):
         """
         Implements the back end of GesturePad, linking all modules together in the intended flow.
         :param mediapipe_dir: Path to the Google MediaPipe installation directory
@@ -41,6 +64,44 @@ class Backend:
         :param gesture_prefix: Prefix in naming gesture files
         :param root_window: Tkinter root window (if any)
         :param debug: Whether to print debug information and keep intermediate files for inspection (default: False)
+        :param background_build: Whether to build Google MediaPipe in background if it is not up to date, so that
+        construction returns immediately (default: False)
+        :param persistent_mediapipe: Whether to keep Google MediaPipe running between recordings, so that its graph is
+        loaded only once (default: False); call close() to stop it
+        :param raw_frames: Whether to stream Google MediaPipe's rendered frames straight into gesture identification,
+        instead of encoding and decoding an intermediate video, which is only written in debug mode (default: False)
+        :param landmark_coordinates: Whether to detect gestures on the landmark coordinates exported by Google
+        MediaPipe instead of its rendered frames (default: False); rendered frames are used as a fallback if
+        coordinates are not available. Experimental: the coordinate threshold is not calibrated against the
+        instability threshold of rendered frames yet, and only windows without hands are rejected (not the ones
+        above the black threshold)
+        :param mediapipe_cache_dir: Directory caching Google MediaPipe outputs, so that recordings processed again skip
+        it (default: None, no cache; see OutputCache)
+        :param graph_config: Parameters of Google MediaPipe's graph, trading accuracy for latency (default: None, the
+        patched graph; see GraphConfig)
+        :param keep_camera_warm: Whether to open the webcam right away and keep it open between recordings, so that
+        recordings start immediately (default: False); recordings then use the webcam at 6 FPS and 640x480
+        :param camera_idle_timeout: Time after which an unused webcam is released, if kept warm (in seconds, default:
+        60; None to keep it open until close())
+        :param in_memory_video: Whether to keep recorded frames in memory, along with their capture timestamps, and pipe
+        them to Google MediaPipe instead of encoding and decoding a video (default: False); memory for the longest
+        recording is allocated when recording starts (see FrameRing)
+        :param archive_video: Whether to also encode recorded frames to video_path, if kept in memory or processed while
+        recording (default: False); the video is then kept after processing
+        :param live_pipeline: Whether to run Google MediaPipe and gesture identification while recording, each stage in
+        its own process, exchanging frames through shared memory (default: False, see BusPipeline; requires Python
+        3.8+); recordings wait for Google MediaPipe to be built, and landmark coordinates and raw frame streaming do
+        not apply
+        :param in_memory_audio: Whether to send recorded audio for word recognition without writing audio_path
+        (default: False)
+        :param keep_microphone_open: Whether to open the microphone right away and keep it open between recordings, so
+        that recordings start immediately (default: False)
+        :param audio_pre_roll: Time of audio captured before each recording starts, if the microphone is kept open (in
+        seconds, default: 0)
+        :param audio_encoding: Encoding of the audio sent for word recognition: 'LINEAR16' (WAV), 'FLAC' (lossless) or
+        'OGG_OPUS' (lossy) (default: 'FLAC', see encode_audio)
+        :param trim_silences: Whether to remove long silences from the audio sent for word recognition, mapping the
+        timings of recognized words back to the recording (default: False, see Audio.trim_silences)
         """
 
         if not os.path.exists(gestures_dir):
@@ -57,17 +118,66 @@ class Backend:
         self.__mp_video_path = mp_video_path
         self.__gestures_dir = gestures_dir
         self.__gesture_prefix = gesture_prefix
-
-        self.__mediapipe = MediaPipeHelper(mediapipe_dir=self.__mediapipe_dir)
+        self.__raw_frames = raw_frames
+        self.__landmark_coordinates = landmark_coordinates
+        self.__in_memory_video = in_memory_video
+        self.__archive_video = archive_video
+        self.__live_pipeline = live_pipeline
+        self.__in_memory_audio = in_memory_audio
+        self.__audio_encoding = audio_encoding
+        self.__trim_silences = trim_silences
+        self.__audio_offsets = None
+        self.__frame_stride = graph_config.frame_stride if graph_config is not None else 1
+        self.__output_resolution = graph_config.resolution if graph_config is not None else None
+        self.__pipeline: Optional[BusPipeline] = None
+        self.__identifier_config = {"stable_frames": 5,
+                                    "instability_threshold": 2.5,
+                                    "gesture_frames_interval": 3,
+                                    "gesture_time_interval": 2,
+                                    "black_threshold": 0.995,
+                                    "ln_norm": 3,
+                                    "prev_gesture_threshold": 0.01,
+                                    "workers": 1,
+                                    "prefetch": 8}
+
+        self.__mediapipe = MediaPipeHelper(mediapipe_dir=self.__mediapipe_dir,
+                                           background_build=background_build,
+                                           persistent=persistent_mediapipe,
+                                           cache_dir=mediapipe_cache_dir,
+                                           graph_config=graph_config)
         self.__gesture_client = GestureClient()
         self.__speech_client = SpeechClient()
         self.__fuser = GesturePadFuser(sync_tolerance=0.15)
+        self.__camera_manager = None
+        if keep_camera_warm:
+            self.__camera_manager = CameraManager(idle_timeout=camera_idle_timeout)
+            self.__camera_manager.warm_up()
+        self.__audio_stream = None
+        if keep_microphone_open:
+            self.__audio_stream = AudioStream(samplerate=Audio.get_sample_rate(), pre_roll=audio_pre_roll)
+            self.__audio_stream.start()
         self.__format = HTMLFormat()
 
         # Internal state
         self.__recording = False
         self.__waiting_audio = False
 
+    def close(self) -> None:
+        """
+        Releases the resources held by the back end (e.g. the persistent Google MediaPipe process, the webcam kept warm,
+        the microphone kept open).
+        :return: None
+        """
+
+        self.__mediapipe.close()
+        if self.__camera_manager is not None:
+            self.__camera_manager.close()
+        if self.__audio_stream is not None:
+            self.__audio_stream.close()
+        if self.__pipeline is not None:
+            self.__pipeline.close()
+            self.__pipeline = None
+
     # --- Recording ---
     def start_recording(self,
                         video_fps: float = 6,
@@ -90,13 +200,30 @@ class Backend:
         except FileNotFoundError:
             pass
 
-        audio_rec = Audio(path=self.__audio_path)
+        audio_rec = Audio(path=self.__audio_path, stream=self.__audio_stream)
         audio_rec.rec(max_audio_length)
 
-        video_rec = Video(path=self.__video_path,
+        # Frames processed while recording start flowing as soon as recording starts
+        frame_bus = None
+        if self.__live_pipeline:
+            fps = self.__camera_manager.fps if self.__camera_manager is not None else video_fps
+            self.__pipeline = BusPipeline(self.__mediapipe,
+                                          resolution=video_resolution,
+                                          output_resolution=self.__output_resolution or video_resolution,
+                                          fps=fps,
+                                          frame_stride=self.__frame_stride,
+                                          identifier_config=self.__identifier_config)
+            frame_bus = self.__pipeline.input_bus
+
+        # Frames kept in memory or processed while recording are only encoded if an archive is requested
+        encode = self.__archive_video or not (self.__in_memory_video or self.__live_pipeline)
+        video_rec = Video(path=self.__video_path if encode else None,
                           fps=video_fps,
                           resolution=video_resolution,
-                          root_window=self.__root_window)
+                          root_window=self.__root_window,
+                          camera_manager=self.__camera_manager,
+                          ring_duration=max_audio_length if self.__in_memory_video else None,
+                          frame_bus=frame_bus)
         video_rec.start()
 
         self.__recording = True
@@ -118,30 +245,90 @@ class Backend:
             raise RuntimeError("There is no ongoing recording.")
 
         video_recorder.stop()
-        audio_recorder.stop()
+        audio_recorder.stop(write=False)
         self.__recording = False
 
-        # Read stats from video file
-        video_reader = imageio.get_reader(self.__video_path)
-        video_metadata = video_reader.get_meta_data()
-        v_input = VideoInput(path=self.__video_path,
-                             length=video_metadata["duration"],
-                             fps=video_metadata["fps"],
-                             resolution=video_metadata["size"])
-
-        # Read stats from audio file
-        a_input = AudioInput(path=self.__audio_path,
-                             length=audio_recorder.get_real_duration(),
-                             bit_rate=16_000)
-
-        # Align audio and video files
-        delay = max(0, math.floor(a_input.length * 1000 - v_input.length * 1000 - 1250))
+        # Read stats from the video recorder, avoiding to reopen the video file
+        v_input = VideoInput(path=video_recorder.video_filename,
+                             length=video_recorder.get_duration(),
+                             fps=video_recorder.fps,
+                             resolution=video_recorder.frameSize,
+                             frames=video_recorder.frame_ring,
+                             pipeline=self.__pipeline)
+        self.__pipeline = None
+
+        # Align audio and video, then store the audio once
+        length = audio_recorder.get_real_duration()
+        delay = max(0, math.floor(length * 1000 - v_input.length * 1000 - 1250))
         audio_recorder.trim(int(delay))
+        offsets = audio_recorder.trim_silences() if self.__trim_silences else None
+        path = None
+        if not self.__in_memory_audio:
+            audio_recorder.save()
+            path = self.__audio_path
+
+        # Compressed audio is encoded in memory for upload, while the stored file stays a WAV file
+        content = None
+        encoding = "LINEAR16"
+        if self.__in_memory_audio or self.__audio_encoding != "LINEAR16":
+            encoding = self.__audio_encoding
+            content = audio_recorder.to_bytes(encoding)
+        a_input = AudioInput(path=path,
+                             length=length,
+                             bit_rate=audio_recorder.fs,
+                             content=content,
+                             encoding=encoding,
+                             offsets=offsets)
 
         return v_input, a_input
     # --- --- ---
 
     # --- Audio/video processing ---
+    def __run_mediapipe(self, video_input: VideoInput,
+                        output_dir: Optional[str] = None,
+                        landmarks_path: Optional[str] = None
+                        ) -> None:
+        """
+        Runs Google MediaPipe on the recorded video, either on its frames kept in memory or on its file.
+        :param video_input: VideoInput object representing the recorded video
+        :param output_dir: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional)
+        :return: None
+        """
+
+        if video_input.frames is not None:
+            self.__mediapipe.run_frames(video_input.frames, fps=video_input.fps, output_dir=output_dir,
+                                        landmarks_path=landmarks_path)
+        else:
+            self.__mediapipe.run(input_dir=os.path.abspath(video_input.path), output_dir=output_dir,
+                                 landmarks_path=landmarks_path)
+
+    def __stream_mediapipe(self, video_input: VideoInput, output_dir: Optional[str] = None) -> RawFrameSource:
+        """
+        Streams the frames rendered by Google MediaPipe on the recorded video (see __run_mediapipe).
+        :param video_input: VideoInput object representing the recorded video
+        :param output_dir: Path to the output video to produce as well (Optional)
+        :return: RawFrameSource over the rendered frames
+        """
+
+        if video_input.frames is not None:
+            return self.__mediapipe.stream_frames(video_input.frames, fps=video_input.fps, output_dir=output_dir)
+        return self.__mediapipe.stream(input_dir=os.path.abspath(video_input.path), output_dir=output_dir)
+
+    def __capture_timestamps(self, video_input: VideoInput) -> List[float]:
+        """
+        Computes the timings of the frames produced by Google MediaPipe from the capture timestamps of the recorded
+        frames kept in memory.
+        :param video_input: VideoInput object representing the recorded video (frames must be provided)
+        :return: List of timings (in seconds, relative to the first frame as in video files)
+        """
+
+        timestamps = video_input.frames.timestamps()
+        if len(timestamps) == 0:
+            return []
+        # MediaPipe outputs one frame every frame_stride
+        return (timestamps - timestamps[0])[::self.__frame_stride].tolist()
+
     def preprocess_video(self, video_input: VideoInput) -> Tuple[List[str], List[float]]:
         """
         Preprocess the video by running Google MediaPipe on it, then extracting stable frames.
@@ -151,30 +338,80 @@ class Backend:
                 - 1: List of timings associated with stable frames
         """
 
-        # Google MediaPipe preprocessing
-        self.__mediapipe.run(input_dir=os.path.abspath(video_input.path),
-                             output_dir=os.path.abspath(self.__mp_video_path))
+        if video_input.pipeline is not None:
+            # Frames were processed while being recorded
+            return self.__store_gestures(video_input.pipeline.results())
 
-        if not self.__debug:
-            os.remove(self.__video_path)
+        # Google MediaPipe preprocessing, either as landmark coordinates, streamed or through an intermediate video
+        in_memory = video_input.frames is not None
+        frame_source = None
+        if self.__landmark_coordinates:
+            landmarks_path = os.path.splitext(os.path.abspath(self.__mp_video_path))[0] + "_landmarks.bin"
+            try:
+                self.__run_mediapipe(video_input,
+                                     output_dir=os.path.abspath(self.__mp_video_path) if self.__debug else None,
+                                     landmarks_path=landmarks_path)
+                frame_source = LandmarkFrameSource.read(landmarks_path)
+            except (RuntimeError, OSError, ValueError, struct.error) as e:
+                # e.g. MediaPipe built without landmark coordinates export
+                if self.__debug:
+                    print("Landmark coordinates unavailable, using rendered frames: {e}".format(e=e))
+            finally:
+                if not self.__debug and os.path.exists(landmarks_path):
+                    os.remove(landmarks_path)
+        if frame_source is None and self.__raw_frames:
+            try:
+                frame_source = self.__stream_mediapipe(video_input,
+                                                       output_dir=os.path.abspath(self.__mp_video_path)
+                                                       if self.__debug else None)
+            except RuntimeError as e:
+                # e.g. MediaPipe built without raw frame streaming
+                if self.__debug:
+                    print("Raw frame streaming unavailable, using an intermediate video: {e}".format(e=e))
+        intermediate_video = frame_source is None
+        if intermediate_video:
+            self.__run_mediapipe(video_input, output_dir=os.path.abspath(self.__mp_video_path))
+
+            if in_memory:
+                frame_source = VideoFrameSource(self.__mp_video_path)
+            elif not self.__debug:
+                os.remove(self.__video_path)
+        if in_memory:
+            # Timings of the frames actually captured, rather than evenly spaced ones
+            frame_source.timestamps = self.__capture_timestamps(video_input)
 
         # Run GestureIdentifier
         gesture_identifier = GestureIdentifier(video_path=self.__mp_video_path,
-                                               stable_frames=5,
-                                               instability_threshold=2.5,
-                                               gesture_frames_interval=3,
-                                               gesture_time_interval=2,
-                                               black_threshold=0.995,
-                                               ln_norm=3,
-                                               prev_gesture_threshold=0.01)
-
-        stable_frames = gesture_identifier.process()
+                                               frame_source=frame_source,
+                                               **self.__identifier_config)
+
+        # Stable frames are stored as soon as they are detected
+        frame_paths, frame_timings = self.__store_gestures(gesture_identifier.process_iter())
+
+        if self.__debug:
+            print("Decoding statistics: {s}".format(s=gesture_identifier.get_prefetch_stats()))
+            print("MediaPipe cache statistics: {s}".format(s=self.__mediapipe.cache_stats()))
+
         if not self.__debug:
-            os.remove(self.__mp_video_path)
+            if intermediate_video:
+                os.remove(self.__mp_video_path)
+            elif not in_memory:
+                os.remove(self.__video_path)
+
+        return frame_paths, frame_timings
+
+    def __store_gestures(self, gestures: Iterable[Tuple[Any, float]]) -> Tuple[List[str], List[float]]:
+        """
+        Stores stable frames on disk.
+        :param gestures: Stable frames along with their timings (e.g. from GestureIdentifier.process_iter)
+        :return: Tuple containing at positions:
+                - 0: List of paths to stable frames stored on disk
+                - 1: List of timings associated with stable frames
+        """
 
         frame_paths = []
         frame_timings = []
-        for i, (frame, timing) in enumerate(stable_frames):
+        for i, (frame, timing) in enumerate(gestures):
             path = os.path.join(self.__gestures_dir,
                                 "{pref}{i}.jpeg".format(pref=self.__gesture_prefix, i=i))
             imageio.imwrite(path, frame)
@@ -213,10 +450,14 @@ class Backend:
         :return: google.longrunning.Operation object to later poll for response
         """
 
-        operation = self.__speech_client.process_audio(audio_path=audio_input.path)
+        operation = self.__speech_client.process_audio(audio_path=audio_input.path,
+                                                       audio_content=audio_input.content,
+                                                       encoding=audio_input.encoding,
+                                                       sample_rate=audio_input.bit_rate)
         self.__waiting_audio = True
+        self.__audio_offsets = audio_input.offsets
 
-        if not self.__debug:
+        if not self.__debug and audio_input.path is not None:
             try:
                 os.remove(audio_input.path)
             except RuntimeError:
@@ -234,8 +475,9 @@ class Backend:
         if not self.__waiting_audio:
             raise RuntimeError("There is no ongoing cloud audio processing.")
 
-        recognized_words = self.__speech_client.get_words(operation)
+        recognized_words = self.__speech_client.get_words(operation, offsets=self.__audio_offsets)
         self.__waiting_audio = False
+        self.__audio_offsets = None
 
         return [*map(lambda x: WordOutput(word=x[0], timing=x[1], end_timing=x[2]), recognized_words)]
     # --- --- ---
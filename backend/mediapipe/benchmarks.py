@@ -0,0 +1,247 @@
+"""
+This file contains benchmarks comparing GestureIdentifier configurations on the same MediaPipe-produced video.
+"""
+
+import time
+import argparse
+import numpy as np
+import imageio
+
+from backend.mediapipe.frame_source import ArrayFrameSource, VideoFrameSource
+from backend.mediapipe.gesture_identifier import GestureIdentifier
+from typing import List, Dict, Any, Optional
+
+# Configuration used by the Backend
+BACKEND_CONFIG = {"stable_frames": 5,
+                  "instability_threshold": 2.5,
+                  "gesture_frames_interval": 3,
+                  "gesture_time_interval": 2,
+                  "black_threshold": 0.995,
+                  "ln_norm": 3,
+                  "prev_gesture_threshold": 0.01}
+
+# Structural similarity configuration (see gesture_identifier.py)
+SSIM_CONFIG = {"stable_frames": 7,
+               "use_structural_similarity": True,
+               "instability_threshold": 0.95,
+               "gesture_frames_interval": 3,
+               "prev_gesture_threshold": 0.95}
+
+
+def load_frames(video_path: str, max_frames: Optional[int] = None) -> ArrayFrameSource:
+    """
+    Decodes a video in memory, so that benchmarks do not account for decoding time.
+    :param video_path: Path to the video to decode
+    :param max_frames: Maximum number of frames to decode (default: None, the whole video)
+    :return: ArrayFrameSource containing the decoded frames
+    """
+
+    reader = imageio.get_reader(video_path)
+    fps = reader.get_meta_data()["fps"]
+    frames = []
+    for frame in reader:
+        frames.append(np.ascontiguousarray(imageio.core.asarray(frame)))
+        if max_frames is not None and len(frames) == max_frames:
+            break
+    reader.close()
+
+    return ArrayFrameSource(frames, fps=fps)
+
+
+def recall(reference: List[float], detected: List[float], tolerance: float = 1.0) -> float:
+    """
+    Computes the fraction of reference gestures detected within the given tolerance (each detection matches once).
+    :param reference: Timestamps of reference gestures (in seconds)
+    :param detected: Timestamps of detected gestures (in seconds)
+    :param tolerance: Maximum distance between matching timestamps (in seconds, default: 1.0)
+    :return: Recall (in the range [0,1], 1 if there are no reference gestures)
+    """
+
+    if len(reference) == 0:
+        return 1.0
+
+    available = sorted(detected)
+    matched = 0
+    for timing in reference:
+        closest = min(available, key=lambda x: abs(x - timing), default=None)
+        if closest is not None and abs(closest - timing) <= tolerance:
+            available.remove(closest)
+            matched += 1
+
+    return matched / len(reference)
+
+
+def run(source: ArrayFrameSource, config: Dict[str, Any]) -> (List[float], float, Dict[str, int]):
+    """
+    Runs GestureIdentifier on a frame source.
+    :param source: ArrayFrameSource to analyze
+    :param config: GestureIdentifier configuration
+    :return: Tuple containing at positions:
+                - 0: List of gesture timestamps (in seconds)
+                - 1: Throughput (in frames per second)
+                - 2: Statistics of the run (see GestureIdentifier.get_cascade_stats)
+    """
+
+    identifier = GestureIdentifier(frame_source=source, **config)
+    start = time.perf_counter()
+    timings = [timing for _, timing in identifier.process_iter()]
+    elapsed = time.perf_counter() - start
+
+    return timings, source.total_frames / elapsed, identifier.get_cascade_stats()
+
+
+def benchmark_stride(source: ArrayFrameSource,
+                     config: Dict[str, Any],
+                     max_strides: List[int],
+                     motion_threshold: float = 1.0,
+                     tolerance: float = 1.0
+                     ) -> List[Dict[str, Any]]:
+    """
+    Compares recall and throughput of the motion-adaptive stride w.r.t. the fixed stride (i.e. every frame analyzed).
+    :param source: ArrayFrameSource to analyze
+    :param config: GestureIdentifier configuration shared by every run
+    :param max_strides: Maximum strides to evaluate
+    :param motion_threshold: Motion threshold of the adaptive stride (default: 1.0)
+    :param tolerance: Maximum distance between matching gestures (in seconds, default: 1.0)
+    :return: List of Dict (one for each run, the first one being the fixed stride) containing:
+                - 'stride': maximum stride
+                - 'gestures': number of gestures detected
+                - 'recall': recall w.r.t. the fixed stride
+                - 'fps': throughput (in frames per second)
+                - 'skipped_frames': number of frames skipped
+    """
+
+    results = []
+    reference = None
+    for max_stride in [1, *max_strides]:
+        run_config = dict(config, adaptive_stride=max_stride, motion_threshold=motion_threshold)
+        timings, fps, stats = run(source, run_config)
+        if reference is None:
+            reference = timings
+        results.append({"stride": max_stride,
+                        "gestures": len(timings),
+                        "recall": recall(reference, timings, tolerance=tolerance),
+                        "fps": fps,
+                        "skipped_frames": stats.get("skipped_frames", 0)})
+
+    return results
+
+
+def benchmark_ssim(source: ArrayFrameSource,
+                   config: Dict[str, Any],
+                   downscales: List[int],
+                   tolerance: float = 1.0
+                   ) -> List[Dict[str, Any]]:
+    """
+    Compares recall and throughput of the fast structural similarity w.r.t. skimage's one.
+    :param source: ArrayFrameSource to analyze
+    :param config: GestureIdentifier configuration shared by every run (using structural similarity)
+    :param downscales: Downscaling factors of the fast structural similarity to evaluate
+    :param tolerance: Maximum distance between matching gestures (in seconds, default: 1.0)
+    :return: List of Dict (one for each run, the first one being skimage's structural similarity) containing:
+                - 'method': structural similarity implementation
+                - 'gestures': number of gestures detected
+                - 'recall': recall w.r.t. skimage's structural similarity
+                - 'fps': throughput (in frames per second)
+                - 'ssim_hits': number of pairwise structural similarities reused from overlapping windows
+                - 'ssim_misses': number of pairwise structural similarities computed
+    """
+
+    runs = [("skimage", {"fast_ssim": False})]
+    for downscale in downscales:
+        runs.append(("fast x{d}".format(d=downscale), {"fast_ssim": True, "ssim_downscale": downscale}))
+
+    results = []
+    reference = None
+    for method, method_config in runs:
+        timings, fps, stats = run(source, dict(config, **method_config))
+        if reference is None:
+            reference = timings
+        results.append({"method": method,
+                        "gestures": len(timings),
+                        "recall": recall(reference, timings, tolerance=tolerance),
+                        "fps": fps,
+                        "ssim_hits": stats.get("ssim_hits", 0),
+                        "ssim_misses": stats.get("ssim_misses", 0)})
+
+    return results
+
+
+def benchmark_workers(video_path: str,
+                      config: Dict[str, Any],
+                      workers: List[int],
+                      min_chunk_frames: int = 300,
+                      repeats: int = 3
+                      ) -> List[Dict[str, Any]]:
+    """
+    Compares the wall-clock time of the chunked multi-process mode w.r.t. a serial run, decoding included (chunks are
+    decoded by their own process).
+    :param video_path: Path to a MediaPipe-produced video
+    :param config: GestureIdentifier configuration shared by every run
+    :param workers: Numbers of workers to evaluate
+    :param min_chunk_frames: Minimum number of frames of each chunk (default: 300)
+    :param repeats: Number of runs of each configuration, the fastest one being kept (default: 3)
+    :return: List of Dict (one for each number of workers, the first one being the serial run) containing:
+                - 'workers': number of workers
+                - 'gestures': number of gestures detected
+                - 'same_output': whether the gestures detected are the same of the serial run
+                - 'seconds': wall-clock time (in seconds)
+                - 'speedup': serial time divided by the time of the run
+    """
+
+    results = []
+    reference = None
+    for worker_count in [1, *workers]:
+        run_config = dict(config, workers=worker_count, min_chunk_frames=min_chunk_frames)
+        elapsed = None
+        for _ in range(repeats):
+            identifier = GestureIdentifier(frame_source=VideoFrameSource(video_path), **run_config)
+            start = time.perf_counter()
+            timings = [timing for _, timing in identifier.process_iter()]
+            run_time = time.perf_counter() - start
+            elapsed = run_time if elapsed is None else min(elapsed, run_time)
+        if reference is None:
+            reference = (timings, elapsed)
+        results.append({"workers": worker_count,
+                        "gestures": len(timings),
+                        "same_output": timings == reference[0],
+                        "seconds": elapsed,
+                        "speedup": reference[1] / elapsed})
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("GestureIdentifier benchmarks.")
+    parser.add_argument("--video", type=str, default="../../tmp/tmp_video_out.mp4",
+                        help="Path to a MediaPipe-produced video")
+    parser.add_argument("--frames", type=int, default=None,
+                        help="Maximum number of frames to use")
+    parser.add_argument("--benchmark", type=str, default="stride", choices=["stride", "ssim", "workers"],
+                        help="Benchmark to run")
+    parser.add_argument("--max_strides", type=int, nargs="+", default=[2, 4, 8],
+                        help="Maximum strides to compare with the fixed stride")
+    parser.add_argument("--motion_threshold", type=float, default=1.0,
+                        help="Motion threshold of the adaptive stride")
+    parser.add_argument("--downscales", type=int, nargs="+", default=[1, 2],
+                        help="Downscaling factors of the fast structural similarity")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4],
+                        help="Numbers of workers to compare with the serial run (whole video, ignoring --frames)")
+    parser.add_argument("--min_chunk_frames", type=int, default=300,
+                        help="Minimum number of frames of each chunk")
+    args = parser.parse_args()
+
+    if args.benchmark == "stride":
+        for result in benchmark_stride(load_frames(args.video, max_frames=args.frames), BACKEND_CONFIG,
+                                       args.max_strides, motion_threshold=args.motion_threshold):
+            print("stride {stride:>2}: {gestures} gestures, recall {recall:.2f}, {fps:.1f} frames/s, "
+                  "{skipped_frames} frames skipped".format(**result))
+    elif args.benchmark == "ssim":
+        for result in benchmark_ssim(load_frames(args.video, max_frames=args.frames), SSIM_CONFIG, args.downscales):
+            print("{method:>10}: {gestures} gestures, recall {recall:.2f}, {fps:.1f} frames/s, "
+                  "{ssim_hits} pairs reused, {ssim_misses} computed".format(**result))
+    elif args.benchmark == "workers":
+        for result in benchmark_workers(args.video, BACKEND_CONFIG, args.workers,
+                                        min_chunk_frames=args.min_chunk_frames):
+            print("{workers:>2} workers: {gestures} gestures (same output: {same_output}), {seconds:.2f} s, "
+                  "speedup {speedup:.2f}".format(**result))
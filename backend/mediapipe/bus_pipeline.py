@@ -0,0 +1,265 @@
+"""
+This file contains the pipeline running Google MediaPipe and gesture identification while frames are being recorded,
+each stage exchanging frames with the next one through a frame bus in shared memory.
+"""
+
+import queue
+import collections
+import threading
+import multiprocessing
+import numpy as np
+
+from backend.recording.frame_bus import FrameBus
+from backend.mediapipe.frame_source import RAW_HEADER, BusFrameSource
+from backend.mediapipe.mediapipe_runner import MediaPipeRun
+from backend.mediapipe.gesture_identifier import GestureIdentifier
+from typing import Any, Dict, List, Optional, Tuple
+
+# Time between two checks for cancellation while waiting for a free slot (in seconds)
+POLL_INTERVAL = 0.1
+
+
+class MediaPipeBusAdapter:
+
+    def __init__(self, run: MediaPipeRun, input_bus: FrameBus, output_bus: FrameBus, fps: float, frame_stride: int = 1):
+        """
+        Feeds MediaPipe with the frames of a bus and publishes its rendered frames on another bus, as they are produced.
+        Frames are written from and read into the slots of the buses (i.e. they are never copied in Python), and
+        rendered frames carry the timestamps of the frames they were rendered from.
+        :param run: MediaPipeRun handle of a process started with raw_input_path='-', raw_output_path='-' and pipes as
+        stdin and stdout (see MediaPipeHelper.stream_bus)
+        :param input_bus: FrameBus of the recorded frames (this adapter is its consumer)
+        :param output_bus: FrameBus of the rendered frames (this adapter is its producer), whose resolution must be the
+        one of the rendered frames
+        :param fps: Frames per second of the recorded frames
+        :param frame_stride: Number of recorded frames MediaPipe advances by (default: 1, see GraphConfig)
+        """
+
+        self.__run = run
+        self.__input_bus = input_bus
+        self.__output_bus = output_bus
+        self.__fps = fps
+        self.__frame_stride = frame_stride
+        # Timestamps of the recorded frames MediaPipe renders, in order
+        self.__timestamps = collections.deque()
+        self.__cancelled = threading.Event()
+        self.__errors: List[Exception] = []
+        self.__feeder = threading.Thread(target=self.__feed, daemon=True)
+        self.__drainer = threading.Thread(target=self.__drain, daemon=True)
+        self.__feeder.start()
+        self.__drainer.start()
+
+    def __feed(self) -> None:
+        """
+        Writes the recorded frames to MediaPipe until the input bus is closed (runs in the feeder thread). Frames keep
+        being read if MediaPipe exits early, so that the recording never waits for it.
+        :return: None
+        """
+
+        width, height = self.__input_bus.resolution
+        stdin = self.__run.stdin
+        try:
+            # The number of frames is unknown while recording
+            stdin.write(RAW_HEADER.format(width=width, height=height, fps=self.__fps, frames=0).encode())
+        except OSError:
+            stdin = None
+
+        index = 0
+        while True:
+            item = self.__input_bus.get()
+            if item is None:
+                break
+            _, timestamp, frame = item
+            if index % self.__frame_stride == 0:
+                self.__timestamps.append(timestamp)
+            if stdin is not None:
+                try:
+                    stdin.write(memoryview(frame).cast("B"))
+                except OSError:
+                    # MediaPipe exited, which its exit code reports
+                    stdin = None
+            self.__input_bus.release()
+            index += 1
+
+        try:
+            self.__run.stdin.close()
+        except OSError:
+            pass
+
+    def __drain(self) -> None:
+        """
+        Reads the rendered frames into the slots of the output bus until MediaPipe closes its output, then closes the
+        bus (runs in the drainer thread).
+        :return: None
+        """
+
+        stdout = self.__run.stdout
+        try:
+            header = stdout.readline().decode(errors="replace").split()
+            if len(header) == 0:
+                # MediaPipe exited without rendering any frame
+                return
+            elif len(header) != 5 or header[0] != RAW_HEADER.split()[0]:
+                raise RuntimeError("Invalid raw frame stream header.")
+            elif (int(header[1]), int(header[2])) != self.__output_bus.resolution:
+                raise RuntimeError("Rendered frames do not match the resolution of the output bus.")
+
+            while True:
+                slot = None
+                while slot is None and not self.__cancelled.is_set():
+                    slot = self.__output_bus.reserve(timeout=POLL_INTERVAL)
+                if slot is None:
+                    return
+                buffer = memoryview(slot).cast("B")
+                read = 0
+                while read < len(buffer):
+                    chunk = stdout.readinto(buffer[read:])
+                    if not chunk:
+                        # A truncated last frame is discarded
+                        self.__output_bus.discard()
+                        return
+                    read += chunk
+                timestamp = self.__timestamps.popleft() if len(self.__timestamps) > 0 else 0.0
+                self.__output_bus.commit(timestamp)
+        except Exception as e:
+            self.__errors.append(e)
+            # MediaPipe would otherwise wait for its output to be read
+            self.__run.cancel()
+        finally:
+            self.__output_bus.close_writer()
+
+    def cancel(self) -> None:
+        """
+        Stops MediaPipe, e.g. when the frames it renders are no longer needed.
+        :return: None
+        """
+
+        self.__cancelled.set()
+        self.__run.cancel()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for MediaPipe to render every frame (the input bus must have been closed by its producer).
+        :param timeout: Maximum time to wait for MediaPipe to exit (in seconds, default: None, no limit)
+        :return: None
+        :raises TimeoutError, RuntimeError if the timeout expires, or MediaPipe or the adapter failed
+        """
+
+        self.__feeder.join()
+        try:
+            self.__run.wait(timeout)
+        finally:
+            self.__drainer.join()
+        if len(self.__errors) > 0:
+            raise RuntimeError("MediaPipe frames cannot be read: {e}".format(e=self.__errors[0]))
+
+
+def _identify_gestures(bus: FrameBus, fps: float, config: Dict[str, Any], results: Any) -> None:
+    """
+    Identifies gestures in the frames of a bus (runs in the gesture identification process).
+    :param bus: FrameBus of the rendered frames (this process is its consumer)
+    :param fps: Frames per second of the rendered frames
+    :param config: Parameters of GestureIdentifier, frame_source excluded
+    :param results: multiprocessing.Queue receiving the list of (gesture frame, timestamp) tuples, or the exception
+    raised
+    :return: None
+    """
+
+    try:
+        source = BusFrameSource(bus, fps=fps)
+        identifier = GestureIdentifier(frame_source=source, **config)
+        results.put([(np.asarray(frame), timing) for frame, timing in identifier.process_iter()])
+    except Exception as e:
+        results.put(e)
+    finally:
+        # Unblocks the producer in case identification stopped early
+        while bus.get() is not None:
+            bus.release()
+        try:
+            bus.close()
+        except BufferError:
+            # Views still referenced (e.g. by a traceback) are released along with the process
+            pass
+
+
+class BusPipeline:
+
+    def __init__(self, helper: Any,
+                 resolution: Tuple[int, int],
+                 output_resolution: Tuple[int, int],
+                 fps: float,
+                 frame_stride: int = 1,
+                 identifier_config: Optional[Dict[str, Any]] = None,
+                 slots: int = 32):
+        """
+        Runs Google MediaPipe and gesture identification on frames as they are recorded: recorded frames are published
+        on input_bus (e.g. by Video), MediaPipe renders them onto a second bus, which gesture identification reads in a
+        separate process. Each stage runs at the pace of the slowest one, waiting for free slots.
+        :param helper: MediaPipeHelper running MediaPipe
+        :param resolution: Resolution of the recorded frames (format: width x height)
+        :param output_resolution: Resolution of the frames rendered by MediaPipe (see GraphConfig.resolution)
+        :param fps: Frames per second of the recorded frames
+        :param frame_stride: Number of recorded frames MediaPipe advances by (default: 1, see GraphConfig)
+        :param identifier_config: Parameters of GestureIdentifier, frame_source excluded (default: None, the default
+        ones); prefetch and workers are ignored, frames being read as they are rendered
+        :param slots: Number of frame slots of each bus (default: 32)
+        :raises RuntimeError if MediaPipe cannot be started
+        """
+
+        config = dict(identifier_config or {})
+        config.update(prefetch=0, workers=1)
+        self.input_bus = FrameBus(slots, resolution)
+        self.output_bus = FrameBus(slots, output_resolution)
+        self.__adapter = helper.stream_bus(self.input_bus, self.output_bus, fps=fps)
+        # Processes are spawned, since forking a process running a GUI is unsafe
+        context = multiprocessing.get_context("spawn")
+        self.__results = context.Queue()
+        self.__identifier = context.Process(target=_identify_gestures,
+                                            args=(self.output_bus, fps / frame_stride, config, self.__results),
+                                            daemon=True)
+        self.__identifier.start()
+        self.__closed = False
+
+    def results(self, timeout: Optional[float] = None) -> List[Tuple[np.ndarray, float]]:
+        """
+        Waits for every recorded frame to be processed (the producer of input_bus must have closed it), then releases
+        the pipeline.
+        :param timeout: Maximum time to wait for MediaPipe, then for gesture identification (in seconds, default: None,
+        no limit)
+        :return: List of tuples (gesture frame, timestamp in seconds), as GestureIdentifier.process_iter
+        :raises TimeoutError, RuntimeError if the timeout expires or any stage failed
+        """
+
+        try:
+            try:
+                self.__adapter.join(timeout)
+            except Exception:
+                self.__identifier.terminate()
+                raise
+            try:
+                result = self.__results.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("Gestures were not identified within {t} seconds.".format(t=timeout))
+            self.__identifier.join()
+            if isinstance(result, Exception):
+                raise RuntimeError("Gesture identification failed: {e}".format(e=result))
+            return result
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Stops every stage and destroys the buses.
+        :return: None
+        """
+
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__adapter.cancel()
+        if self.__identifier.is_alive():
+            self.__identifier.terminate()
+        self.__identifier.join()
+        for bus in (self.input_bus, self.output_bus):
+            bus.close()
+            bus.unlink()
@@ -0,0 +1,200 @@
+"""
+This file contains a stand-in for the MediaPipe binary, copying videos (or streaming their raw frames) instead of
+tracking hands, hence never detecting any landmark.
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import numpy as np
+import imageio
+
+from backend.mediapipe.frame_source import RAW_HEADER
+from backend.mediapipe.landmark_source import LandmarkFrameSource, LANDMARKS_PER_HAND
+from backend.mediapipe.mediapipe_worker import READY, PING, PONG, QUIT, DONE, ERROR
+from typing import Iterator, Optional, Tuple
+
+
+def open_input(input_path: Optional[str], raw_input_path: Optional[str] = None
+               ) -> (float, Tuple[int, int], int, Iterator[np.ndarray]):
+    """
+    Opens the input of MediaPipe, either a video or a raw frame stream.
+    :param input_path: Path to the input video (ignored if raw_input_path is provided)
+    :param raw_input_path: Path to the raw input frames, '-' for stdin (Optional, see FrameRing.write_raw)
+    :return: Tuple (fps, size as width x height, number of frames, iterator over RGB frames)
+    """
+
+    if raw_input_path:
+        stream = sys.stdin.buffer if raw_input_path == "-" else open(raw_input_path, "rb")
+        # The header may report 0 frames when their number is unknown (e.g. frames streamed while recording)
+        _, width, height, fps, total_frames = stream.readline().decode().split()
+        width, height = int(width), int(height)
+
+        def raw_frames() -> Iterator[np.ndarray]:
+            with stream:
+                while True:
+                    frame = stream.read(width * height * 3)
+                    if len(frame) < width * height * 3:
+                        return
+                    yield np.frombuffer(frame, dtype=np.uint8).reshape((height, width, 3))[..., ::-1]
+
+        return float(fps), (width, height), int(total_frames), raw_frames()
+
+    with imageio.get_reader(input_path) as reader:
+        metadata = reader.get_meta_data()
+
+    def frames() -> Iterator[np.ndarray]:
+        # The video is decoded only if frames are needed
+        with imageio.get_reader(input_path) as frames_reader:
+            yield from frames_reader
+
+    return metadata["fps"], tuple(metadata["size"]), int(round(metadata["fps"] * metadata["duration"])), frames()
+
+
+def process(input_path: Optional[str],
+            output_path: Optional[str] = None,
+            raw_output_path: Optional[str] = None,
+            landmarks_output_path: Optional[str] = None,
+            frame_stride: int = 1,
+            raw_input_path: Optional[str] = None,
+            fail_after: int = -1
+            ) -> int:
+    """
+    Processes a video as MediaPipe does, without rendering any landmark.
+    :param input_path: Path to the input video (ignored if raw_input_path is provided)
+    :param output_path: Path to the output video to produce (Optional)
+    :param raw_output_path: Path where to stream raw BGR frames, '-' for stdout (Optional, see RawFrameSource)
+    :param landmarks_output_path: Path to the landmark coordinates file to produce, containing no hands (Optional)
+    :param frame_stride: Number of frames to advance by, streaming one frame every frame_stride (default: 1); output
+    videos of input videos are copied as is
+    :param raw_input_path: Path to the raw input frames, '-' for stdin (Optional, see FrameRing.write_raw)
+    :param fail_after: Number of frames after which the graph fails, leaving the output video truncated (default: -1,
+    never)
+    :return: Number of frames processed
+    :raises RuntimeError if the graph fails
+    """
+
+    input_fps, size, input_frames, frames_iter = open_input(input_path, raw_input_path)
+    fps = input_fps / frame_stride
+    frames = -(-input_frames // frame_stride)
+    # Input videos are copied as is, unless the graph fails partway through them
+    writer = imageio.get_writer(output_path, fps=fps) if output_path and (raw_input_path or fail_after >= 0) else None
+    raw = None
+    if raw_output_path:
+        raw = sys.stdout.buffer if raw_output_path == "-" else open(raw_output_path, "wb")
+        raw.write(RAW_HEADER.format(width=size[0], height=size[1], fps=fps, frames=frames).encode())
+
+    try:
+        if raw is not None or writer is not None or raw_input_path or fail_after >= 0:
+            frames = 0
+            for index, frame in enumerate(frames_iter):
+                if index % frame_stride != 0:
+                    continue
+                if frames == fail_after:
+                    raise RuntimeError("The graph failed after {n} frames.".format(n=frames))
+                if raw is not None:
+                    raw.write(np.ascontiguousarray(frame[..., ::-1]).tobytes())
+                if writer is not None:
+                    writer.append_data(frame)
+                frames += 1
+    finally:
+        if raw is sys.stdout.buffer:
+            raw.flush()
+        elif raw is not None:
+            raw.close()
+        if writer is not None:
+            writer.close()
+        frames_iter.close()
+
+    if output_path and writer is None:
+        shutil.copyfile(input_path, output_path)
+    if landmarks_output_path:
+        no_hands = [np.empty((0, LANDMARKS_PER_HAND, 3), dtype=np.float32)] * frames
+        LandmarkFrameSource(no_hands, fps=fps, size=size).write(landmarks_output_path)
+    return frames
+
+
+def serve(startup_delay: float = 0.0, crash_after: int = -1, frame_stride: int = 1, run_delay: float = 0.0) -> None:
+    """
+    Answers the requests read from stdin as MediaPipe's --serve mode does.
+    :param startup_delay: Time spent "loading the graph" before becoming ready (in seconds, default: 0)
+    :param crash_after: Number of videos after which the worker exits while processing the next one (default: -1,
+    never)
+    :param frame_stride: Number of frames to advance by (default: 1, see process)
+    :param run_delay: Time spent "tracking hands" before processing each video (in seconds, default: 0)
+    :return: None
+    """
+
+    time.sleep(startup_delay)
+    print(READY, flush=True)
+
+    videos = 0
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if line == PING:
+            print(PONG, flush=True)
+        elif line == QUIT:
+            return
+        elif line.startswith("RUN ") and "\t" in line:
+            if videos == crash_after:
+                sys.exit(1)
+            time.sleep(run_delay)
+            paths = line[len("RUN "):].split("\t")
+            input_path, output_path = paths[0], paths[1]
+            raw_output_path = paths[2] if len(paths) > 2 else None
+            landmarks_output_path = paths[3] if len(paths) > 3 else None
+            try:
+                if raw_output_path == "-":
+                    raise ValueError("cannot write -")
+                frames = process(input_path, output_path, raw_output_path, landmarks_output_path, frame_stride)
+                print("{d} {n}".format(d=DONE, n=frames), flush=True)
+            except Exception as e:
+                print("{e} {m}".format(e=ERROR, m=str(e).replace("\n", " ")), flush=True)
+            videos += 1
+        else:
+            print("{e} unknown command".format(e=ERROR), flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("Fake MediaPipe worker.")
+    parser.add_argument("--calculator_graph_config_file", type=str, default="",
+                        help="Ignored, accepted for compatibility with MediaPipe")
+    parser.add_argument("--input_video_path", type=str, default="",
+                        help="Path to the input video (single video mode)")
+    parser.add_argument("--raw_input_path", type=str, default="",
+                        help="Path to the raw input frames, '-' for stdin (single video mode)")
+    parser.add_argument("--output_video_path", type=str, default="",
+                        help="Path to the output video (single video mode)")
+    parser.add_argument("--raw_output_path", type=str, default="",
+                        help="Path where to stream raw frames, '-' for stdout (single video mode)")
+    parser.add_argument("--landmarks_output_path", type=str, default="",
+                        help="Path to the landmark coordinates file (single video mode)")
+    parser.add_argument("--frame_stride", type=int, default=1,
+                        help="Number of frames to advance by")
+    parser.add_argument("--serve", action="store_true",
+                        help="Process the videos requested on stdin")
+    parser.add_argument("--startup_delay", type=float, default=0.0,
+                        help="Time spent before becoming ready (in seconds)")
+    parser.add_argument("--crash_after", type=int, default=-1,
+                        help="Number of videos after which the worker crashes (-1: never)")
+    parser.add_argument("--run_delay", type=float, default=0.0,
+                        help="Time spent before processing each video (in seconds)")
+    parser.add_argument("--fail_after", type=int, default=-1,
+                        help="Number of frames after which the graph fails (single video mode, -1: never)")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(startup_delay=args.startup_delay,
+              crash_after=args.crash_after,
+              frame_stride=args.frame_stride,
+              run_delay=args.run_delay)
+    else:
+        time.sleep(args.run_delay)
+        try:
+            process(args.input_video_path, args.output_video_path, args.raw_output_path, args.landmarks_output_path,
+                    args.frame_stride, args.raw_input_path, args.fail_after)
+        except Exception as e:
+            # As MediaPipe does, failing runs exit with a non-zero code
+            print("Failed to run the graph: {e}".format(e=e), file=sys.stderr)
+            sys.exit(1)
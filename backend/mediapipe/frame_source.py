@@ -0,0 +1,362 @@
+"""
+This file contains the frame sources used to feed GestureIdentifier with decoded frames.
+"""
+
+import os
+import math
+import time
+import queue
+import threading
+import numpy as np
+import imageio
+import cv2 as cv
+
+from typing import Iterator, Tuple, Optional, List, Dict, BinaryIO, Callable, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Only needed for annotations, since the frame bus requires Python 3.8+ (see FrameBus)
+    from backend.recording.frame_bus import FrameBus
+
+# Header preceding raw frames streamed by MediaPipe (see demo_run_graph_main.cc, --raw_output_path flag)
+RAW_HEADER = "RAW {width} {height} {fps} {frames}\n"
+
+
+class FrameSource:
+
+    def __init__(self, fps: float, duration: float, total_frames: int, size: Tuple[int, int]):
+        """
+        Abstraction for a source of frames, decoded exactly once while being iterated.
+        :param fps: Frames per second of the source
+        :param duration: Duration of the source (in seconds)
+        :param total_frames: Number of frames in the source
+        :param size: Resolution of frames in the source (format: width x height)
+        :raises ValueError for invalid FPS, duration or frame count values
+        """
+
+        if fps <= 0:
+            raise ValueError("The source cannot have less than 0 FPS.")
+        elif duration <= 0:
+            raise ValueError("The source cannot have a duration less than 0.")
+        elif total_frames <= 0:
+            raise ValueError("The source must contain at least one frame.")
+
+        self.fps = fps
+        self.duration = duration
+        self.total_frames = total_frames
+        self.size = size
+        # Timestamps of the frames, when they were captured rather than evenly spaced (see timestamp)
+        self.timestamps: Optional[Sequence[float]] = None
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Decodes the frames of the source, one at a time.
+        :return: Iterator over Tuples (frame index, frame as np.ndarray)
+        """
+
+        raise NotImplementedError
+
+    def timestamp(self, index: int) -> float:
+        """
+        Given the frame number, computes the timestamp of occurrence in seconds, either from the timestamps of the
+        frames (if set) or from the duration of the source.
+        :param index: Number of frame
+        :return: Timestamp of occurrence in seconds
+        """
+
+        if self.timestamps is not None and 0 <= index < len(self.timestamps):
+            return float(self.timestamps[index])
+        return float(index) / self.total_frames * self.duration
+
+    def close(self) -> None:
+        """
+        Releases any resource held by the source.
+        :return: None
+        """
+
+        pass
+
+
+class VideoFrameSource(FrameSource):
+
+    def __init__(self, video_path: str, start: int = 0, stop: Optional[int] = None):
+        """
+        Frame source reading a video file, whose frame count and timings only come from the container metadata.
+        :param video_path: Path to the video to read
+        :param start: Index of the first frame to read (default: 0)
+        :param stop: Index of the frame where to stop reading, exclusive (default: None, read until the end)
+        :raises FileNotFoundError, ValueError for invalid video file path or frame range
+        """
+
+        if not os.path.exists(video_path):
+            raise FileNotFoundError("No video file found.")
+        elif not os.path.isfile(video_path):
+            raise ValueError("The provided path is not a regular file.")
+        elif start < 0 or (stop is not None and stop <= start):
+            raise ValueError("Invalid frame range.")
+
+        self.video_path = video_path
+        self.__start = start
+        self.__stop = stop
+        self.__reader = imageio.get_reader(video_path)
+        metadata = self.__reader.get_meta_data()
+
+        # FFMPEG reports an infinite number of frames whenever the container lacks an explicit frame count
+        total_frames = metadata.get("nframes", math.inf)
+        if not math.isfinite(total_frames):
+            total_frames = int(round(metadata["fps"] * metadata["duration"]))
+
+        super(VideoFrameSource, self).__init__(fps=metadata["fps"],
+                                               duration=metadata["duration"],
+                                               total_frames=int(total_frames),
+                                               size=tuple(metadata["size"]))
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        if self.__reader is None:
+            self.__reader = imageio.get_reader(self.video_path)
+
+        try:
+            if self.__start == 0 and self.__stop is None:
+                for index, frame in enumerate(self.__reader):
+                    yield index, imageio.core.asarray(frame)
+                return
+
+            # Seeking is frame-accurate (fast seek on keyframes, followed by a slow seek of the last seconds)
+            index = self.__start
+            try:
+                frame = self.__reader.get_data(index)
+                while self.__stop is None or index < self.__stop:
+                    yield index, imageio.core.asarray(frame)
+                    index += 1
+                    frame = self.__reader.get_next_data()
+            except IndexError:
+                return
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+
+
+class ArrayFrameSource(FrameSource):
+
+    def __init__(self, frames: List[np.ndarray], fps: float):
+        """
+        Frame source over frames already decoded in memory (e.g. for benchmarks).
+        :param frames: List of frames (as np.ndarray, height x width x channels)
+        :param fps: Frames per second of the frames
+        :raises ValueError for empty lists of frames (also see: FrameSource)
+        """
+
+        if len(frames) == 0:
+            raise ValueError("The source must contain at least one frame.")
+
+        self.__frames = frames
+        super(ArrayFrameSource, self).__init__(fps=fps,
+                                               duration=len(frames) / fps,
+                                               total_frames=len(frames),
+                                               size=(frames[0].shape[1], frames[0].shape[0]))
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        return iter(enumerate(self.__frames))
+
+
+class PrefetchFrameSource(FrameSource):
+
+    # Marks the end of the decoded frames in the queue
+    __END = object()
+
+    def __init__(self, source: FrameSource, depth: int = 8):
+        """
+        Frame source decoding the frames of another source in a background thread, so that decoding overlaps with the
+        processing of the frames already decoded.
+        :param source: FrameSource to decode
+        :param depth: Maximum number of frames decoded ahead of the consumer (default: 8)
+        :raises ValueError for depths lower than 1
+        """
+
+        if depth < 1:
+            raise ValueError("The prefetch depth must be at least 1.")
+
+        self.source = source
+        self.__depth = depth
+        self.stats: Dict[str, float] = {}
+        super(PrefetchFrameSource, self).__init__(fps=source.fps,
+                                                  duration=source.duration,
+                                                  total_frames=source.total_frames,
+                                                  size=source.size)
+
+    def __decode(self, frames: queue.Queue, stop: threading.Event) -> None:
+        """
+        Decodes frames into the queue until the source ends or the consumer stops (runs in the decoder thread).
+        :param frames: Queue of decoded frames, terminated by the end marker (or by the exception raised by the source)
+        :param stop: Event set by the consumer when it no longer needs frames
+        :return: None
+        """
+
+        def put(item) -> bool:
+            start = time.perf_counter()
+            try:
+                while not stop.is_set():
+                    try:
+                        frames.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        pass
+                return False
+            finally:
+                self.stats["decoder_wait"] += time.perf_counter() - start
+
+        try:
+            for item in self.source:
+                if not put(item):
+                    return
+            put(self.__END)
+        except Exception as e:
+            put(e)
+        finally:
+            self.source.close()
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        self.stats = {"frames": 0, "decoder_wait": 0.0, "consumer_wait": 0.0}
+        frames = queue.Queue(maxsize=self.__depth)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self.__decode, args=(frames, stop), daemon=True)
+        decoder.start()
+
+        try:
+            while True:
+                start = time.perf_counter()
+                item = frames.get()
+                self.stats["consumer_wait"] += time.perf_counter() - start
+                if item is self.__END:
+                    return
+                elif isinstance(item, Exception):
+                    raise item
+                self.stats["frames"] += 1
+                yield item
+        finally:
+            # Unblock the decoder in case the consumer stopped early
+            stop.set()
+            decoder.join()
+
+    def timestamp(self, index: int) -> float:
+        if self.timestamps is not None:
+            return super(PrefetchFrameSource, self).timestamp(index)
+        return self.source.timestamp(index)
+
+    def close(self) -> None:
+        self.source.close()
+
+
+class RawFrameSource(FrameSource):
+
+    def __init__(self, stream: BinaryIO, on_close: Optional[Callable[[], None]] = None):
+        """
+        Frame source reading raw BGR frames from a stream (e.g. MediaPipe's stdout or a FIFO), after a header line
+        (see RAW_HEADER). Frames are yielded in RGB order, as imageio decodes them from video files. Headers reporting
+        no frames (e.g. videos whose frame count is unknown) are accepted: the frame count and duration then grow as
+        frames are read.
+        :param stream: Binary stream to read (blocks until its header is available)
+        :param on_close: Function called once the stream is closed, e.g. to wait for its producer (Optional); it may
+        raise the error which made the producer fail
+        :raises RuntimeError for streams not starting with a valid header, once the stream is closed
+        """
+
+        self.__stream = stream
+        self.__on_close = on_close
+
+        header = stream.readline().decode(errors="replace").split()
+        try:
+            if len(header) != 5 or header[0] != RAW_HEADER.split()[0]:
+                raise ValueError("unexpected fields")
+            self.__width, self.__height = int(header[1]), int(header[2])
+            fps, total_frames = float(header[3]), int(header[4])
+            if self.__width <= 0 or self.__height <= 0 or fps <= 0:
+                raise ValueError("invalid resolution or FPS")
+        except ValueError as e:
+            self.close()
+            raise RuntimeError("Invalid raw frame stream header: {e}.".format(e=e))
+
+        self.__known_frames = total_frames > 0
+        if not self.__known_frames:
+            total_frames = 1
+        super(RawFrameSource, self).__init__(fps=fps,
+                                             duration=total_frames / fps,
+                                             total_frames=total_frames,
+                                             size=(self.__width, self.__height))
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        try:
+            index = 0
+            while self.__stream is not None:
+                frame = np.empty((self.__height, self.__width, 3), dtype=np.uint8)
+                buffer = memoryview(frame).cast("B")
+                read = 0
+                while read < len(buffer):
+                    chunk = self.__stream.readinto(buffer[read:])
+                    if not chunk:
+                        # A truncated last frame is discarded
+                        return
+                    read += chunk
+                if not self.__known_frames:
+                    self.total_frames = index + 1
+                    self.duration = self.total_frames / self.fps
+                yield index, cv.cvtColor(frame, cv.COLOR_BGR2RGB, dst=frame)
+                index += 1
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self.__stream is not None:
+            self.__stream.close()
+            self.__stream = None
+            if self.__on_close is not None:
+                self.__on_close()
+
+
+class BusFrameSource(FrameSource):
+
+    def __init__(self, bus: "FrameBus", fps: float, retain: int = 2, timeout: Optional[float] = None):
+        """
+        Frame source reading BGR frames from a frame bus as they are published, without copying them. Frames are
+        converted to RGB order within their slots, and each slot is released once retain newer frames have been read;
+        the frame count, duration and timestamps (relative to the first frame) grow as frames are read.
+        :param bus: FrameBus to read (this source is its consumer)
+        :param fps: Nominal frames per second of the frames
+        :param retain: Number of frames the reader of the source may still use after reading the next one (default: 2)
+        :param timeout: Maximum time to wait for each frame (in seconds, default: None, no limit)
+        :raises ValueError for negative retain values (also see: FrameSource)
+        """
+
+        if retain < 0:
+            raise ValueError("The number of retained frames cannot be negative.")
+
+        self.__bus = bus
+        self.__retain = retain
+        self.__timeout = timeout
+        # The number of frames is unknown until the producer closes the bus
+        super(BusFrameSource, self).__init__(fps=fps, duration=1 / fps, total_frames=1, size=bus.resolution)
+        self.timestamps = []
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        index = 0
+        first_timestamp = None
+        try:
+            while True:
+                item = self.__bus.get(timeout=self.__timeout)
+                if item is None:
+                    return
+                _, timestamp, frame = item
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                self.timestamps.append(timestamp - first_timestamp)
+                self.total_frames = index + 1
+                self.duration = self.total_frames / self.fps
+                yield index, cv.cvtColor(frame, cv.COLOR_BGR2RGB, dst=frame)
+                index += 1
+                if self.__bus.held > self.__retain:
+                    self.__bus.release(self.__bus.held - self.__retain)
+        finally:
+            self.__bus.release(self.__bus.held)
@@ -3,18 +3,25 @@ This file contains all the necessary code to detect stable gestures in a Google
 """
 
 import os
+import collections
 import numpy as np
 import imageio
-from skimage.exposure import match_histograms
+from concurrent.futures import ProcessPoolExecutor
 from skimage.metrics import structural_similarity
-import cv2 as cv
 
-from typing import List, Tuple, Optional
+from backend.mediapipe.frame_source import FrameSource, VideoFrameSource, PrefetchFrameSource
+from backend.mediapipe.stability import StabilityEngine, SparseStabilityEngine, SparseFrame, StabilityCascade, \
+    CoordinateStabilityEngine, block_sums
+from backend.mediapipe.landmark_extractor import LandmarkExtractor
+from backend.mediapipe.landmark_source import LandmarkFrameSource, render_landmarks
+from backend.mediapipe.similarity import data_range, fast_structural_similarity, PairwiseCache
+from backend.mediapipe.histogram_matching import HistogramMatcher
+from typing import List, Tuple, Optional, Iterator, Dict, Any, Union, Callable
 
 
 class GestureIdentifier:
 
-    def __init__(self, video_path: str,
+    def __init__(self, video_path: Optional[str] = None,
                  stable_frames: int = 3,
                  apply_histogram_matching: bool = False,
                  use_structural_similarity: bool = False,
@@ -24,10 +31,23 @@ class GestureIdentifier:
                  black_threshold: float = 0.995,
                  ln_norm: int = 3,
                  prev_gesture_threshold: float = 0.01,
-                 debug: bool = False):
+                 debug: bool = False,
+                 frame_source: Optional[FrameSource] = None,
+                 workers: int = 1,
+                 min_chunk_frames: int = 300,
+                 landmark_extraction: str = "hsv",
+                 sparse_frames: bool = True,
+                 use_cascade: bool = True,
+                 adaptive_stride: int = 1,
+                 motion_threshold: float = 1.0,
+                 fast_ssim: bool = False,
+                 ssim_downscale: int = 1,
+                 histogram_reference_interval: int = 1,
+                 prefetch: int = 0,
+                 coordinate_threshold: float = 2.0):
         """
         Processes a MediaPipe-produced video to detect gestures in it.
-        :param video_path: Path to the video to analyze
+        :param video_path: Path to the video to analyze (ignored if frame_source is provided)
         :param stable_frames: Number of frames required to detect a gesture
         :param apply_histogram_matching: Whether to apply histogram matching to any two subsequent frames
         (default: False)
@@ -40,15 +60,63 @@ class GestureIdentifier:
         :param ln_norm: Ln norm to use when comparing two subsequent gesture frames (default: L3 norm)
         :param prev_gesture_threshold: Ceiling value for Ln norm value between two subsequent gesture frames
         :param debug: Whether to print debug information and save every landmark detected
-        :raises FileNotFoundError, ValueError for invalid video file path
+        :param frame_source: FrameSource providing the frames to analyze (default: frames read from video_path)
+        :param workers: Number of processes analyzing time chunks of the video in parallel, capped to the number of
+        CPUs (default: 1, serial); only video files are split in chunks, and histogram matching, adaptive stride or
+        debug mode always run serially
+        :param min_chunk_frames: Minimum number of frames of each time chunk (default: 300); videos shorter than two
+        chunks are analyzed serially, as starting the processes would take longer than the analysis
+        :param landmark_extraction: Landmark extraction method, either 'hsv' or 'lut' (default: 'hsv', see
+        LandmarkExtractor)
+        :param sparse_frames: Whether to store landmark frames as lists of their non-zero pixels (default: True);
+        structural similarity always works on dense frames
+        :param use_cascade: Whether to reject windows through cheap pre-filters before analyzing their stability
+        (default: True, see StabilityCascade)
+        :param adaptive_stride: Maximum number of frames to advance by while landmarks do not move (default: 1, every
+        frame is analyzed); the stride doubles at each still frame and goes back to 1 as soon as motion is detected
+        :param motion_threshold: Average per-pixel L1 difference between the thumbnails of two subsequent analyzed
+        frames above which landmarks are considered moving (default: 1.0)
+        :param fast_ssim: Whether to compute structural similarity on the region surrounding landmarks
+        only (default: False); results are the same of the full computation
+        :param ssim_downscale: Factor by which frames are shrunk before the fast structural similarity (default: 1, no
+        downscaling); values greater than 1 trade accuracy for speed
+        :param histogram_reference_interval: Number of frames after which the histogram matching reference is updated
+        (default: 1, each frame is matched to its predecessor; see HistogramMatcher)
+        :param prefetch: Number of frames a background thread decodes ahead of the analysis (default: 0, frames are
+        decoded by the analyzing thread; see PrefetchFrameSource)
+        :param coordinate_threshold: Average landmark distance from the mean landmarks of a window above which the window
+        is unstable (in pixels, default: 2.0, not calibrated against instability_threshold yet); only used when
+        frame_source is a LandmarkFrameSource, in which case stability is detected on landmark coordinates, while
+        histogram matching, structural similarity, landmark extraction, cascade, adaptive stride and black_threshold
+        parameters are ignored
+        :raises FileNotFoundError, ValueError for invalid video file path, missing frame source, number of workers,
+        minimum chunk length, landmark extraction method, adaptive stride, structural similarity downscaling, histogram
+        reference interval, prefetch depth or coordinate threshold
         """
 
-        if not os.path.exists(video_path):
-            raise FileNotFoundError("No video file found.")
-        elif not os.path.isfile(video_path):
-            raise ValueError("The provided path is not a regular file.")
-
-        self.__video_path = video_path
+        if workers < 1:
+            raise ValueError("At least one worker is required.")
+        elif min_chunk_frames < 1:
+            raise ValueError("Chunks must contain at least one frame.")
+        elif adaptive_stride < 1:
+            raise ValueError("The adaptive stride must be at least 1.")
+        elif landmark_extraction not in {"hsv", "lut"}:
+            raise ValueError("Unknown landmark extraction method.")
+        elif ssim_downscale < 1:
+            raise ValueError("The structural similarity downscaling must be at least 1.")
+        elif histogram_reference_interval < 1:
+            raise ValueError("The histogram reference interval must be at least 1.")
+        elif prefetch < 0:
+            raise ValueError("The prefetch depth cannot be negative.")
+        elif coordinate_threshold < 0:
+            raise ValueError("The coordinate threshold cannot be negative.")
+
+        if frame_source is None:
+            if video_path is None:
+                raise ValueError("Either a video path or a frame source must be provided.")
+            frame_source = VideoFrameSource(video_path)
+
+        self.__frame_source = frame_source
         self.__stable_frames = stable_frames
         self.__histogram_matching = apply_histogram_matching
         self.__use_ssim = use_structural_similarity
@@ -59,39 +127,67 @@ class GestureIdentifier:
         self.__ln_norm = ln_norm
         self.__prev_gesture_threshold = prev_gesture_threshold
         self.__debug = debug
-
-        reader = imageio.get_reader(video_path)
-        metadata = reader.get_meta_data()
-        self.__total_frames = len([*enumerate(reader)])
-        self.__fps = metadata["fps"]
-        self.__duration = metadata["duration"]
+        self.__workers = min(workers, os.cpu_count() or 1)
+        self.__min_chunk_frames = min_chunk_frames
+        self.__landmark_extraction = landmark_extraction
+        self.__sparse_frames = sparse_frames and not use_structural_similarity
+        self.__use_cascade = use_cascade
+        self.__cascade_stats = {}
+        self.__adaptive_stride = adaptive_stride
+        self.__motion_threshold = motion_threshold
+        self.__fast_ssim = fast_ssim
+        self.__ssim_downscale = ssim_downscale
+        self.__histogram_reference_interval = histogram_reference_interval
+        self.__prefetch = prefetch
+        self.__prefetch_stats = {}
+        self.__coordinate_threshold = coordinate_threshold
+
+        # Configuration shared with chunk workers (see process_iter)
+        self.__config = {"stable_frames": stable_frames,
+                         "apply_histogram_matching": apply_histogram_matching,
+                         "use_structural_similarity": use_structural_similarity,
+                         "instability_threshold": instability_threshold,
+                         "gesture_frames_interval": gesture_frames_interval,
+                         "gesture_time_interval": gesture_time_interval,
+                         "black_threshold": black_threshold,
+                         "ln_norm": ln_norm,
+                         "prev_gesture_threshold": prev_gesture_threshold,
+                         "landmark_extraction": landmark_extraction,
+                         "sparse_frames": sparse_frames,
+                         "use_cascade": use_cascade,
+                         "adaptive_stride": adaptive_stride,
+                         "motion_threshold": motion_threshold,
+                         "fast_ssim": fast_ssim,
+                         "ssim_downscale": ssim_downscale,
+                         "histogram_reference_interval": histogram_reference_interval,
+                         "prefetch": prefetch,
+                         "coordinate_threshold": coordinate_threshold}
 
     @staticmethod
     def __enhance_frame(frame: imageio.core.Image,
-                        prev_frame: Optional[imageio.core.Image] = None,
-                        histogram_matching: bool = False
-                        ) -> (imageio.core.Image, imageio.core.Image):
+                        extractor: LandmarkExtractor,
+                        matcher: Optional[HistogramMatcher] = None,
+                        sparse: bool = False
+                        ) -> (Union[np.ndarray, SparseFrame], np.ndarray):
         """
         Enhances the outline of landmarks in a frame, making all the rest black.
         :param frame: A frame from a MediaPipe-produced video
-        :param prev_frame: The predecessor of the current frame (Optional)
-        :param histogram_matching: Whether to apply histogram matching to the current frame w.r.t. to the previous one
-        :return: The given frame with yellow landmarks and all the rest being black
+        :param extractor: LandmarkExtractor to use (the returned landmarks are overwritten by its next call)
+        :param matcher: HistogramMatcher stabilizing the colors of the current frame w.r.t. the previous ones (Optional)
+        :param sparse: Whether to return landmarks as a normalized SparseFrame (default: False)
+        :return: The given frame with yellow landmarks and all the rest being black, and the (matched) frame
         """
 
-        # Stabilize image colors w.r.t. the previous frame (WARNING: performance hit)
-        if histogram_matching and prev_frame is not None:
-            frame = match_histograms(frame, prev_frame, multichannel=True)
+        array = np.ascontiguousarray(imageio.core.asarray(frame))
 
-        # Extract gesture only
-        array = np.copy(imageio.core.asarray(frame)) if histogram_matching else imageio.core.asarray(frame)
-        image = cv.cvtColor(array, cv.COLOR_BGR2HSV)
-        lower = np.array([60, 220, 20])
-        upper = np.array([65, 255, 255])
-        mask = cv.inRange(image, lower, upper)
-        array = cv.bitwise_and(array, array, mask=mask)
+        # Stabilize image colors w.r.t. the previous frames
+        if matcher is not None:
+            array = matcher.match(array)
 
-        return imageio.core.Image(array), frame
+        # Extract gesture only
+        if sparse:
+            return extractor.extract_sparse(array), array
+        return extractor.extract(array), array
 
     def __compute_seconds(self, index: int) -> float:
         """
@@ -99,7 +195,7 @@ class GestureIdentifier:
         :param index: Number of frame
         :return: Timestamp of occurrence in seconds
         """
-        return float(index)/self.__total_frames * self.__duration
+        return self.__frame_source.timestamp(index)
 
     @staticmethod
     def __normalize(frames: List[imageio.core.Image]) -> List[np.ndarray]:
@@ -148,14 +244,30 @@ class GestureIdentifier:
 
         return frames, distances, avg_distance
 
+    def __ssim(self, x: np.ndarray, y: np.ndarray) -> float:
+        """
+        Computes the structural similarity of two frames, with the data range skimage used to infer from their dtype.
+        :param x: First frame
+        :param y: Second frame
+        :return: Mean structural similarity
+        """
+
+        if self.__fast_ssim:
+            return fast_structural_similarity(x, y, downscale=self.__ssim_downscale)
+        return structural_similarity(x, y, data_range=data_range(x))
+
     def __structural_similarity(self,
                                 frames: List[imageio.core.Image],
-                                normalize: bool = True
+                                normalize: bool = True,
+                                indices: Optional[List[int]] = None,
+                                cache: Optional[PairwiseCache] = None
                                 ) -> (List[np.ndarray], List[float], float):
         """
         Computes pairwise structural similarities in a group of frames, also computing the average structural similarity.
         :param frames: List of frames to compare
         :param normalize: Apply normalization (default: True)
+        :param indices: Indices of the frames in the video, identifying pairs in the cache (Optional)
+        :param cache: PairwiseCache of similarities already computed (Optional, used along with indices)
         :return: Tuple containing at positions:
                     - 0: List of (normalized) frames
                     - 1: List of pairwise structural similarities
@@ -166,20 +278,10 @@ class GestureIdentifier:
             frames = GestureIdentifier.__normalize(frames)
 
         # Compute pairwise structural similarities and their average across all the frames
-        frame_cache = []
-
-        def pairwise_ssim(x):
-            nonlocal frame_cache
-            frame_cache.append(x)
-            if len(frame_cache) == 2:
-                ssim = structural_similarity(frame_cache[0], frame_cache[1])
-                frame_cache = frame_cache[1:]
-                return ssim
-            else:
-                return None
-
-        ssims = [*map(pairwise_ssim, frames)]
-        ssims = [*filter(lambda x: x is not None, ssims)]
+        if cache is not None and indices is not None:
+            ssims = [cache.get(indices[i], indices[i + 1], frames[i], frames[i + 1]) for i in range(len(frames) - 1)]
+        else:
+            ssims = [self.__ssim(frames[i], frames[i + 1]) for i in range(len(frames) - 1)]
         avg_ssim = sum(ssims) / len(ssims)
 
         if self.__debug:
@@ -187,15 +289,17 @@ class GestureIdentifier:
 
         return frames, ssims, avg_ssim
 
-    def __check_stability(self, last_gesture: Optional[imageio.core.Image],
-                          frame_buffer: List[imageio.core.Image],
-                          use_structural_similarity: bool = False
+    def __check_stability(self, engine: Union[StabilityEngine, SparseStabilityEngine],
+                          use_structural_similarity: bool = False,
+                          indices: Optional[List[int]] = None,
+                          cache: Optional[PairwiseCache] = None
                           ) -> (bool, Optional[imageio.core.Image]):
         """
-        Computes stability of a list of frames, avoiding duplicate subsequent gestures.
-        :param last_gesture: Frame associated with its immediate previous gesture
-        :param frame_buffer: List of frames to evaluate
+        Computes stability of a window of frames, discarding windows with no gestures.
+        :param engine: Stability engine holding the (already normalized) window of frames to evaluate
         :param use_structural_similarity: Whether to use structural similarity (default: False)
+        :param indices: Indices of the frames in the window (Optional, see __structural_similarity)
+        :param cache: PairwiseCache shared by overlapping windows (Optional, see __structural_similarity)
         :return: Tuple containing at positions:
                     - 0: Bool indicating whether the list of frames is stable
                     - 1: Best frame in case frames are stable, or None otherwise
@@ -206,47 +310,353 @@ class GestureIdentifier:
 
         # Discard unstable frames
         if use_structural_similarity:
-            frame_buffer, metric_values, avg_metric_value = self.__structural_similarity(frame_buffer)
+            _, metric_values, avg_metric_value = self.__structural_similarity(engine.frames(),
+                                                                                   normalize=False,
+                                                                                   indices=indices,
+                                                                                   cache=cache)
             if avg_metric_value <= self.__instability_threshold:
+                self.__count("unstable")
                 return False, None
             # Select the frame that is the most similar to its predecessor
-            best_metric_value = max(metric_values)
+            best_index = int(np.argmax(metric_values))
         else:
-            frame_buffer, metric_values, avg_metric_value = self.__ln_distance(frame_buffer)
+            metric_values, avg_metric_value = engine.ln_distances()
+            if self.__debug:
+                print(f"DEBUG\nDistances: {metric_values.tolist()}\n Average distance: {avg_metric_value}")
             if avg_metric_value > self.__instability_threshold:
+                self.__count("unstable")
                 return False, None
             # Select the frame that is the most similar to the mean
-            best_metric_value = min(metric_values)
-
-        best_frame = frame_buffer[0]
-        for index, metric_value in enumerate(metric_values):
-            if metric_value == best_metric_value:
-                best_frame = frame_buffer[index]
-                break
-        best_frame = best_frame.astype(np.uint8)
+            best_index = int(np.argmin(metric_values))
 
         # Discard frames with too much black (-> no gestures present)
-        black_percent = np.sum(best_frame == 0, dtype=np.float32)
-        black_percent = float(black_percent / best_frame.size)
+        black_percent = engine.black_ratio(best_index)
         if black_percent > self.__black_threshold:
+            self.__count("black")
             return False, None
-        # Discard gestures that are too similar to its immediate predecessor
-        if last_gesture is not None:
-            if use_structural_similarity:
-                _, _, avg_ssim = self.__structural_similarity([last_gesture, best_frame],
-                                                              normalize=False)
-                if avg_ssim >= self.__prev_gesture_threshold:
-                    return False, None
-            else:
-                mask = np.not_equal(last_gesture, 255)
-                _, _, avg_ln = self.__ln_distance([last_gesture[mask], best_frame[mask]],
+
+        self.__count("stable")
+        best_frame = engine.frame(best_index).astype(np.uint8)
+        return True, best_frame
+
+    def __is_duplicate(self, last_gesture: imageio.core.Image,
+                       gesture_frame: imageio.core.Image,
+                       use_structural_similarity: bool = False
+                       ) -> bool:
+        """
+        Checks whether a gesture is too similar to its immediate predecessor.
+        :param last_gesture: Frame associated with its immediate previous gesture
+        :param gesture_frame: Best frame of a stable window
+        :param use_structural_similarity: Whether to use structural similarity (default: False)
+        :return: True if the gesture has to be discarded, False otherwise
+        """
+
+        if use_structural_similarity:
+            _, _, avg_ssim = self.__structural_similarity([last_gesture, gesture_frame],
+                                                          normalize=False)
+            return avg_ssim >= self.__prev_gesture_threshold
+
+        if self.__sparse_frames:
+            # Pixels black in both gestures are at distance 0 from their mean, hence only their number matters
+            last_gesture = imageio.core.asarray(last_gesture).ravel()
+            gesture_frame = imageio.core.asarray(gesture_frame).ravel()
+            indices = np.union1d(np.flatnonzero(last_gesture), np.flatnonzero(gesture_frame))
+            mask = np.not_equal(last_gesture[indices], 255)
+            compared = last_gesture.size - np.count_nonzero(last_gesture == 255)
+            differing = np.count_nonzero(mask)
+            avg_ln = 0.0
+            if differing > 0:
+                _, _, avg_ln = self.__ln_distance([last_gesture[indices][mask], gesture_frame[indices][mask]],
                                                   normalize=False,
                                                   ln_distance=self.__ln_norm)
-                avg_ln /= 100**self.__ln_norm
-                if avg_ln <= self.__prev_gesture_threshold:
-                    return False, None
+                avg_ln *= differing / compared
+        else:
+            mask = np.not_equal(last_gesture, 255)
+            _, _, avg_ln = self.__ln_distance([last_gesture[mask], gesture_frame[mask]],
+                                              normalize=False,
+                                              ln_distance=self.__ln_norm)
+        avg_ln /= 100**self.__ln_norm
+        return avg_ln <= self.__prev_gesture_threshold
+
+    def __count(self, stage: str, windows: int = 1) -> None:
+        """
+        Updates the number of windows rejected (or accepted) at a given stage.
+        :param stage: Name of the stage
+        :param windows: Number of windows to add (default: 1)
+        :return: None
+        """
 
-        return True, best_frame
+        self.__cascade_stats[stage] = self.__cascade_stats.get(stage, 0) + windows
+
+    def get_cascade_stats(self) -> Dict[str, int]:
+        """
+        Returns the number of windows analyzed by the last run, and how many of them each stage rejected:
+            - 'windows': windows analyzed
+            - 'empty', 'thumbnail': windows rejected by the pre-filters (see StabilityCascade)
+            - 'unstable', 'black': windows rejected by the full stability analysis
+            - 'stable': windows accepted, before filtering duplicate gestures and applying gesture_time_interval
+            - 'skipped_frames': frames skipped by the adaptive stride (if any)
+            - 'ssim_hits', 'ssim_misses': pairwise structural similarities reused from overlapping windows, or computed
+            (structural similarity only)
+        :return: Dict associating each stage to its number of windows
+        """
+
+        return dict(self.__cascade_stats)
+
+    def get_prefetch_stats(self) -> Dict[str, float]:
+        """
+        Returns the statistics of background decoding during the last run (empty if prefetch is disabled):
+            - 'frames': frames decoded
+            - 'decoder_wait': time the decoder waited for the analysis to consume frames (in seconds)
+            - 'consumer_wait': time the analysis waited for frames to be decoded (in seconds)
+        Parallel runs sum the statistics of their chunks.
+        :return: Dict associating each statistic to its value
+        """
+
+        return dict(self.__prefetch_stats)
+
+    def __window_step(self) -> int:
+        """
+        Computes the number of frames between the last frames of two subsequent windows.
+        :return: Number of frames
+        """
+
+        return min(self.__gesture_frames_interval, self.__stable_frames)
+
+    def candidates(self, debug_frames: Optional[Callable[[int, imageio.core.Image], None]] = None
+                   ) -> Iterator[Tuple[int, imageio.core.Image]]:
+        """
+        Detects stable windows in the frame source, before filtering duplicate gestures and applying
+        gesture_time_interval.
+        :param debug_frames: Function receiving the index and the landmarks of every frame analyzed in debug mode, before
+        the window ending at that frame is yielded (Optional)
+        :return: An iterator over tuples containing at position:
+            0: index of the first frame of the window
+            1: best frame of the window (as imageio.core.Image)
+        """
+
+        if isinstance(self.__frame_source, LandmarkFrameSource):
+            yield from self.__coordinate_candidates(debug_frames)
+            return
+
+        if self.__sparse_frames:
+            engine = SparseStabilityEngine(self.__stable_frames)
+        else:
+            engine = StabilityEngine(self.__stable_frames)
+        extractor = LandmarkExtractor(self.__landmark_extraction)
+        cascade = StabilityCascade(self.__stable_frames,
+                                   black_threshold=self.__black_threshold,
+                                   instability_threshold=None if self.__use_ssim else self.__instability_threshold)
+        # Subsequent windows share most of their pairs of frames
+        cache = PairwiseCache(self.__ssim) if self.__use_ssim else None
+        matcher = HistogramMatcher(self.__histogram_reference_interval) if self.__histogram_matching else None
+        self.__cascade_stats = {}
+        self.__prefetch_stats = {}
+        source = self.__frame_source
+        if self.__prefetch > 0:
+            source = PrefetchFrameSource(source, depth=self.__prefetch)
+
+        # Indices of the frames in the window, and state of the adaptive stride
+        window_indices = []
+        stride = 1
+        next_index = 0
+        last_thumbnail = None
+        for index, frame in source:
+            if index < next_index:
+                self.__count("skipped_frames")
+                continue
+
+            landmarks, new_frame = self.__enhance_frame(frame,
+                                                        extractor,
+                                                        matcher=matcher,
+                                                        sparse=self.__sparse_frames and not self.__debug)
+            if self.__debug:
+                if debug_frames is not None:
+                    debug_frames(index, imageio.core.Image(np.copy(landmarks)))
+                if self.__sparse_frames:
+                    landmarks = extractor.extract_sparse(new_frame)
+            engine.push(landmarks)
+            window_indices = (window_indices + [index])[-self.__stable_frames:]
+            normalized = landmarks if self.__sparse_frames else engine.frame(len(engine) - 1)
+            if self.__use_cascade:
+                cascade.push(normalized)
+
+            # Skip frames while landmarks stand still, going back to every frame as soon as they move
+            if self.__adaptive_stride > 1:
+                thumbnail = block_sums(normalized)
+                if last_thumbnail is not None:
+                    motion = np.abs(thumbnail - last_thumbnail).sum() / normalized.size
+                    stride = 1 if motion > self.__motion_threshold else min(2 * stride, self.__adaptive_stride)
+                last_thumbnail = thumbnail
+                next_index = index + stride
+
+            if engine.is_full():
+                rejected = None
+                if self.__use_cascade:
+                    rejected = cascade.reject()
+                    cascade.drop(self.__gesture_frames_interval)
+                else:
+                    self.__count("windows")
+                if rejected is None:
+                    stable, gesture_frame = self.__check_stability(engine,
+                                                                   use_structural_similarity=self.__use_ssim,
+                                                                   indices=window_indices,
+                                                                   cache=cache)
+                    if stable:
+                        yield window_indices[0], gesture_frame
+                engine.drop(self.__gesture_frames_interval)
+                window_indices = window_indices[self.__gesture_frames_interval:]
+                if cache is not None:
+                    # The window is empty once gesture_frames_interval >= stable_frames
+                    cache.evict(window_indices[0] if len(window_indices) > 0 else index + 1)
+        for stage, windows in cascade.stats.items():
+            self.__count(stage, windows)
+        if cache is not None:
+            self.__count("ssim_hits", cache.hits)
+            self.__count("ssim_misses", cache.misses)
+        if self.__prefetch > 0:
+            self.__prefetch_stats = dict(source.stats)
+
+        if self.__debug:
+            print(f"DEBUG\nWindows per stage: {self.__cascade_stats}")
+            if self.__prefetch > 0:
+                print(f"DEBUG\nPrefetch: {self.__prefetch_stats}")
+
+    def __coordinate_candidates(self, debug_frames: Optional[Callable[[int, imageio.core.Image], None]] = None
+                                ) -> Iterator[Tuple[int, imageio.core.Image]]:
+        """
+        Detects stable windows on the landmark coordinates of a LandmarkFrameSource, rendering the best frame of each
+        stable window as MediaPipe does (so that duplicate gestures are filtered as in pixel mode).
+        :param debug_frames: Function receiving the index and the rendered landmarks of every frame in debug mode
+        (Optional, see candidates)
+        :return: An iterator over tuples, in the same order and format of candidates()
+        """
+
+        engine = CoordinateStabilityEngine(self.__stable_frames)
+        size = self.__frame_source.size
+        self.__cascade_stats = {}
+        self.__prefetch_stats = {}
+
+        window_indices = []
+        for index, hands in self.__frame_source:
+            if self.__debug and debug_frames is not None:
+                debug_frames(index, imageio.core.Image(render_landmarks(hands, size)))
+            engine.push(hands)
+            window_indices = (window_indices + [index])[-self.__stable_frames:]
+            if not engine.is_full():
+                continue
+
+            self.__count("windows")
+            counts = set(engine.hand_counts())
+            if counts == {0}:
+                # No gestures present (same as black frames in pixel mode)
+                self.__count("black")
+            elif len(counts) != 1:
+                # Hands appearing or disappearing
+                self.__count("unstable")
+            else:
+                distances, avg_distance = engine.distances()
+                if self.__debug:
+                    print(f"DEBUG\nDistances: {distances.tolist()}\n Average distance: {avg_distance}")
+                if avg_distance > self.__coordinate_threshold:
+                    self.__count("unstable")
+                else:
+                    self.__count("stable")
+                    best_index = int(np.argmin(distances))
+                    yield window_indices[0], imageio.core.Image(render_landmarks(engine.frame(best_index), size))
+            engine.drop(self.__gesture_frames_interval)
+            window_indices = window_indices[self.__gesture_frames_interval:]
+
+        if self.__debug:
+            print(f"DEBUG\nWindows per stage: {self.__cascade_stats}")
+
+    def __chunk_count(self) -> int:
+        """
+        Computes the number of time chunks the video is split in, so that each one has at least min_chunk_frames frames.
+        :return: Number of chunks (1 if the video is analyzed serially)
+        """
+
+        return max(1, min(self.__workers, self.__frame_source.total_frames // self.__min_chunk_frames))
+
+    def __chunk_candidates(self) -> Iterator[Tuple[int, imageio.core.Image]]:
+        """
+        Detects stable windows by splitting the video in time chunks processed by a pool of processes.
+        Chunks overlap so that every window analyzed by a serial run is analyzed by exactly one chunk.
+        :return: An iterator over tuples, in the same order and format of candidates()
+        """
+
+        total_frames = self.__frame_source.total_frames
+        step = self.__window_step()
+        windows = max(0, (total_frames - self.__stable_frames) // step + 1)
+        chunk_windows = max(1, -(-windows // self.__chunk_count()))
+
+        jobs = []
+        for first_window in range(0, windows, chunk_windows):
+            start = first_window * step
+            last_window = first_window + chunk_windows - 1
+            # The last chunk reads up to the end, in case metadata underestimate the number of frames
+            stop = None if last_window >= windows - 1 else last_window * step + self.__stable_frames
+            jobs.append((self.__frame_source.video_path, start, stop, self.__config))
+
+        if len(jobs) == 0:
+            return
+
+        self.__cascade_stats = {}
+        self.__prefetch_stats = {}
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            for chunk, stats, prefetch_stats in pool.map(_chunk_candidates, jobs):
+                for stage, windows in stats.items():
+                    self.__count(stage, windows)
+                for name, value in prefetch_stats.items():
+                    self.__prefetch_stats[name] = self.__prefetch_stats.get(name, 0) + value
+                yield from chunk
+
+    def process_iter(self) -> Iterator[Tuple[imageio.core.Image, float]]:
+        """
+        Analyzes the video to detect the gestures present in it, decoding each frame once and yielding every stable
+        gesture as soon as it is confirmed.
+        :return: An iterator over tuples containing at position:
+            0: gesture frame (as imageio.core.Image)
+            1: timestamp (in seconds)
+        """
+
+        parallel = isinstance(self.__frame_source, VideoFrameSource) and \
+            self.__chunk_count() > 1 and \
+            not self.__histogram_matching and \
+            self.__adaptive_stride == 1 and \
+            not self.__debug
+        # Landmarks of every frame are yielded in debug mode, in order with the gestures
+        debug_frames = collections.deque()
+
+        def store_debug_frame(index: int, landmarks: imageio.core.Image) -> None:
+            debug_frames.append((landmarks, self.__compute_seconds(index - self.__stable_frames + 1)))
+
+        if parallel:
+            candidates = self.__chunk_candidates()
+        else:
+            candidates = self.candidates(debug_frames=store_debug_frame if self.__debug else None)
+
+        last_gesture = None
+        last_seconds = None
+        for index, gesture_frame in candidates:
+            while len(debug_frames) > 0:
+                yield debug_frames.popleft()
+
+            if last_gesture is not None and self.__is_duplicate(last_gesture,
+                                                                gesture_frame,
+                                                                use_structural_similarity=self.__use_ssim):
+                continue
+            seconds = self.__compute_seconds(index)
+            # if the difference between new gesture and last gesture timestamps
+            # is >= gesture_time_interval, the new gesture is added.
+            if (last_gesture is not None and seconds - last_seconds >= self.__gesture_time_interval) or \
+                    (last_gesture is None):
+                last_gesture = gesture_frame
+                last_seconds = seconds
+                yield gesture_frame, seconds
+
+        while len(debug_frames) > 0:
+            yield debug_frames.popleft()
 
     def process(self) -> List[Tuple[imageio.core.Image, float]]:
         """
@@ -256,32 +666,28 @@ class GestureIdentifier:
             1: timestamp (in seconds)
         """
 
-        gestures = []
-        reader = imageio.get_reader(self.__video_path)
-        frame_buffer = []
-        last_frame = None
-        last_gesture = None
-        for index, frame in enumerate(reader):
-            landmarks, new_frame = self.__enhance_frame(frame, last_frame, histogram_matching=self.__histogram_matching)
-            last_frame = new_frame
-            if self.__debug:
-                gestures.append((landmarks, self.__compute_seconds(index - self.__stable_frames + 1)))
-            frame_buffer.append(landmarks)
-            if len(frame_buffer) == self.__stable_frames:
-                stable, gesture_frame = self.__check_stability(last_gesture,
-                                                               frame_buffer,
-                                                               use_structural_similarity=self.__use_ssim)
-                if stable:
-                    seconds = self.__compute_seconds(index - self.__stable_frames + 1)
-                    # if the difference between new gesture and last gesture timestamps
-                    # is >= gesture_time_interval, the new gesture is added.
-                    if (last_gesture is not None and seconds - gestures[-1][1] >= self.__gesture_time_interval) or \
-                            (last_gesture is None):
-                        gestures.append((gesture_frame, seconds))
-                        last_gesture = gesture_frame
-                frame_buffer = frame_buffer[self.__gesture_frames_interval:]
-
-        return gestures
+        return [*self.process_iter()]
+
+
+def _chunk_candidates(job: Tuple[str, int, Optional[int], Dict[str, Any]]
+                      ) -> (List[Tuple[int, imageio.core.Image]], Dict[str, int], Dict[str, float]):
+    """
+    Detects stable windows in a time chunk of a video (runs in a worker process).
+    :param job: Tuple containing at positions:
+                - 0: Path to the video to analyze
+                - 1: Index of the first frame of the chunk
+                - 2: Index of the frame where the chunk ends, exclusive (None for the last chunk)
+                - 3: GestureIdentifier configuration
+    :return: Tuple containing at positions:
+                - 0: List of tuples, as produced by GestureIdentifier.candidates
+                - 1: Statistics of the chunk, as produced by GestureIdentifier.get_cascade_stats
+                - 2: Decoding statistics of the chunk, as produced by GestureIdentifier.get_prefetch_stats
+    """
+
+    video_path, start, stop, config = job
+    identifier = GestureIdentifier(frame_source=VideoFrameSource(video_path, start=start, stop=stop), **config)
+    candidates = [*identifier.candidates()]
+    return candidates, identifier.get_cascade_stats(), identifier.get_prefetch_stats()
 
 
 if __name__ == '__main__':
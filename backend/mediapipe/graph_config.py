@@ -0,0 +1,206 @@
+"""
+This file contains the generation of the MediaPipe multi-hand tracking graph from a template, so that its cost can be
+tuned without editing protobuf files by hand.
+"""
+
+import os
+import string
+import hashlib
+
+from backend.mediapipe.landmark_source import HAND_CONNECTIONS
+from typing import Optional, Tuple
+
+# Template of the graph, along with the patched graph it generalizes (see data/mediapipe_custom)
+TEMPLATE_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data",
+                                              "mediapipe_custom", "multi_hand_tracking_desktop_live.pbtxt.template"))
+
+# Maximum number of hands, bound by the palm detection subgraph (see max_vec_size in multi_hand_detection_cpu.pbtxt)
+MAX_HANDS = 2
+
+RENDER_MODES = {"full", "landmarks"}
+
+DOWNSCALE_NODE = """
+# Downscales the incoming images before any processing.
+node {{
+  calculator: "ImageTransformationCalculator"
+  input_stream: "IMAGE:input_video"
+  output_stream: "IMAGE:scaled_input_video"
+  node_options: {{
+    [type.googleapis.com/mediapipe.ImageTransformationCalculatorOptions] {{
+      output_width: {width}
+      output_height: {height}
+    }}
+  }}
+}}
+"""
+
+FULL_RENDERER_NODE = """# Subgraph that renders annotations and overlays them on top of the input
+# images (see multi_hand_renderer_cpu.pbtxt).
+node {{
+  calculator: "MultiHandRendererSubgraph"
+  input_stream: "IMAGE:{image_stream}"
+  input_stream: "LANDMARKS:multi_hand_landmarks"
+  output_stream: "IMAGE:output_video"
+}}
+"""
+
+# Same nodes of multi_hand_renderer_cpu.pbtxt, drawing on a black canvas instead of the input images
+LANDMARKS_RENDERER_NODES = """# Renders the landmarks of every hand on a black canvas (same nodes of
+# multi_hand_renderer_cpu.pbtxt, without the input images).
+node {{
+  calculator: "BeginLoopNormalizedLandmarkListVectorCalculator"
+  input_stream: "ITERABLE:multi_hand_landmarks"
+  output_stream: "ITEM:single_hand_landmarks"
+  output_stream: "BATCH_END:landmark_timestamp"
+}}
+
+node {{
+  calculator: "LandmarksToRenderDataCalculator"
+  input_stream: "NORM_LANDMARKS:single_hand_landmarks"
+  output_stream: "RENDER_DATA:single_hand_landmark_render_data"
+  node_options: {{
+    [type.googleapis.com/mediapipe.LandmarksToRenderDataCalculatorOptions] {{
+{connections}
+      landmark_color {{ r: 255 g: 0 b: 0 }}
+      connection_color {{ r: 0 g: 255 b: 0 }}
+      thickness: 4.0
+      visualize_landmark_depth: false
+    }}
+  }}
+}}
+
+node {{
+  calculator: "EndLoopRenderDataCalculator"
+  input_stream: "ITEM:single_hand_landmark_render_data"
+  input_stream: "BATCH_END:landmark_timestamp"
+  output_stream: "ITERABLE:multi_hand_landmarks_render_data"
+}}
+
+node {{
+  calculator: "AnnotationOverlayCalculator"
+  input_stream: "VECTOR:0:multi_hand_landmarks_render_data"
+  output_stream: "IMAGE:output_video"
+  node_options: {{
+    [type.googleapis.com/mediapipe.AnnotationOverlayCalculatorOptions] {{
+      canvas_width_px: {width}
+      canvas_height_px: {height}
+      canvas_color {{ r: 0 g: 0 b: 0 }}
+    }}
+  }}
+}}
+"""
+
+
+class GraphConfig:
+
+    def __init__(self,
+                 resolution: Optional[Tuple[int, int]] = None,
+                 max_hands: int = MAX_HANDS,
+                 frame_stride: int = 1,
+                 render: str = "full"):
+        """
+        Parameters of the multi-hand tracking graph, trading accuracy for latency.
+        :param resolution: Resolution frames are downscaled to before tracking (format: width x height; default: None,
+        frames are processed at their own resolution); rendered frames have this resolution as well
+        :param max_hands: Maximum number of hands tracked (default: 2, also the maximum value)
+        :param frame_stride: Number of frames MediaPipe advances by, processing one frame every frame_stride (default:
+        1, every frame); outputs have a frame rate frame_stride times lower
+        :param render: Either 'full', rendering landmarks on top of the input frames, or 'landmarks', rendering them
+        on a black canvas (default: 'full'); 'landmarks' requires a resolution
+        :raises ValueError for invalid resolution, number of hands, frame stride or render mode
+        """
+
+        if resolution is not None and (len(resolution) != 2 or min(resolution) <= 0):
+            raise ValueError("The resolution must contain a positive width and height.")
+        elif not 1 <= max_hands <= MAX_HANDS:
+            raise ValueError("The maximum number of hands must be between 1 and {m}.".format(m=MAX_HANDS))
+        elif frame_stride < 1:
+            raise ValueError("The frame stride must be at least 1.")
+        elif render not in RENDER_MODES:
+            raise ValueError("Unknown render mode.")
+        elif render == "landmarks" and resolution is None:
+            raise ValueError("Rendering landmarks only requires a resolution (i.e. the size of the canvas).")
+
+        self.resolution = tuple(resolution) if resolution is not None else None
+        self.max_hands = max_hands
+        self.frame_stride = frame_stride
+        self.render = render
+
+    def graph_parameters(self) -> dict:
+        """
+        Computes the values of the placeholders of the graph template (the frame stride is not part of the graph, see
+        command_flags).
+        :return: Dict mapping each placeholder to its value
+        """
+
+        image_stream = "input_video"
+        downscale_node = ""
+        if self.resolution is not None:
+            image_stream = "scaled_input_video"
+            downscale_node = DOWNSCALE_NODE.format(width=self.resolution[0], height=self.resolution[1])
+
+        if self.render == "full":
+            renderer_nodes = FULL_RENDERER_NODE.format(image_stream=image_stream)
+        else:
+            connections = "\n".join("      landmark_connections: {s}\n      landmark_connections: {e}".format(s=start,
+                                                                                                            e=end)
+                                    for start, end in HAND_CONNECTIONS)
+            renderer_nodes = LANDMARKS_RENDERER_NODES.format(connections=connections,
+                                                             width=self.resolution[0],
+                                                             height=self.resolution[1])
+
+        return {"downscale_node": downscale_node,
+                "image_stream": image_stream,
+                "max_hands": self.max_hands,
+                "renderer_nodes": renderer_nodes}
+
+    def command_flags(self) -> list:
+        """
+        Computes the command line flags of the MediaPipe binary implementing the parameters the graph cannot express.
+        :return: List of flags
+        """
+
+        return ["--frame_stride={s}".format(s=self.frame_stride)] if self.frame_stride > 1 else []
+
+    def render_graph(self, template_path: str = TEMPLATE_PATH) -> str:
+        """
+        Fills in the graph template.
+        :param template_path: Path to the template (default: the one in data/mediapipe_custom)
+        :return: Graph config, in protobuf text format
+        """
+
+        with open(template_path) as f:
+            template = string.Template(f.read())
+
+        return template.substitute(self.graph_parameters())
+
+    def write_graph(self, graph_dir: str, template_path: str = TEMPLATE_PATH) -> str:
+        """
+        Writes the graph to a file named after its contents, unless an identical one was already written.
+        :param graph_dir: Directory storing the generated graphs (created if missing)
+        :param template_path: Path to the template (default: the one in data/mediapipe_custom)
+        :return: Path to the graph file
+        """
+
+        graph = self.render_graph(template_path)
+        path = os.path.join(graph_dir, "multi_hand_tracking_{h}.pbtxt".format(
+            h=hashlib.sha256(graph.encode()).hexdigest()[:16]))
+        if not os.path.isfile(path):
+            os.makedirs(graph_dir, exist_ok=True)
+            tmp_path = "{p}.{pid}.tmp".format(p=path, pid=os.getpid())
+            with open(tmp_path, "w") as f:
+                f.write(graph)
+            os.replace(tmp_path, path)
+
+        return path
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, GraphConfig) and (self.resolution, self.max_hands, self.frame_stride, self.render) == \
+            (other.resolution, other.max_hands, other.frame_stride, other.render)
+
+    def __hash__(self) -> int:
+        return hash((self.resolution, self.max_hands, self.frame_stride, self.render))
+
+    def __repr__(self) -> str:
+        return "GraphConfig(resolution={r}, max_hands={m}, frame_stride={s}, render={d!r})".format(
+            r=self.resolution, m=self.max_hands, s=self.frame_stride, d=self.render)
@@ -0,0 +1,97 @@
+"""
+This file contains a histogram matching stage stabilizing the colors of subsequent frames through lookup tables.
+"""
+
+import numpy as np
+import cv2 as cv
+
+from typing import List, Optional, Tuple
+
+# Number of intensity levels of uint8 channels
+LEVELS = 256
+
+
+class HistogramMatcher:
+
+    def __init__(self, reference_interval: int = 1):
+        """
+        Matches the histogram of each frame to the one of a reference frame, channel by channel, as skimage's
+        match_histograms does.
+        The reference is kept as per-channel cumulative histograms, hence matching a frame only requires computing its
+        own histograms and applying a lookup table.
+        :param reference_interval: Number of frames after which the reference is replaced by the last matched frame
+        (default: 1, each frame is matched to its matched predecessor)
+        :raises ValueError for reference intervals lower than 1
+        """
+
+        if reference_interval < 1:
+            raise ValueError("The reference interval must be at least 1.")
+
+        self.__reference_interval = reference_interval
+        self.__reference: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+        self.__frames = 0
+        self.__lut = np.empty((1, LEVELS, 3), dtype=np.uint8)
+
+    @staticmethod
+    def __histogram(frame: np.ndarray, channel: int) -> np.ndarray:
+        """
+        Computes the histogram of a channel.
+        :param frame: Frame (uint8, format: height x width x channels)
+        :param channel: Index of the channel
+        :return: Counts of each intensity level (float64)
+        """
+
+        return cv.calcHist([frame], [channel], None, [LEVELS], [0, LEVELS]).ravel().astype(np.float64)
+
+    @staticmethod
+    def __cdf(histogram: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the cumulative distribution of the intensity levels present in a channel.
+        :param histogram: Counts of each intensity level
+        :return: Tuple containing at positions:
+                    - 0: Intensity levels present in the channel
+                    - 1: Their normalized quantiles
+        """
+
+        values = np.flatnonzero(histogram)
+        quantiles = np.cumsum(histogram[values]) / histogram.sum()
+        return values, quantiles
+
+    def reset(self) -> None:
+        """
+        Forgets the reference, so that the next frame becomes the new one.
+        :return: None
+        """
+
+        self.__reference = None
+        self.__frames = 0
+
+    def match(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Matches the histograms of a frame to the reference ones; the first frame is returned as is, becoming the
+        reference.
+        :param frame: Frame to match (uint8, format: height x width x 3)
+        :return: Matched frame (uint8, same shape as frame)
+        """
+
+        histograms = [self.__histogram(frame, channel) for channel in range(frame.shape[-1])]
+        if self.__reference is None:
+            self.__reference = [self.__cdf(histogram) for histogram in histograms]
+            self.__frames = 1
+            return frame
+
+        # Source quantiles of every level are mapped to the reference level at the same quantile
+        matched_histograms = []
+        for channel, histogram in enumerate(histograms):
+            values, quantiles = self.__reference[channel]
+            source_quantiles = np.cumsum(histogram) / histogram.sum()
+            self.__lut[0, :, channel] = np.interp(source_quantiles, quantiles, values)
+            matched_histograms.append(np.bincount(self.__lut[0, :, channel], weights=histogram, minlength=LEVELS))
+        matched = cv.LUT(frame, self.__lut)
+
+        # Histograms of the matched frame follow from the lookup table, without reading the frame again
+        if self.__frames % self.__reference_interval == 0:
+            self.__reference = [self.__cdf(histogram) for histogram in matched_histograms]
+        self.__frames += 1
+
+        return matched
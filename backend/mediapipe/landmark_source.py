@@ -0,0 +1,140 @@
+"""
+This file contains the reading and writing of hand landmark coordinates produced by MediaPipe, and a frame source
+iterating over them.
+"""
+
+import struct
+import numpy as np
+import cv2 as cv
+
+from backend.mediapipe.frame_source import FrameSource
+from typing import Iterator, Tuple, List
+
+# Binary landmark files (see WriteLandmarks in demo_run_graph_main.cc)
+MAGIC = b"MPLM"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIfII")
+LANDMARKS_PER_HAND = 21
+
+# Landmark connections rendered by MediaPipe (see multi_hand_renderer_cpu.pbtxt)
+HAND_CONNECTIONS = [(0, 1), (1, 2), (2, 3), (3, 4),
+                    (0, 5), (5, 6), (6, 7), (7, 8),
+                    (5, 9), (9, 10), (10, 11), (11, 12),
+                    (9, 13), (13, 14), (14, 15), (15, 16),
+                    (13, 17), (0, 17), (17, 18), (18, 19), (19, 20)]
+CONNECTION_THICKNESS = 4
+
+
+class LandmarkFrameSource(FrameSource):
+
+    def __init__(self, hands: List[np.ndarray], fps: float, size: Tuple[int, int]):
+        """
+        Frame source over the hand landmarks of each frame of a video, instead of its pixels.
+        :param hands: List containing, for each frame, its normalized landmark coordinates (format: hands x landmarks x
+        3, i.e. x, y, z values in the range [0,1])
+        :param fps: Frames per second of the video
+        :param size: Resolution of the video (format: width x height)
+        :raises ValueError for empty lists of frames (also see: FrameSource)
+        """
+
+        if len(hands) == 0:
+            raise ValueError("The source must contain at least one frame.")
+
+        self.__hands = hands
+        self.__scale = np.array(size, dtype=np.float32)
+        super(LandmarkFrameSource, self).__init__(fps=fps,
+                                                  duration=len(hands) / fps,
+                                                  total_frames=len(hands),
+                                                  size=size)
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Iterates over the landmarks of each frame.
+        :return: Iterator over Tuples (frame index, landmark coordinates in pixels as np.ndarray, format: hands x
+        landmarks x 2)
+        """
+
+        for index, hands in enumerate(self.__hands):
+            yield index, hands[..., :2] * self.__scale
+
+    @staticmethod
+    def read(path: str) -> "LandmarkFrameSource":
+        """
+        Reads landmarks from a binary file written by MediaPipe, or from a NPZ file written by save_npz.
+        :param path: Path to the file
+        :return: LandmarkFrameSource over the landmarks in the file
+        :raises ValueError for invalid files
+        """
+
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                counts = data["counts"]
+                hands = np.split(data["landmarks"], np.cumsum(counts)[:-1])
+                return LandmarkFrameSource(hands, fps=float(data["fps"]), size=tuple(int(x) for x in data["size"]))
+
+        with open(path, "rb") as f:
+            contents = f.read()
+        magic, version, frames, landmarks, fps, width, height = HEADER.unpack_from(contents)
+        if magic != MAGIC or version != VERSION or landmarks != LANDMARKS_PER_HAND:
+            raise ValueError("Invalid landmark file.")
+
+        hands = []
+        offset = HEADER.size
+        for _ in range(frames):
+            count = struct.unpack_from("<I", contents, offset)[0]
+            offset += 4
+            values = count * landmarks * 3
+            hands.append(np.frombuffer(contents, dtype="<f4", count=values, offset=offset).reshape((count,
+                                                                                                 landmarks,
+                                                                                                 3)))
+            offset += values * 4
+
+        return LandmarkFrameSource(hands, fps=fps, size=(width, height))
+
+    def write(self, path: str) -> None:
+        """
+        Writes landmarks to a binary file, in the same format written by MediaPipe.
+        :param path: Path to the file
+        :return: None
+        """
+
+        width, height = self.size
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.__hands), LANDMARKS_PER_HAND, self.fps, width, height))
+            for hands in self.__hands:
+                f.write(struct.pack("<I", len(hands)))
+                f.write(np.ascontiguousarray(hands, dtype="<f4").tobytes())
+
+    def save_npz(self, path: str) -> None:
+        """
+        Writes landmarks to a compressed NPZ file.
+        :param path: Path to the file
+        :return: None
+        """
+
+        landmarks = np.concatenate(self.__hands).astype(np.float32) if len(self.__hands) > 0 else \
+            np.empty((0, LANDMARKS_PER_HAND, 3), dtype=np.float32)
+        np.savez_compressed(path,
+                            counts=np.array([len(hands) for hands in self.__hands], dtype=np.int32),
+                            landmarks=landmarks,
+                            fps=self.fps,
+                            size=np.array(self.size))
+
+
+def render_landmarks(hands: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Draws the connections between landmarks as MediaPipe does, on a black grayscale frame (i.e. the same frames
+    GestureIdentifier extracts from MediaPipe-produced videos).
+    :param hands: Landmark coordinates (format: hands x landmarks x 2, in pixels)
+    :param size: Resolution of the frame (format: width x height)
+    :return: Grayscale frame, landmark connections having value 255 (uint8)
+    """
+
+    frame = np.zeros((size[1], size[0]), dtype=np.uint8)
+    points = np.round(hands).astype(np.int32)
+    for hand in points:
+        for start, end in HAND_CONNECTIONS:
+            cv.line(frame, tuple(hand[start].tolist()), tuple(hand[end].tolist()), 255,
+                    thickness=CONNECTION_THICKNESS)
+
+    return frame
@@ -4,20 +4,63 @@ This file contains a Python wrapper to interact with a Google MediaPipe previous
 
 import os
 import json
+import shutil
+import hashlib
+import tempfile
+import subprocess
+import threading
+
+from backend.mediapipe.mediapipe_worker import MediaPipeWorker
+from backend.mediapipe.mediapipe_runner import MediaPipeRunner, MediaPipePool, MediaPipeRun
+from backend.mediapipe.output_cache import OutputCache, file_digest
+from backend.mediapipe.graph_config import GraphConfig
+from backend.mediapipe.frame_source import RawFrameSource
+from backend.mediapipe.bus_pipeline import MediaPipeBusAdapter
+from backend.recording.frame_ring import FrameRing
+from backend.recording.frame_bus import FrameBus
+from typing import Optional, List, Tuple, Dict
 
 # Global variables targeting the multi-hand tracking task in MediaPipe
 MEDIAPIPE_SUBPATH = "mediapipe/examples/desktop/multi_hand_tracking"
 TARGET = "multi_hand_tracking_cpu"
 COMPILE_STR = "bazel build -c opt --define MEDIAPIPE_DISABLE_GPU=1 {path}:{target}"
-EXEC_STR = "GLOG_logtostderr=1 {runnable} --calculator_graph_config_file={calculator}"
+SERVE_FLAG = "--serve"
+GRAPH_SUBPATH = "mediapipe/graphs/hand_tracking/multi_hand_tracking_desktop_live.pbtxt"
+GENERATED_GRAPHS_SUBPATH = "mediapipe/graphs/hand_tracking/generated"
+
+# Files replaced by the custom ones in data/mediapipe_custom (see the patch target of the Makefile)
+PATCHED_FILES = ["mediapipe/calculators/core/end_loop_calculator.h",
+                 "mediapipe/calculators/util/landmarks_to_render_data_calculator.cc",
+                 "mediapipe/examples/desktop/demo_run_graph_main.cc",
+                 GRAPH_SUBPATH,
+                 "mediapipe/graphs/hand_tracking/subgraphs/multi_hand_renderer_cpu.pbtxt"]
+
+# File storing the fingerprint of the last successful build, within the MediaPipe installation directory
+FINGERPRINT_FILE = ".{target}.fingerprint".format(target=TARGET)
 
 
 class MediaPipeHelper:
 
-    def __init__(self, mediapipe_dir: str):
+    def __init__(self, mediapipe_dir: str,
+                 force_build: bool = False,
+                 background_build: bool = False,
+                 persistent: bool = False,
+                 cache_dir: Optional[str] = None,
+                 cache_size: int = 2 << 30,
+                 graph_config: Optional[GraphConfig] = None):
         """
         Helper class to run Google MediaPipe from Python.
+        The multi-hand tracking binary is only built if it is missing or the patched files changed since its last build.
         :param mediapipe_dir: Absolute directory pointing to the installation directory of MediaPipe
+        :param force_build: Whether to build even if the binary is up to date (default: False)
+        :param background_build: Whether to build in a background thread, which run() waits for (default: False)
+        :param persistent: Whether to run videos through a long-lived MediaPipe process, started as soon as the binary
+        is built, which loads the graph only once (default: False, one process per video; see MediaPipeWorker)
+        :param cache_dir: Directory caching the outputs of run() and run_many(), so that videos already processed by
+        the same graph and binary skip MediaPipe (default: None, no cache; see OutputCache)
+        :param cache_size: Maximum total size of the cached outputs (in bytes, default: 2 GiB)
+        :param graph_config: Parameters of the graph to run, generated from its template and stored within the
+        MediaPipe installation directory once per configuration (default: None, the patched graph; see GraphConfig)
         :raises FileNotFoundError, ValueError, NotADirectoryError for invalid MediaPipe directory
         """
 
@@ -35,44 +78,425 @@ class MediaPipeHelper:
         self.__mediapipe_dir = mediapipe_dir
         self.__compile_str = COMPILE_STR.format(path=MEDIAPIPE_SUBPATH,
                                                 target=TARGET)
-        self.__exec_str = EXEC_STR.format(runnable=os.path.join(self.__mediapipe_dir,
-                                                                "bazel-bin",
-                                                                MEDIAPIPE_SUBPATH,
-                                                                TARGET),
-                                          calculator=os.path.join(self.__mediapipe_dir,
-                                                                  "mediapipe",
-                                                                  "graphs",
-                                                                  "hand_tracking",
-                                                                  "multi_hand_tracking_desktop_live.pbtxt"))
-
-        # Moving to the MediaPipe's working dir
-        curr_wd = os.getcwd()
-        os.chdir(self.__mediapipe_dir)
-        # Compiling MediaPipe's graph for multi-hand tracking
-        os.system(self.__compile_str)
-        # Restoring GesturePad's working dir
-        os.chdir(curr_wd)
-
-    def run(self, input_dir: str, output_dir: str) -> None:
-        """
-        Executes MediaPipe on the given input video exporting its results to the chosen path.
+        self.__binary_path = os.path.join(self.__mediapipe_dir, "bazel-bin", MEDIAPIPE_SUBPATH, TARGET)
+        if graph_config is None:
+            self.__graph_path = os.path.join(self.__mediapipe_dir, GRAPH_SUBPATH)
+            graph_flags = []
+            self.__frame_stride = 1
+        else:
+            self.__graph_path = graph_config.write_graph(os.path.join(self.__mediapipe_dir, GENERATED_GRAPHS_SUBPATH))
+            graph_flags = graph_config.command_flags()
+            self.__frame_stride = graph_config.frame_stride
+        self.__command = [self.__binary_path,
+                          "--calculator_graph_config_file={c}".format(c=self.__graph_path)] + graph_flags
+        self.__env = dict(os.environ, GLOG_logtostderr="1")
+        self.__runner = MediaPipeRunner(command=self.__command, cwd=self.__mediapipe_dir, env=self.__env)
+        self.__fingerprint_path = os.path.join(self.__mediapipe_dir, FINGERPRINT_FILE)
+        self.__build_thread: Optional[threading.Thread] = None
+        self.__build_error: Optional[Exception] = None
+        self.__worker: Optional[MediaPipeWorker] = None
+        self.__cache = OutputCache(cache_dir, max_size=cache_size) if cache_dir is not None else None
+        self.__binary_digest: Optional[Tuple[int, int, str]] = None
+        if persistent:
+            self.__worker = MediaPipeWorker(command=self.__command + [SERVE_FLAG],
+                                            cwd=self.__mediapipe_dir,
+                                            env=self.__env)
+
+        needs_build = force_build or not self.is_up_to_date()
+        if background_build:
+            self.__build_thread = threading.Thread(target=self.__background_build,
+                                                   args=(needs_build,),
+                                                   daemon=True)
+            self.__build_thread.start()
+        else:
+            if needs_build:
+                self.build()
+            self.__start_worker()
+
+    def fingerprint(self) -> str:
+        """
+        Computes the fingerprint of the sources of the multi-hand tracking binary, made of the build command and the
+        contents of the patched files (as installed in MediaPipe).
+        :return: Hexadecimal digest
+        """
+
+        digest = hashlib.sha256(self.__compile_str.encode())
+        for path in PATCHED_FILES:
+            digest.update(path.encode())
+            full_path = os.path.join(self.__mediapipe_dir, path)
+            if os.path.isfile(full_path):
+                with open(full_path, "rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+            else:
+                digest.update(b"missing")
+
+        return digest.hexdigest()
+
+    def output_fingerprint(self) -> str:
+        """
+        Computes the fingerprint of what determines MediaPipe outputs, made of the graph, its command line flags and the
+        binary (whose digest is only recomputed when it is rebuilt).
+        :return: Hexadecimal digest
+        """
+
+        status = os.stat(self.__binary_path)
+        if self.__binary_digest is None or self.__binary_digest[:2] != (status.st_mtime_ns, status.st_size):
+            self.__binary_digest = (status.st_mtime_ns, status.st_size, file_digest(self.__binary_path))
+
+        digest = hashlib.sha256(file_digest(self.__graph_path).encode())
+        digest.update(" ".join(self.__command[2:]).encode())
+        digest.update(self.__binary_digest[2].encode())
+        return digest.hexdigest()
+
+    def __cached_outputs(self, input_dir: str,
+                         output_dir: Optional[str] = None,
+                         landmarks_path: Optional[str] = None
+                         ) -> Dict[str, str]:
+        """
+        Computes the cache keys of the outputs requested from a run.
+        :param input_dir: Path to the input video
+        :param output_dir: Path to the output video (Optional)
+        :param landmarks_path: Path to the landmark coordinates file (Optional)
+        :return: Dict mapping the cache key of each requested output to its path (empty if there is no cache)
+        """
+
+        if self.__cache is None:
+            return {}
+
+        fingerprint = self.output_fingerprint()
+        outputs = {}
+        if output_dir is not None:
+            outputs[self.__cache.key(input_dir, fingerprint, "video")] = output_dir
+        if landmarks_path is not None:
+            outputs[self.__cache.key(input_dir, fingerprint, "landmarks")] = landmarks_path
+        return outputs
+
+    def __store_outputs(self, outputs: Dict[str, str]) -> None:
+        """
+        Stores the outputs of a successful run in the cache, unless any of them is missing or empty (so that truncated
+        outputs are never served as hits).
+        :param outputs: Dict mapping the cache key of each output to its path (see __cached_outputs)
+        :return: None
+        """
+
+        if not all(os.path.isfile(path) and os.path.getsize(path) > 0 for path in outputs.values()):
+            return
+        for key, path in outputs.items():
+            self.__cache.put(key, path)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Returns the statistics of the output cache, counting one hit or miss per run.
+        :return: Dict with the number of hits, misses and evictions (empty if there is no cache)
+        """
+
+        return dict(self.__cache.stats) if self.__cache is not None else {}
+
+    def is_up_to_date(self) -> bool:
+        """
+        Checks whether the multi-hand tracking binary exists and was built from the current sources.
+        :return: True if no build is needed, False otherwise
+        """
+
+        if not os.path.isfile(self.__binary_path) or not os.path.isfile(self.__fingerprint_path):
+            return False
+
+        with open(self.__fingerprint_path) as f:
+            return f.read().strip() == self.fingerprint()
+
+    def build(self) -> None:
+        """
+        Builds the multi-hand tracking binary, recording its fingerprint if the build succeeds.
+        :return: None
+        :raises RuntimeError if the build fails
+        """
+
+        # The fingerprint is computed first, so that files changed during the build trigger the next one
+        fingerprint = self.fingerprint()
+
+        # Compiling MediaPipe's graph for multi-hand tracking within MediaPipe's working dir
+        result = subprocess.run(self.__compile_str, shell=True, cwd=self.__mediapipe_dir)
+        if result.returncode != 0 or not os.path.isfile(self.__binary_path):
+            raise RuntimeError("MediaPipe build failed (exit code {c}).".format(c=result.returncode))
+
+        with open(self.__fingerprint_path, "w") as f:
+            f.write(fingerprint)
+
+    def __background_build(self, needs_build: bool) -> None:
+        """
+        Builds the multi-hand tracking binary (if needed) and starts the persistent worker, keeping any error for
+        wait_build (runs in the build thread).
+        :param needs_build: Whether the binary has to be built
+        :return: None
+        """
+
+        try:
+            if needs_build:
+                self.build()
+            self.__start_worker()
+        except Exception as e:
+            self.__build_error = e
+
+    def __start_worker(self) -> None:
+        """
+        Starts the persistent worker (if any), falling back to one process per video if it cannot be started (e.g.
+        binaries built before the --serve flag was introduced).
+        :return: None
+        """
+
+        if self.__worker is not None:
+            try:
+                self.__worker.start()
+            except RuntimeError:
+                self.__worker = None
+
+    def wait_build(self) -> None:
+        """
+        Waits for the background build to complete, if any.
+        :return: None
+        :raises RuntimeError if the background build failed
+        """
+
+        if self.__build_thread is not None:
+            self.__build_thread.join()
+            self.__build_thread = None
+            if self.__build_error is not None:
+                error, self.__build_error = self.__build_error, None
+                raise error
+
+    def run(self, input_dir: str,
+            output_dir: Optional[str] = None,
+            landmarks_path: Optional[str] = None,
+            timeout: Optional[float] = None
+            ) -> None:
+        """
+        Executes MediaPipe on the given input video exporting its results to the chosen path, or copies them from the
+        output cache (if any) when the video was already processed.
         :param input_dir: Path to the input video
-        :param output_dir: Path to the output video to produce
+        :param output_dir: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional, see LandmarkFrameSource)
+        :param timeout: Maximum processing time (in seconds, default: None, no limit); MediaPipe is killed on expiry
+        :return: None
+        :raises RuntimeError, TimeoutError if the background build failed, MediaPipe cannot process the video or the
+        timeout expires
+        """
+
+        self.wait_build()
+        outputs = self.__cached_outputs(input_dir, output_dir, landmarks_path)
+        if len(outputs) > 0 and self.__cache.get(outputs):
+            return
+
+        if self.__worker is not None:
+            self.__worker.process(input_path=input_dir,
+                                  output_path=output_dir,
+                                  timeout=timeout,
+                                  landmarks_output_path=landmarks_path)
+        else:
+            # Each process runs within MediaPipe's working dir, leaving GesturePad's one untouched
+            self.__runner.run(input_dir, output_path=output_dir, landmarks_path=landmarks_path, timeout=timeout)
+        self.__store_outputs(outputs)
+
+    def run_many(self, jobs: List[Tuple[str, Optional[str], Optional[str]]],
+                 concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None
+                 ) -> List[Optional[Exception]]:
+        """
+        Executes MediaPipe on several videos, running up to concurrency processes at the same time (e.g. to reprocess
+        past sessions). The persistent worker, if any, is not used, since it processes one video at a time; videos whose
+        outputs are cached are not processed at all.
+        :param jobs: List of tuples (input video path, output video path, landmark coordinates file path), the last two
+        being Optional
+        :param concurrency: Maximum number of videos processed at the same time (default: None, the number of CPUs)
+        :param timeout: Maximum processing time of each video (in seconds, default: None, no limit)
+        :return: List containing, for each job, None if it succeeded or the exception raised otherwise
+        :raises RuntimeError if the background build failed
+        """
+
+        self.wait_build()
+        errors: List[Optional[Exception]] = [None] * len(jobs)
+        pending = []
+        for i, (input_dir, output_dir, landmarks_path) in enumerate(jobs):
+            try:
+                outputs = self.__cached_outputs(input_dir, output_dir, landmarks_path)
+            except OSError as e:
+                errors[i] = e
+                continue
+            if len(outputs) == 0 or not self.__cache.get(outputs):
+                pending.append((i, outputs))
+
+        with self.pool(concurrency) as pool:
+            pending_errors = pool.map([jobs[i] for i, _ in pending], timeout=timeout)
+        for (i, outputs), error in zip(pending, pending_errors):
+            errors[i] = error
+            if error is None:
+                self.__store_outputs(outputs)
+
+        return errors
+
+    def pool(self, concurrency: Optional[int] = None) -> MediaPipePool:
+        """
+        Creates a bounded pool of MediaPipe processes, whose queued and running videos can be cancelled.
+        :param concurrency: Maximum number of videos processed at the same time (default: None, the number of CPUs)
+        :return: MediaPipePool (to be closed by the caller, e.g. through a with statement)
+        """
+
+        return MediaPipePool(self.__runner, max_concurrent=concurrency)
+
+    def stream(self, input_dir: str, output_dir: Optional[str] = None) -> RawFrameSource:
+        """
+        Executes MediaPipe on the given input video, streaming its rendered frames instead of encoding them.
+        :param input_dir: Path to the input video
+        :param output_dir: Path to the output video to produce as well, e.g. for debugging (Optional)
+        :return: RawFrameSource over the rendered frames (closing it waits for MediaPipe to exit)
+        :raises RuntimeError if the background build failed or MediaPipe cannot process the video
+        """
+
+        self.wait_build()
+        if self.__worker is not None:
+            return self.__stream_from_worker(input_dir, output_dir)
+
+        run = self.__runner.start(input_dir, output_path=output_dir, raw_output_path="-", stdout=subprocess.PIPE)
+        return RawFrameSource(run.stdout, on_close=run.wait)
+
+    @staticmethod
+    def __feed(run: MediaPipeRun, frames: FrameRing, fps: float) -> threading.Thread:
+        """
+        Writes frames to the standard input of a MediaPipe process in a dedicated thread, so that a process which stops
+        reading (e.g. cancelled on timeout) never blocks the caller.
+        :param run: MediaPipeRun handle of a process started with raw_input_path='-' and stdin=subprocess.PIPE
+        :param frames: FrameRing to write
+        :param fps: Frames per second of the frames
+        :return: Thread writing the frames
+        """
+
+        def feed() -> None:
+            try:
+                frames.write_raw(run.stdin, fps)
+                run.stdin.close()
+            except OSError:
+                # The process exited before reading every frame, which its exit code reports
+                pass
+
+        thread = threading.Thread(target=feed, daemon=True)
+        thread.start()
+        return thread
+
+    def run_frames(self, frames: FrameRing,
+                   fps: float,
+                   output_dir: Optional[str] = None,
+                   landmarks_path: Optional[str] = None,
+                   timeout: Optional[float] = None
+                   ) -> None:
+        """
+        Executes MediaPipe on frames kept in memory, piping them as raw frames instead of encoding a video. A process
+        is started for the frames even if a persistent worker is running (its standard input carries requests), and the
+        output cache is not used (outputs are addressed by input files).
+        :param frames: FrameRing holding the frames, from the oldest to the newest one
+        :param fps: Frames per second of the frames
+        :param output_dir: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional, see LandmarkFrameSource)
+        :param timeout: Maximum processing time (in seconds, default: None, no limit); MediaPipe is killed on expiry
         :return: None
+        :raises RuntimeError, TimeoutError if the background build failed, MediaPipe cannot process the frames (e.g.
+        built without the --raw_input_path flag) or the timeout expires
+        """
+
+        self.wait_build()
+        run = self.__runner.start(None, output_path=output_dir, landmarks_path=landmarks_path,
+                                  raw_input_path="-", stdin=subprocess.PIPE)
+        feeder = self.__feed(run, frames, fps)
+        run.wait(timeout)
+        feeder.join()
+
+    def stream_frames(self, frames: FrameRing, fps: float, output_dir: Optional[str] = None) -> RawFrameSource:
+        """
+        Executes MediaPipe on frames kept in memory, streaming its rendered frames: frames are neither encoded nor
+        decoded at any stage (see run_frames).
+        :param frames: FrameRing holding the frames, from the oldest to the newest one
+        :param fps: Frames per second of the frames
+        :param output_dir: Path to the output video to produce as well, e.g. for debugging (Optional)
+        :return: RawFrameSource over the rendered frames (closing it waits for MediaPipe to exit)
+        :raises RuntimeError if the background build failed or MediaPipe cannot process the frames
+        """
+
+        self.wait_build()
+        run = self.__runner.start(None, output_path=output_dir, raw_output_path="-", stdout=subprocess.PIPE,
+                                  raw_input_path="-", stdin=subprocess.PIPE)
+        feeder = self.__feed(run, frames, fps)
+
+        def wait() -> None:
+            try:
+                run.wait()
+            finally:
+                feeder.join()
+
+        return RawFrameSource(run.stdout, on_close=wait)
+
+    def stream_bus(self, input_bus: FrameBus, output_bus: FrameBus, fps: float) -> MediaPipeBusAdapter:
+        """
+        Executes MediaPipe on frames as they are published on a bus, publishing its rendered frames on another bus (see
+        BusPipeline). As for run_frames, a process is started even if a persistent worker is running.
+        :param input_bus: FrameBus of the frames to process (MediaPipe is its consumer)
+        :param output_bus: FrameBus of the rendered frames (MediaPipe is its producer)
+        :param fps: Frames per second of the frames to process
+        :return: MediaPipeBusAdapter moving frames between the buses and MediaPipe
+        :raises RuntimeError if the background build failed
         """
 
-        command = "{exec} --input_video_path={input_dir} --output_video_path={output_dir}"
-        command = command.format(exec=self.__exec_str,
-                                 input_dir=input_dir,
-                                 output_dir=output_dir)
+        self.wait_build()
+        run = self.__runner.start(None, raw_output_path="-", stdout=subprocess.PIPE,
+                                  raw_input_path="-", stdin=subprocess.PIPE)
+        return MediaPipeBusAdapter(run, input_bus, output_bus, fps=fps, frame_stride=self.__frame_stride)
+
+    def __stream_from_worker(self, input_dir: str, output_dir: Optional[str] = None) -> RawFrameSource:
+        """
+        Streams the rendered frames of a video from the persistent worker, through a FIFO.
+        :param input_dir: Path to the input video
+        :param output_dir: Path to the output video to produce as well (Optional)
+        :return: RawFrameSource over the rendered frames
+        :raises RuntimeError if the worker cannot process the video
+        """
+
+        fifo_dir = tempfile.mkdtemp(prefix="mediapipe_")
+        fifo_path = os.path.join(fifo_dir, "frames")
+        os.mkfifo(fifo_path)
+        errors: List[Exception] = []
+        reader_closed = threading.Event()
+
+        def process() -> None:
+            try:
+                self.__worker.process(input_path=input_dir, output_path=output_dir, raw_output_path=fifo_path)
+            except Exception as e:
+                errors.append(e)
+                # The worker may have failed before opening the FIFO: opening it unblocks the reader, which gets EOF
+                while not reader_closed.is_set():
+                    try:
+                        os.close(os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+                        break
+                    except OSError:
+                        # No reader yet
+                        reader_closed.wait(0.05)
+
+        thread = threading.Thread(target=process, daemon=True)
+        thread.start()
+
+        def wait() -> None:
+            reader_closed.set()
+            thread.join()
+            shutil.rmtree(fifo_dir, ignore_errors=True)
+            if len(errors) > 0:
+                raise RuntimeError("MediaPipe cannot process the video: {e}".format(e=errors[0]))
+
+        return RawFrameSource(open(fifo_path, "rb"), on_close=wait)
+
+    def close(self) -> None:
+        """
+        Stops the persistent worker, if any.
+        :return: None
+        """
 
-        # Moving to the MediaPipe's working dir
-        curr_wd = os.getcwd()
-        os.chdir(self.__mediapipe_dir)
-        # Compiling MediaPipe's graph for multi-hand tracking
-        os.system(command)
-        # Restoring GesturePad's working dir
-        os.chdir(curr_wd)
+        if self.__worker is not None:
+            self.__worker.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,317 @@
+"""
+This file contains the execution of Google MediaPipe as child processes, each one with its own working directory, so
+that several videos can be processed at the same time.
+"""
+
+import os
+import argparse
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from typing import List, Optional, Tuple, Dict
+
+# Time given to a cancelled process to exit before killing it (in seconds)
+TERMINATE_GRACE = 2.0
+
+
+class MediaPipeRun:
+
+    def __init__(self, process: subprocess.Popen):
+        """
+        Handle of a MediaPipe process running on a video.
+        :param process: Child process running MediaPipe
+        """
+
+        self.__process = process
+        self.__cancelled = False
+
+    @property
+    def stdin(self):
+        """
+        Standard input of the process, if it was started with stdin=subprocess.PIPE (None otherwise).
+        """
+
+        return self.__process.stdin
+
+    @property
+    def stdout(self):
+        """
+        Standard output of the process, if it was started with stdout=subprocess.PIPE (None otherwise).
+        """
+
+        return self.__process.stdout
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """
+        Exit code of the process, or None if it is still running.
+        """
+
+        return self.__process.poll()
+
+    def done(self) -> bool:
+        """
+        Checks whether the process exited.
+        :return: True if the process exited, False otherwise
+        """
+
+        return self.__process.poll() is not None
+
+    def cancelled(self) -> bool:
+        """
+        Checks whether the process was cancelled.
+        :return: True if cancel() was called, False otherwise
+        """
+
+        return self.__cancelled
+
+    def cancel(self) -> None:
+        """
+        Stops the process, killing it if it does not exit within TERMINATE_GRACE seconds.
+        :return: None
+        """
+
+        self.__cancelled = True
+        if self.__process.poll() is None:
+            self.__process.terminate()
+            try:
+                self.__process.wait(timeout=TERMINATE_GRACE)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+                self.__process.wait()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for the process to exit successfully, cancelling it if the timeout expires.
+        :param timeout: Maximum time to wait (in seconds, default: None, no limit)
+        :return: None
+        :raises TimeoutError, RuntimeError if the timeout expires, the process was cancelled or it failed
+        """
+
+        try:
+            code = self.__process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.cancel()
+            raise TimeoutError("MediaPipe did not process the video within {t} seconds.".format(t=timeout))
+
+        if self.__cancelled:
+            raise RuntimeError("MediaPipe was cancelled.")
+        elif code != 0:
+            raise RuntimeError("MediaPipe exited with code {c}.".format(c=code))
+
+
+class MediaPipeRunner:
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None, env: Optional[dict] = None):
+        """
+        Starts MediaPipe processes on single videos, never changing the working directory of the Python process.
+        :param command: Command running MediaPipe (i.e. its binary along with the graph to run)
+        :param cwd: Working directory of every process (default: None, the current one)
+        :param env: Environment of every process (default: None, the current one)
+        """
+
+        self.__command = command
+        self.__cwd = cwd
+        self.__env = env
+
+    def start(self, input_path: Optional[str],
+              output_path: Optional[str] = None,
+              landmarks_path: Optional[str] = None,
+              raw_output_path: Optional[str] = None,
+              stdout: Optional[int] = None,
+              raw_input_path: Optional[str] = None,
+              stdin: Optional[int] = None
+              ) -> MediaPipeRun:
+        """
+        Starts MediaPipe on a video, without waiting for it.
+        :param input_path: Path to the input video (ignored if raw_input_path is provided)
+        :param output_path: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional, see LandmarkFrameSource)
+        :param raw_output_path: Path where to stream raw rendered frames, '-' for stdout (Optional, see RawFrameSource)
+        :param stdout: Standard output of the process, as in subprocess.Popen (default: None, inherited)
+        :param raw_input_path: Path where to read raw input frames from, '-' for stdin, instead of a video (Optional,
+        see FrameRing.write_raw)
+        :param stdin: Standard input of the process, as in subprocess.Popen (default: None, inherited)
+        :return: MediaPipeRun handle of the process
+        :raises OSError if the process cannot be started
+        """
+
+        if raw_input_path is not None:
+            command = self.__command + ["--raw_input_path={r}".format(r=raw_input_path)]
+        else:
+            command = self.__command + ["--input_video_path={i}".format(i=input_path)]
+        if output_path is not None:
+            command.append("--output_video_path={o}".format(o=output_path))
+        if landmarks_path is not None:
+            command.append("--landmarks_output_path={l}".format(l=landmarks_path))
+        if raw_output_path is not None:
+            command.append("--raw_output_path={r}".format(r=raw_output_path))
+
+        return MediaPipeRun(subprocess.Popen(command, cwd=self.__cwd, env=self.__env, stdin=stdin, stdout=stdout))
+
+    def run(self, input_path: str,
+            output_path: Optional[str] = None,
+            landmarks_path: Optional[str] = None,
+            timeout: Optional[float] = None
+            ) -> None:
+        """
+        Runs MediaPipe on a video, waiting for it to complete.
+        :param input_path: Path to the input video
+        :param output_path: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional, see LandmarkFrameSource)
+        :param timeout: Maximum processing time (in seconds, default: None, no limit); the process is killed on expiry
+        :return: None
+        :raises TimeoutError, RuntimeError, OSError if the timeout expires or MediaPipe fails
+        """
+
+        self.start(input_path, output_path=output_path, landmarks_path=landmarks_path).wait(timeout)
+
+
+class MediaPipePool:
+
+    def __init__(self, runner: MediaPipeRunner, max_concurrent: Optional[int] = None):
+        """
+        Bounded pool running MediaPipe on several videos at the same time, one process per video.
+        :param runner: MediaPipeRunner starting the processes
+        :param max_concurrent: Maximum number of processes running at the same time (default: None, the number of CPUs)
+        :raises ValueError for invalid max_concurrent values
+        """
+
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("At least one concurrent process is required.")
+
+        self.__runner = runner
+        self.__executor = ThreadPoolExecutor(max_workers=max_concurrent or os.cpu_count() or 1)
+        self.__running: Dict[int, MediaPipeRun] = {}
+        # Futures of the submitted videos not processed yet, cancelled on close
+        self.__futures: Dict[int, Future] = {}
+        self.__job_ids = itertools.count()
+        self.__lock = threading.Lock()
+        self.__cancelled = False
+
+    def __run(self, job_id: int,
+              input_path: str,
+              output_path: Optional[str],
+              landmarks_path: Optional[str],
+              timeout: Optional[float]
+              ) -> None:
+        """
+        Runs MediaPipe on a video, keeping track of its process so that it can be cancelled (runs in a pool thread).
+        :param job_id: Identifier of the job
+        :param input_path: Path to the input video
+        :param output_path: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional)
+        :param timeout: Maximum processing time (in seconds, None for no limit)
+        :return: None
+        :raises TimeoutError, RuntimeError, OSError if the timeout expires, the pool was cancelled or MediaPipe fails
+        """
+
+        with self.__lock:
+            if self.__cancelled:
+                raise RuntimeError("MediaPipe was cancelled.")
+            run = self.__runner.start(input_path, output_path=output_path, landmarks_path=landmarks_path)
+            self.__running[job_id] = run
+        try:
+            run.wait(timeout)
+        finally:
+            with self.__lock:
+                del self.__running[job_id]
+
+    def submit(self, input_path: str,
+               output_path: Optional[str] = None,
+               landmarks_path: Optional[str] = None,
+               timeout: Optional[float] = None
+               ) -> Future:
+        """
+        Queues a video, which starts being processed as soon as fewer than max_concurrent processes are running.
+        :param input_path: Path to the input video
+        :param output_path: Path to the output video to produce (Optional)
+        :param landmarks_path: Path to the landmark coordinates file to produce (Optional, see LandmarkFrameSource)
+        :param timeout: Maximum processing time, not counting the time spent in queue (in seconds, default: None, no
+        limit)
+        :return: Future completing once the video is processed (its result is None, see MediaPipeRunner.run for errors)
+        """
+
+        job_id = next(self.__job_ids)
+        future = self.__executor.submit(self.__run, job_id, input_path, output_path, landmarks_path, timeout)
+        with self.__lock:
+            self.__futures[job_id] = future
+        future.add_done_callback(lambda _: self.__forget(job_id))
+        return future
+
+    def __forget(self, job_id: int) -> None:
+        """
+        Stops keeping track of the future of a video, once processed or cancelled.
+        :param job_id: Identifier of the job
+        :return: None
+        """
+
+        with self.__lock:
+            self.__futures.pop(job_id, None)
+
+    def map(self, jobs: List[Tuple[str, Optional[str], Optional[str]]],
+            timeout: Optional[float] = None
+            ) -> List[Optional[Exception]]:
+        """
+        Processes several videos, waiting for all of them.
+        :param jobs: List of tuples (input path, output path, landmarks path), the last two being Optional
+        :param timeout: Maximum processing time of each video (in seconds, default: None, no limit)
+        :return: List containing, for each job, None if it succeeded or the exception raised otherwise
+        """
+
+        futures = [self.submit(input_path, output_path, landmarks_path, timeout)
+                   for input_path, output_path, landmarks_path in jobs]
+        return [future.exception() for future in futures]
+
+    def cancel(self) -> None:
+        """
+        Cancels queued videos and stops the running processes.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__cancelled = True
+            running = list(self.__running.values())
+        for run in running:
+            run.cancel()
+
+    def close(self, cancel: bool = False) -> None:
+        """
+        Shuts the pool down, waiting for the submitted videos to be processed.
+        :param cancel: Whether to cancel queued and running videos instead (default: False)
+        :return: None
+        """
+
+        if cancel:
+            with self.__lock:
+                futures = list(self.__futures.values())
+            # Queued videos never start, while running ones are stopped
+            for future in futures:
+                future.cancel()
+            self.cancel()
+        self.__executor.shutdown(wait=True)
+
+    def __enter__(self) -> "MediaPipePool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close(cancel=exc_type is not None)
+
+
+if __name__ == '__main__':
+    from backend.mediapipe.mediapipe_helper import MediaPipeHelper
+
+    parser = argparse.ArgumentParser("Batch MediaPipe processing.")
+    parser.add_argument("mediapipe_dir", type=str, help="MediaPipe installation directory (absolute path)")
+    parser.add_argument("videos", type=str, nargs="+", help="Videos to process")
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of videos processed at the same time")
+    parser.add_argument("--timeout", type=float, default=None, help="Maximum processing time of each video")
+    args = parser.parse_args()
+
+    helper = MediaPipeHelper(mediapipe_dir=args.mediapipe_dir)
+    batch = [(os.path.abspath(video), "{n}_mp.mp4".format(n=os.path.splitext(os.path.abspath(video))[0]), None)
+             for video in args.videos]
+    for (video, _, _), error in zip(batch, helper.run_many(batch, concurrency=args.concurrency, timeout=args.timeout)):
+        print("{v}: {r}".format(v=video, r="OK" if error is None else error))
@@ -0,0 +1,249 @@
+"""
+This file contains a client for a long-lived Google MediaPipe process, which loads its graph once and then processes
+the videos it is sent.
+"""
+
+import queue
+import threading
+import subprocess
+
+from typing import List, Optional
+
+# Lines of the protocol spoken over the worker's stdin/stdout (see demo_run_graph_main.cc, --serve flag)
+READY = "READY"
+PING = "PING"
+PONG = "PONG"
+QUIT = "QUIT"
+RUN = "RUN {input}\t{output}\t{raw_output}\t{landmarks_output}"
+DONE = "DONE"
+ERROR = "ERROR"
+
+
+class MediaPipeWorker:
+
+    def __init__(self, command: List[str],
+                 cwd: Optional[str] = None,
+                 env: Optional[dict] = None,
+                 start_timeout: float = 60.0,
+                 ping_timeout: float = 5.0,
+                 max_restarts: int = 3):
+        """
+        Client for a persistent MediaPipe process, started lazily and restarted whenever it dies or stops answering.
+        :param command: Command starting the worker (e.g. the MediaPipe binary along with the --serve flag)
+        :param cwd: Working directory of the worker (default: None, the current one)
+        :param env: Environment of the worker (default: None, the current one)
+        :param start_timeout: Maximum time to wait for the worker to load its graph (in seconds, default: 60)
+        :param ping_timeout: Maximum time to wait for a health check reply (in seconds, default: 5)
+        :param max_restarts: Maximum number of consecutive restarts before giving up (default: 3)
+        """
+
+        self.__command = command
+        self.__cwd = cwd
+        self.__env = env
+        self.__start_timeout = start_timeout
+        self.__ping_timeout = ping_timeout
+        self.__max_restarts = max_restarts
+        self.__process: Optional[subprocess.Popen] = None
+        self.__replies: Optional[queue.Queue] = None
+        self.__lock = threading.Lock()
+        self.restarts = 0
+
+    @staticmethod
+    def __read_replies(stdout, replies: queue.Queue) -> None:
+        """
+        Forwards the lines written by the worker to a queue, followed by None once the worker exits (runs in a thread).
+        :param stdout: Standard output of the worker
+        :param replies: Queue of replies
+        :return: None
+        """
+
+        for line in stdout:
+            replies.put(line.rstrip("\n"))
+        replies.put(None)
+
+    def __reply(self, timeout: Optional[float]) -> str:
+        """
+        Waits for the next reply of the worker.
+        :param timeout: Maximum time to wait (in seconds, None to wait indefinitely)
+        :return: Reply line
+        :raises TimeoutError, RuntimeError if the worker does not reply in time or exits
+        """
+
+        try:
+            reply = self.__replies.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("MediaPipe worker did not reply in time.")
+        if reply is None:
+            raise RuntimeError("MediaPipe worker exited (exit code {c}).".format(c=self.__process.wait()))
+        return reply
+
+    def __send(self, line: str) -> None:
+        """
+        Sends a line to the worker.
+        :param line: Line to send
+        :return: None
+        :raises RuntimeError if the worker exited
+        """
+
+        try:
+            self.__process.stdin.write(line + "\n")
+            self.__process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise RuntimeError("MediaPipe worker exited (exit code {c}).".format(c=self.__process.wait()))
+
+    def __start(self) -> None:
+        """
+        Starts the worker, waiting for its graph to be loaded.
+        :return: None
+        :raises TimeoutError, RuntimeError if the worker does not become ready
+        """
+
+        self.__process = subprocess.Popen(self.__command,
+                                          cwd=self.__cwd,
+                                          env=self.__env,
+                                          stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE,
+                                          universal_newlines=True,
+                                          bufsize=1)
+        self.__replies = queue.Queue()
+        threading.Thread(target=self.__read_replies, args=(self.__process.stdout, self.__replies), daemon=True).start()
+
+        try:
+            reply = self.__reply(self.__start_timeout)
+            if reply != READY:
+                raise RuntimeError("Unexpected reply from MediaPipe worker: {r}".format(r=reply))
+        except (TimeoutError, RuntimeError):
+            self.__kill()
+            raise
+
+    def __kill(self) -> None:
+        """
+        Kills the worker, if running.
+        :return: None
+        """
+
+        if self.__process is not None:
+            if self.__process.poll() is None:
+                self.__process.kill()
+            self.__process.wait()
+            self.__process = None
+
+    def is_alive(self) -> bool:
+        """
+        Checks whether the worker process is running (without checking whether it answers).
+        :return: True if running, False otherwise
+        """
+
+        return self.__process is not None and self.__process.poll() is None
+
+    def health_check(self) -> bool:
+        """
+        Checks whether the worker answers to a ping within ping_timeout.
+        :return: True if healthy, False otherwise
+        """
+
+        with self.__lock:
+            return self.__ping()
+
+    def __ping(self) -> bool:
+        """
+        Pings the worker (the lock must be held).
+        :return: True if the worker replied in time, False otherwise
+        """
+
+        if not self.is_alive():
+            return False
+        try:
+            self.__send(PING)
+            return self.__reply(self.__ping_timeout) == PONG
+        except (TimeoutError, RuntimeError):
+            return False
+
+    def __ensure_healthy(self) -> None:
+        """
+        Starts the worker if it is not running, or restarts it if it does not answer to a health check.
+        :return: None
+        :raises RuntimeError if the worker cannot be started within max_restarts attempts
+        """
+
+        if self.__ping():
+            return
+
+        error = None
+        for _ in range(self.__max_restarts + 1):
+            if self.__process is not None:
+                self.__kill()
+                self.restarts += 1
+            try:
+                self.__start()
+                return
+            except (TimeoutError, RuntimeError, OSError) as e:
+                error = e
+        raise RuntimeError("MediaPipe worker cannot be started: {e}".format(e=error))
+
+    def start(self) -> None:
+        """
+        Starts the worker ahead of the first video, so that its graph is loaded before it is needed.
+        :return: None
+        :raises RuntimeError if the worker cannot be started
+        """
+
+        with self.__lock:
+            self.__ensure_healthy()
+
+    def process(self, input_path: str,
+                output_path: Optional[str] = None,
+                timeout: Optional[float] = None,
+                raw_output_path: Optional[str] = None,
+                landmarks_output_path: Optional[str] = None
+                ) -> int:
+        """
+        Runs MediaPipe on a video, restarting the worker (and retrying once, unless frames are streamed) if it dies while
+        processing it.
+        :param input_path: Path to the input video
+        :param output_path: Path to the output video to produce (Optional)
+        :param timeout: Maximum processing time (in seconds, default: None, no limit); the worker is killed on expiry
+        :param raw_output_path: Path to a FIFO where to stream raw rendered frames (Optional, see RawFrameSource)
+        :param landmarks_output_path: Path to the landmark coordinates file to produce (Optional, see
+        LandmarkFrameSource)
+        :return: Number of frames processed
+        :raises RuntimeError, TimeoutError if the video cannot be processed or the timeout expires
+        """
+
+        with self.__lock:
+            for attempt in range(2):
+                self.__ensure_healthy()
+                try:
+                    self.__send(RUN.format(input=input_path,
+                                           output=output_path or "",
+                                           raw_output=raw_output_path or "",
+                                           landmarks_output=landmarks_output_path or ""))
+                    reply = self.__reply(timeout)
+                except TimeoutError:
+                    self.__kill()
+                    raise
+                except RuntimeError:
+                    # The worker died while processing the video (frames already streamed cannot be taken back)
+                    if attempt == 1 or raw_output_path:
+                        raise
+                    continue
+
+                if reply.startswith(DONE):
+                    return int(reply[len(DONE):])
+                raise RuntimeError("MediaPipe worker failed: {r}".format(r=reply[len(ERROR):].strip()))
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Asks the worker to exit, killing it if it does not within the given time.
+        :param timeout: Maximum time to wait for the worker to exit (in seconds, default: 5)
+        :return: None
+        """
+
+        with self.__lock:
+            if self.is_alive():
+                try:
+                    self.__send(QUIT)
+                    self.__process.wait(timeout=timeout)
+                except (RuntimeError, subprocess.TimeoutExpired):
+                    pass
+            self.__kill()
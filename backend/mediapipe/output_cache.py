@@ -0,0 +1,187 @@
+"""
+This file contains a content-addressed on-disk cache of the files produced by Google MediaPipe, so that the same
+video is never processed twice by the same graph and binary.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from typing import Dict, List, Tuple
+
+# Size of the blocks read when hashing files (in bytes)
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(path: str) -> str:
+    """
+    Computes the SHA-256 digest of the contents of a file.
+    :param path: Path to the file
+    :return: Hexadecimal digest
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class OutputCache:
+
+    def __init__(self, cache_dir: str, max_size: int = 2 << 30):
+        """
+        On-disk cache of MediaPipe outputs, addressed by the contents of their input video and by the fingerprint of
+        what produced them. The least recently used entries are evicted once the cache exceeds max_size.
+        :param cache_dir: Directory storing the cache entries (created if missing)
+        :param max_size: Maximum total size of the entries (in bytes, default: 2 GiB)
+        :raises ValueError for invalid max_size values
+        """
+
+        if max_size <= 0:
+            raise ValueError("The cache size must be positive.")
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__cache_dir = cache_dir
+        self.__max_size = max_size
+        self.__lock = threading.Lock()
+        self.__input_digests: Dict[Tuple[str, int, int], str] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, input_path: str, fingerprint: str, kind: str) -> str:
+        """
+        Computes the key of an output, hashing its input video (the digest of each file is computed once, as long as it
+        is not modified).
+        :param input_path: Path to the input video
+        :param fingerprint: Fingerprint of the graph and binary producing the output
+        :param kind: Kind of output (e.g. 'video' or 'landmarks')
+        :return: Hexadecimal key
+        """
+
+        status = os.stat(input_path)
+        file_id = (os.path.abspath(input_path), status.st_mtime_ns, status.st_size)
+        with self.__lock:
+            input_digest = self.__input_digests.get(file_id)
+        if input_digest is None:
+            input_digest = file_digest(input_path)
+            with self.__lock:
+                self.__input_digests[file_id] = input_digest
+
+        return hashlib.sha256("{i}\n{f}\n{k}".format(i=input_digest, f=fingerprint, k=kind).encode()).hexdigest()
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self.__cache_dir, key)
+
+    def get(self, outputs: Dict[str, str]) -> bool:
+        """
+        Copies the outputs of a single MediaPipe run to their paths, only if all of them are cached (a run producing
+        several outputs counts as a single hit or miss).
+        :param outputs: Dict mapping the key of each output (see key) to the path where to copy it
+        :return: True on cache hit, False otherwise
+        """
+
+        try:
+            if not all(self.contains(key) for key in outputs):
+                raise FileNotFoundError()
+            for key, destination in outputs.items():
+                shutil.copyfile(self.__entry_path(key), destination)
+                os.utime(self.__entry_path(key))
+        except FileNotFoundError:
+            # Also covers entries evicted in the meantime
+            with self.__lock:
+                self.stats["misses"] += 1
+            return False
+
+        with self.__lock:
+            self.stats["hits"] += 1
+        return True
+
+    def contains(self, key: str) -> bool:
+        """
+        Checks whether an output is cached, without counting it as a hit or a miss.
+        :param key: Key of the output (see key)
+        :return: True if cached, False otherwise
+        """
+
+        return os.path.isfile(self.__entry_path(key))
+
+    def put(self, key: str, source: str) -> None:
+        """
+        Stores a copy of an output, then evicts the least recently used entries exceeding max_size.
+        :param key: Key of the output (see key)
+        :param source: Path to the output
+        :return: None
+        """
+
+        # Entries appear atomically, so that concurrent readers never copy partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.__cache_dir, prefix=".")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, self.__entry_path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """
+        Lists the cache entries, from the least to the most recently used.
+        :return: List of tuples (key, size in bytes, last use time)
+        """
+
+        entries = []
+        for name in os.listdir(self.__cache_dir):
+            if name.startswith("."):
+                continue
+            try:
+                status = os.stat(self.__entry_path(name))
+            except FileNotFoundError:
+                continue
+            entries.append((name, status.st_size, status.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self) -> int:
+        """
+        Computes the total size of the cache entries.
+        :return: Size in bytes
+        """
+
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache does not exceed max_size.
+        :return: None
+        """
+
+        with self.__lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for key, size, _ in entries:
+                if total <= self.__max_size:
+                    break
+                try:
+                    os.remove(self.__entry_path(key))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """
+        Removes every cache entry.
+        :return: None
+        """
+
+        with self.__lock:
+            for key, _, _ in self.entries():
+                try:
+                    os.remove(self.__entry_path(key))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,140 @@
+"""
+This file contains a fast structural similarity implementation for landmark frames, and a cache of pairwise results.
+"""
+
+import numpy as np
+import cv2 as cv
+
+from typing import Dict, Tuple, Callable
+
+# Parameters of skimage.metrics.structural_similarity defaults (uniform 7x7 window, sample covariance)
+WIN_SIZE = 7
+K1 = 0.01
+K2 = 0.03
+
+
+def data_range(image: np.ndarray) -> float:
+    """
+    Computes the data range skimage infers from the image dtype (floating point images being in the range [-1,1]).
+    :param image: Image to compare
+    :return: Data range
+    """
+
+    if np.issubdtype(image.dtype, np.floating):
+        return 2.0
+    info = np.iinfo(image.dtype)
+    return float(info.max - info.min)
+
+
+def _ssim_map(x: np.ndarray, y: np.ndarray, value_range: float) -> np.ndarray:
+    """
+    Computes the local structural similarity of two images (border values are not meaningful).
+    :param x: First image (float64)
+    :param y: Second image (float64)
+    :param value_range: Data range of the images
+    :return: Structural similarity map (float64)
+    """
+
+    def mean_filter(image: np.ndarray) -> np.ndarray:
+        return cv.boxFilter(image, cv.CV_64F, (WIN_SIZE, WIN_SIZE), normalize=True, borderType=cv.BORDER_REFLECT)
+
+    points = WIN_SIZE ** 2
+    cov_norm = points / (points - 1)
+    ux = mean_filter(x)
+    uy = mean_filter(y)
+    vx = cov_norm * (mean_filter(x * x) - ux * ux)
+    vy = cov_norm * (mean_filter(y * y) - uy * uy)
+    vxy = cov_norm * (mean_filter(x * y) - ux * uy)
+
+    c1 = (K1 * value_range) ** 2
+    c2 = (K2 * value_range) ** 2
+    numerator = (2 * ux * uy + c1) * (2 * vxy + c2)
+    denominator = (ux ** 2 + uy ** 2 + c1) * (vx + vy + c2)
+
+    return numerator / denominator
+
+
+def fast_structural_similarity(x: np.ndarray, y: np.ndarray, downscale: int = 1) -> float:
+    """
+    Computes the mean structural similarity of two landmark frames, as skimage's structural_similarity with default
+    parameters, on the region of interest surrounding their non-zero pixels only.
+    Pixels whose window is black in both frames have similarity 1, hence they are accounted without being computed.
+    :param x: First frame (2D np.ndarray)
+    :param y: Second frame (2D np.ndarray, same shape and dtype as x)
+    :param downscale: Factor by which frames are shrunk before comparing them (default: 1, exact result); values
+    greater than 1 trade accuracy for speed
+    :return: Mean structural similarity
+    :raises ValueError for frames having different shapes
+    """
+
+    if x.shape != y.shape:
+        raise ValueError("Frames must have the same shape.")
+
+    value_range = data_range(x)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    if downscale > 1:
+        size = (max(WIN_SIZE, x.shape[1] // downscale), max(WIN_SIZE, x.shape[0] // downscale))
+        x = cv.resize(x, size, interpolation=cv.INTER_AREA)
+        y = cv.resize(y, size, interpolation=cv.INTER_AREA)
+
+    # Mean is computed on pixels whose window lies entirely within the image
+    height, width = x.shape
+    pad = (WIN_SIZE - 1) // 2
+    inner = (height - 2 * pad) * (width - 2 * pad)
+
+    rows, columns = np.nonzero(np.logical_or(x != 0, y != 0))
+    if len(rows) == 0:
+        return 1.0
+
+    # Pixels whose window touches a non-zero pixel, and the context their windows need
+    top, bottom = max(pad, rows.min() - pad), min(height - pad, rows.max() + pad + 1)
+    left, right = max(pad, columns.min() - pad), min(width - pad, columns.max() + pad + 1)
+    if top >= bottom or left >= right:
+        return 1.0
+    crop = (slice(top - pad, bottom + pad), slice(left - pad, right + pad))
+
+    ssim = _ssim_map(x[crop], y[crop], value_range)[pad:-pad, pad:-pad]
+    return float((ssim.sum() + inner - ssim.size) / inner)
+
+
+class PairwiseCache:
+
+    def __init__(self, similarity: Callable[[np.ndarray, np.ndarray], float]):
+        """
+        Memoizes the similarity of pairs of frames, identified by their indices in the video.
+        Windows overlap, hence most of their pairs have already been compared by previous windows.
+        :param similarity: Function comparing two frames
+        """
+
+        self.__similarity = similarity
+        self.__values: Dict[Tuple[int, int], float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, first_index: int, second_index: int, first: np.ndarray, second: np.ndarray) -> float:
+        """
+        Returns the similarity of two frames, computing it only if they have never been compared.
+        :param first_index: Index of the first frame
+        :param second_index: Index of the second frame
+        :param first: First frame
+        :param second: Second frame
+        :return: Similarity of the two frames
+        """
+
+        key = (first_index, second_index)
+        if key in self.__values:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.__values[key] = self.__similarity(first, second)
+        return self.__values[key]
+
+    def evict(self, first_index: int) -> None:
+        """
+        Forgets every pair involving frames preceding the given one.
+        :param first_index: Index of the oldest frame still of interest
+        :return: None
+        """
+
+        self.__values = {key: value for key, value in self.__values.items() if key[0] >= first_index}
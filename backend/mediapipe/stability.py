@@ -0,0 +1,528 @@
+"""
+This file contains the sliding-window stability engines used by GestureIdentifier, and the sparse representation of
+landmark frames.
+"""
+
+import numpy as np
+
+from typing import List, Tuple, Optional, Union
+
+
+def block_sums(frame: Union["SparseFrame", np.ndarray], block_size: int = 16) -> np.ndarray:
+    """
+    Sums up the pixels of a grayscale frame in blocks of block_size x block_size pixels, obtaining its thumbnail.
+    :param frame: Grayscale frame (either SparseFrame or dense np.ndarray)
+    :param block_size: Side of the square blocks (default: 16)
+    :return: Thumbnail as a flat np.ndarray (float64)
+    """
+
+    height, width = frame.shape
+    block_columns = -(-width // block_size)
+    blocks = -(-height // block_size) * block_columns
+    if isinstance(frame, SparseFrame):
+        rows, columns = np.divmod(frame.indices, width)
+        block_ids = (rows // block_size) * block_columns + columns // block_size
+        return np.bincount(block_ids, weights=frame.values, minlength=blocks)
+
+    row_starts = np.arange(0, height, block_size)
+    column_starts = np.arange(0, width, block_size)
+    sums = np.add.reduceat(np.add.reduceat(frame, row_starts, axis=0, dtype=np.float64), column_starts, axis=1)
+    return sums.ravel()
+
+
+class SparseFrame:
+
+    def __init__(self, indices: np.ndarray, values: np.ndarray, shape: Tuple[int, int]):
+        """
+        Normalized grayscale frame stored as the list of its non-zero pixels.
+        Landmark frames are almost entirely black, hence this representation is orders of magnitude smaller.
+        :param indices: Sorted flat indices of non-zero pixels
+        :param values: Normalized values of non-zero pixels (float32)
+        :param shape: Resolution of the frame (format: height x width)
+        """
+
+        self.indices = indices
+        self.values = values
+        self.shape = shape
+        self.size = shape[0] * shape[1]
+
+    @staticmethod
+    def normalized(indices: np.ndarray, values: np.ndarray, shape: Tuple[int, int]) -> "SparseFrame":
+        """
+        Applies min-max normalization to the non-zero pixels of a grayscale frame, as StabilityEngine does on the
+        dense frame (frames without any contrast are considered all black).
+        :param indices: Sorted flat indices of non-zero pixels
+        :param values: Grayscale values of non-zero pixels (float32)
+        :param shape: Resolution of the frame (format: height x width)
+        :return: SparseFrame representing the normalized frame
+        """
+
+        size = shape[0] * shape[1]
+        if len(values) == 0:
+            return SparseFrame(indices, values, shape)
+
+        min_value = values.min() if len(values) == size else np.float32(0)
+        max_value = values.max()
+        if max_value <= min_value:
+            return SparseFrame(indices[:0], values[:0], shape)
+
+        values = values - min_value
+        values *= 255
+        values /= max_value - min_value
+        return SparseFrame(indices, values, shape)
+
+    def dense(self) -> np.ndarray:
+        """
+        Converts the frame to its dense representation.
+        :return: Frame as np.ndarray (float32, height x width)
+        """
+
+        frame = np.zeros(self.size, dtype=np.float32)
+        frame[self.indices] = self.values
+        return frame.reshape(self.shape)
+
+    def black_ratio(self) -> float:
+        """
+        Computes the percentage of black pixels in the frame, once converted to uint8.
+        :return: Black percentage (in the range [0,1])
+        """
+
+        return float(self.size - np.count_nonzero(self.values >= 1)) / self.size
+
+
+class StabilityEngine:
+
+    def __init__(self, capacity: int):
+        """
+        Ring buffer of normalized frames, keeping the running sum of its contents to compute the mean frame.
+        Frames are normalized exactly once, when they are pushed, into preallocated float32 planes.
+        :param capacity: Number of frames in a full window (i.e. stable_frames)
+        :raises ValueError for invalid capacity values
+        """
+
+        if capacity <= 0:
+            raise ValueError("The window must contain at least one frame.")
+
+        self.__capacity = capacity
+        self.__head = 0
+        self.__size = 0
+
+        # Buffers are allocated as soon as the frame resolution is known (i.e. first push)
+        self.__planes = None
+        self.__scratch = None
+        self.__sum = None
+        self.__mean = None
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __allocate(self, shape: Tuple[int, int]) -> None:
+        """
+        Preallocates every buffer used by the engine.
+        :param shape: Resolution of the frames (format: height x width)
+        :return: None
+        """
+
+        self.__planes = np.zeros((self.__capacity, *shape), dtype=np.float32)
+        self.__scratch = np.empty_like(self.__planes)
+        self.__sum = np.zeros(shape, dtype=np.float64)
+        self.__mean = np.empty(shape, dtype=np.float32)
+
+    def __order(self) -> List[int]:
+        """
+        Computes the position of each frame in the ring, from the oldest to the most recent one.
+        :return: List of plane indices
+        """
+
+        return [(self.__head + i) % self.__capacity for i in range(self.__size)]
+
+    def is_full(self) -> bool:
+        """
+        Checks whether the window contains capacity frames.
+        :return: True if the window is full, False otherwise
+        """
+
+        return self.__size == self.__capacity
+
+    def push(self, frame: np.ndarray) -> None:
+        """
+        Normalizes a frame into the ring, evicting the oldest frame if the window is full.
+        :param frame: Frame to add (as np.ndarray, either H x W or H x W x C)
+        :return: None
+        """
+
+        shape = frame.shape[:2]
+        if self.__planes is None or self.__planes.shape[1:] != shape:
+            self.__allocate(shape)
+            self.__head = 0
+            self.__size = 0
+
+        if self.__size == self.__capacity:
+            self.drop(1)
+
+        slot = (self.__head + self.__size) % self.__capacity
+        plane = self.__planes[slot]
+        if frame.ndim == 3:
+            np.mean(frame, axis=-1, dtype=np.float32, out=plane)
+        else:
+            plane[...] = frame
+
+        # Min-max normalization (frames without any contrast are considered all black)
+        min_value = plane.min()
+        max_value = plane.max()
+        if max_value > min_value:
+            plane -= min_value
+            plane *= 255
+            plane /= max_value - min_value
+        else:
+            plane.fill(0)
+
+        self.__sum += plane
+        self.__size += 1
+
+    def drop(self, n: int) -> None:
+        """
+        Removes the n oldest frames from the window.
+        :param n: Number of frames to remove (values greater than the window size empty the window)
+        :return: None
+        """
+
+        for _ in range(min(n, self.__size)):
+            self.__sum -= self.__planes[self.__head]
+            self.__head = (self.__head + 1) % self.__capacity
+            self.__size -= 1
+
+        # Avoids accumulating rounding errors across idle stretches
+        if self.__size == 0 and self.__sum is not None:
+            self.__sum.fill(0)
+
+    def frames(self) -> List[np.ndarray]:
+        """
+        Returns the normalized frames in the window, from the oldest to the most recent one.
+        :return: List of normalized frames (as views of the internal planes)
+        """
+
+        return [self.__planes[i] for i in self.__order()]
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Returns a normalized frame in the window.
+        :param index: Position of the frame in the window (0 being the oldest frame)
+        :return: Normalized frame (as a view of an internal plane)
+        """
+
+        return self.__planes[self.__order()[index]]
+
+    def black_ratio(self, index: int) -> float:
+        """
+        Computes the percentage of black pixels in a frame of the window, once converted to uint8.
+        :param index: Position of the frame in the window (0 being the oldest frame)
+        :return: Black percentage (in the range [0,1])
+        """
+
+        plane = self.frame(index)
+        return float(np.sum(plane < 1, dtype=np.float32) / plane.size)
+
+    def mean_frame(self) -> np.ndarray:
+        """
+        Computes the mean frame of the window from the running sum.
+        :return: Mean frame (as a view of an internal buffer)
+        """
+
+        np.divide(self.__sum, self.__size, out=self.__mean, casting="same_kind")
+        return self.__mean
+
+    def ln_distances(self, ln_distance: int = 1) -> (np.ndarray, float):
+        """
+        Computes Ln distances of every frame in the window w.r.t. the mean frame, as a single vectorized operation.
+        :param ln_distance: Ln distance to use (default: L1 distance)
+        :return: Tuple containing at positions:
+                    - 0: np.ndarray of Ln distances from the mean frame, from the oldest to the most recent frame
+                    - 1: Average of Ln distances
+        """
+
+        mean_frame = self.mean_frame()
+        order = self.__order()
+        planes = self.__planes
+        scratch = self.__scratch
+        if self.__size < self.__capacity:
+            planes = planes[order]
+            scratch = scratch[:self.__size]
+            order = [*range(self.__size)]
+
+        np.subtract(planes, mean_frame, out=scratch)
+        np.abs(scratch, out=scratch)
+        if ln_distance > 1:
+            np.power(scratch, ln_distance, out=scratch)
+        distances = scratch.reshape(scratch.shape[0], -1).mean(axis=1)[order]
+
+        return distances, float(distances.mean())
+
+
+class SparseStabilityEngine:
+
+    def __init__(self, capacity: int):
+        """
+        Sliding window of SparseFrame objects, computing the same metrics of StabilityEngine on the union of non-zero
+        pixels only (pixels outside it are black in every frame, hence equal to the mean frame).
+        :param capacity: Number of frames in a full window (i.e. stable_frames)
+        :raises ValueError for invalid capacity values
+        """
+
+        if capacity <= 0:
+            raise ValueError("The window must contain at least one frame.")
+
+        self.__capacity = capacity
+        self.__frames = []
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    def is_full(self) -> bool:
+        """
+        Checks whether the window contains capacity frames.
+        :return: True if the window is full, False otherwise
+        """
+
+        return len(self.__frames) == self.__capacity
+
+    def push(self, frame: SparseFrame) -> None:
+        """
+        Adds a (normalized) frame to the window, evicting the oldest frame if the window is full.
+        :param frame: SparseFrame to add
+        :return: None
+        """
+
+        if len(self.__frames) > 0 and self.__frames[0].shape != frame.shape:
+            self.__frames = []
+        elif len(self.__frames) == self.__capacity:
+            self.drop(1)
+        self.__frames.append(frame)
+
+    def drop(self, n: int) -> None:
+        """
+        Removes the n oldest frames from the window.
+        :param n: Number of frames to remove (values greater than the window size empty the window)
+        :return: None
+        """
+
+        self.__frames = self.__frames[n:]
+
+    def frames(self) -> List[np.ndarray]:
+        """
+        Returns the normalized frames in the window, from the oldest to the most recent one.
+        :return: List of normalized frames (as dense np.ndarray)
+        """
+
+        return [frame.dense() for frame in self.__frames]
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Returns a normalized frame in the window.
+        :param index: Position of the frame in the window (0 being the oldest frame)
+        :return: Normalized frame (as dense np.ndarray)
+        """
+
+        return self.__frames[index].dense()
+
+    def black_ratio(self, index: int) -> float:
+        """
+        Computes the percentage of black pixels in a frame of the window, once converted to uint8.
+        :param index: Position of the frame in the window (0 being the oldest frame)
+        :return: Black percentage (in the range [0,1])
+        """
+
+        return self.__frames[index].black_ratio()
+
+    def ln_distances(self, ln_distance: int = 1) -> (np.ndarray, float):
+        """
+        Computes Ln distances of every frame in the window w.r.t. the mean frame, as a single vectorized operation
+        over the (k, union of non-zero pixels) stacked values.
+        :param ln_distance: Ln distance to use (default: L1 distance)
+        :return: Tuple containing at positions:
+                    - 0: np.ndarray of Ln distances from the mean frame, from the oldest to the most recent frame
+                    - 1: Average of Ln distances
+        """
+
+        union = np.unique(np.concatenate([frame.indices for frame in self.__frames]))
+        stacked = np.zeros((len(self.__frames), len(union)), dtype=np.float32)
+        for row, frame in zip(stacked, self.__frames):
+            row[np.searchsorted(union, frame.indices)] = frame.values
+
+        differences = np.abs(stacked - stacked.mean(axis=0, dtype=np.float64).astype(np.float32))
+        if ln_distance > 1:
+            np.power(differences, ln_distance, out=differences)
+        distances = differences.sum(axis=1, dtype=np.float64) / self.__frames[0].size
+
+        return distances, float(distances.mean())
+
+
+class StabilityCascade:
+
+    def __init__(self, capacity: int,
+                 black_threshold: float,
+                 instability_threshold: Optional[float] = None,
+                 block_size: int = 16):
+        """
+        Cheap pre-filters rejecting windows before the stability engine computes their metrics.
+        Statistics are computed once per frame when it is pushed, and combined in O(k) for each window.
+        Both stages never reject a window that the full analysis would accept:
+            - 'empty': every frame of the window is too black, hence so is its best frame;
+            - 'thumbnail': the L1 distances between thumbnails (block sums) are lower bounds of the L1 distances
+              between full frames, hence an unstable thumbnail window implies an unstable window.
+        :param capacity: Number of frames in a full window (i.e. stable_frames)
+        :param black_threshold: Black percentage threshold to discard stable frames with no gestures
+        :param instability_threshold: Instability threshold on the average L1 distance (None disables the
+        'thumbnail' stage, e.g. for structural similarity)
+        :param block_size: Side of the square blocks summed up into a thumbnail pixel (default: 16)
+        :raises ValueError for invalid capacity or block size values
+        """
+
+        if capacity <= 0:
+            raise ValueError("The window must contain at least one frame.")
+        elif block_size <= 0:
+            raise ValueError("Blocks must contain at least one pixel.")
+
+        self.__capacity = capacity
+        self.__black_threshold = black_threshold
+        self.__instability_threshold = instability_threshold
+        self.__block_size = block_size
+        self.__black_ratios = []
+        self.__thumbnails = []
+
+        self.stats = {"windows": 0, "empty": 0, "thumbnail": 0}
+
+    def push(self, frame: Union[SparseFrame, np.ndarray]) -> None:
+        """
+        Computes the statistics of a normalized frame, evicting the oldest frame if the window is full.
+        :param frame: Normalized frame (either SparseFrame or dense np.ndarray)
+        :return: None
+        """
+
+        if len(self.__black_ratios) == self.__capacity:
+            self.drop(1)
+
+        if isinstance(frame, SparseFrame):
+            self.__black_ratios.append(frame.black_ratio())
+        else:
+            self.__black_ratios.append(float(np.sum(frame < 1, dtype=np.float32) / frame.size))
+        if self.__instability_threshold is not None:
+            self.__thumbnails.append((block_sums(frame, self.__block_size), frame.size))
+
+    def drop(self, n: int) -> None:
+        """
+        Removes the statistics of the n oldest frames.
+        :param n: Number of frames to remove
+        :return: None
+        """
+
+        self.__black_ratios = self.__black_ratios[n:]
+        self.__thumbnails = self.__thumbnails[n:]
+
+    def reject(self) -> Optional[str]:
+        """
+        Runs the pre-filters on the current window, updating the statistics.
+        :return: Name of the stage rejecting the window, or None if the window has to be fully analyzed
+        """
+
+        self.stats["windows"] += 1
+
+        if min(self.__black_ratios) > self.__black_threshold:
+            self.stats["empty"] += 1
+            return "empty"
+
+        if self.__instability_threshold is not None:
+            thumbnails = np.stack([thumbnail for thumbnail, _ in self.__thumbnails])
+            size = self.__thumbnails[0][1]
+            lower_bounds = np.abs(thumbnails - thumbnails.mean(axis=0)).sum(axis=1) / size
+            # The margin absorbs rounding differences w.r.t. the float32 full-frame computation
+            if lower_bounds.mean() > self.__instability_threshold * (1 + 1e-4):
+                self.stats["thumbnail"] += 1
+                return "thumbnail"
+
+        return None
+
+
+class CoordinateStabilityEngine:
+
+    def __init__(self, capacity: int):
+        """
+        Sliding window of hand landmark coordinates, measuring how much landmarks move instead of how much pixels change.
+        Hands are sorted by the horizontal position of their wrist, so that they match across frames.
+        :param capacity: Number of frames in a full window (i.e. stable_frames)
+        :raises ValueError for invalid capacity values
+        """
+
+        if capacity <= 0:
+            raise ValueError("The window must contain at least one frame.")
+
+        self.__capacity = capacity
+        self.__frames = []
+
+    def __len__(self) -> int:
+        return len(self.__frames)
+
+    def is_full(self) -> bool:
+        """
+        Checks whether the window contains capacity frames.
+        :return: True if the window is full, False otherwise
+        """
+
+        return len(self.__frames) == self.__capacity
+
+    def push(self, hands: np.ndarray) -> None:
+        """
+        Adds the landmarks of a frame to the window, evicting the oldest frame if the window is full.
+        :param hands: Landmark coordinates of the frame (format: hands x landmarks x 2, in pixels)
+        :return: None
+        """
+
+        if len(self.__frames) == self.__capacity:
+            self.drop(1)
+        self.__frames.append(hands[np.argsort(hands[:, 0, 0], kind="stable")])
+
+    def drop(self, n: int) -> None:
+        """
+        Removes the n oldest frames from the window.
+        :param n: Number of frames to remove (values greater than the window size empty the window)
+        :return: None
+        """
+
+        self.__frames = self.__frames[n:]
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Returns the landmarks of a frame in the window.
+        :param index: Position of the frame in the window (0 being the oldest frame)
+        :return: Landmark coordinates (format: hands x landmarks x 2, in pixels)
+        """
+
+        return self.__frames[index]
+
+    def hand_counts(self) -> List[int]:
+        """
+        Returns the number of hands in each frame of the window.
+        :return: List of hand counts, from the oldest to the most recent frame
+        """
+
+        return [len(hands) for hands in self.__frames]
+
+    def distances(self) -> (np.ndarray, float):
+        """
+        Computes the average distance of the landmarks of every frame from the mean landmarks of the window.
+        Every frame must contain the same (non-zero) number of hands.
+        :return: Tuple containing at positions:
+                    - 0: np.ndarray of average landmark distances (in pixels), from the oldest to the most recent frame
+                    - 1: Average of distances
+        :raises ValueError if frames contain different numbers of hands, or none
+        """
+
+        counts = set(self.hand_counts())
+        if len(counts) != 1 or 0 in counts:
+            raise ValueError("Every frame must contain the same number of hands.")
+
+        stacked = np.stack(self.__frames).astype(np.float64)
+        offsets = np.linalg.norm(stacked - stacked.mean(axis=0), axis=-1)
+        distances = offsets.reshape((len(self.__frames), -1)).mean(axis=1)
+
+        return distances, float(distances.mean())
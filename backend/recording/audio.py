@@ -6,17 +6,23 @@ import soundfile as sf
 import os
 import time
 import numpy
-from pydub import AudioSegment
+
+from backend.recording.audio_stream import AudioStream
+from backend.recording.audio_encoding import encode_audio
+from backend.recording.voice_activity import OffsetMap, detect_speech, compress_silences
+from typing import Optional
 
 sd.default.samplerate = 16000
 
 
 class Audio:
 
-    def __init__(self, path: str = None, blocking: bool = False):
+    def __init__(self, path: str = None, blocking: bool = False, stream: Optional[AudioStream] = None):
         """
         :param path: the path where the audio will be stored in.
         :param blocking: a flag that indicates if the recording will be blocking or not.
+        :param stream: an AudioStream kept open between recordings, possibly with a pre-roll (default: None, a stream is
+        opened by rec and closed by stop).
         """
 
         self.path = path
@@ -24,21 +30,35 @@ class Audio:
         self.end = None
         self.audio = None
         self.block = blocking
+        self.fs = sd.default.samplerate
+        self.__stream = stream
+        self.__own_stream = False
+        self.__buffer = None
 
     def rec(self, duration: float, fs: int = sd.default.samplerate) -> None:
         """
         Records and returns an audio sample from default device. If path is not None, the sample will be locally stored
-        to path.
-        :param duration: is an integer that indicates how many seconds of recording will be performed.
+        to path. Audio is stored in chunks as it is captured, so that memory grows with the real duration of the
+        recording rather than with duration.
+        :param duration: is an integer that indicates how many seconds of recording will be performed at most.
         :param fs: is the frequency sampling (sampling rate) of the captured audio expressed as an integer
         otherwise.
+        :raises ValueError if fs differs from the sampling rate of the stream kept open.
         """
 
-        self.start = time.time()
-        self.audio = sd.rec(int(duration * fs), samplerate=fs, channels=1, blocking=self.block)
-        if self.path is not None and self.block is True:
-            self.end = time.time()
-            sf.write(self.path, self.audio, fs)
+        if self.__stream is None:
+            self.__stream = AudioStream(samplerate=fs)
+            self.__own_stream = True
+        elif self.__stream.samplerate != fs:
+            raise ValueError("The sampling rate differs from the one of the audio stream.")
+
+        self.fs = fs
+        self.__buffer = self.__stream.record(duration)
+        # The pre-roll, if any, was captured before rec was called
+        self.start = time.time() - len(self.__buffer) / fs
+        if self.block is True:
+            time.sleep(max(0.0, self.start + duration - time.time()))
+            self.stop()
 
     def read_from_file(self) -> (numpy.ndarray, int):
         """
@@ -67,21 +87,47 @@ class Audio:
 
         return sd.default.samplerate
 
-    def stop(self):
+    def stop(self, write: bool = True):
         """
         Stops a non blocking rec() during an audio acquisition. The registration is immediately terminated without
-        waiting for the timeout expressed by the duration argument of rec.
+        waiting for the timeout expressed by the duration argument of rec, and the chunks captured are joined in memory.
+        :param write: Whether to store the audio to path (default: True); callers further editing the audio (e.g. with
+        trim) store it once done, with save or to_bytes.
+        """
+
+        if self.__buffer is None:
+            # e.g. a blocking rec() already stopped
+            return
+
+        self.end = time.time()
+        if self.__own_stream:
+            self.__stream.close()
+            self.__stream = None
+            self.__own_stream = False
+        else:
+            self.__stream.stop_recording()
+        self.audio = self.__buffer.to_array()
+        self.__buffer = None
+        if write and self.path is not None:
+            self.save()
+
+    def save(self, path: str = None) -> None:
+        """
+        Stores the recorded audio as a WAV file.
+        :param path: the path where the audio will be stored in (default: None, the path of this recording).
         """
 
-        sd.stop()
-        if self.path is not None:
-            self.end = time.time()
-            sf.write(self.path, self.audio, self.get_sample_rate())
-            duration = self.get_real_duration() * 1000
-            audio = AudioSegment.from_wav(self.path)[:duration]
-            self.delete()
-            audio.export(self.path, format="wav")
-            self.audio, fs = self.read_from_file()
+        sf.write(path or self.path, self.audio, self.fs, subtype="PCM_16")
+
+    def to_bytes(self, encoding: str = "LINEAR16") -> bytes:
+        """
+        Encodes the recorded audio as a file in memory, e.g. for clients sending audio without storing it.
+        :param encoding: the Google Cloud Speech encoding of the file: 'LINEAR16' (WAV), 'FLAC' or 'OGG_OPUS' (see
+        encode_audio).
+        :return: the content of the audio file (as bytes).
+        """
+
+        return encode_audio(self.audio, self.fs, encoding)
 
     @staticmethod
     def wait():
@@ -114,14 +160,27 @@ class Audio:
 
     def trim(self, n: int) -> None:
         """
-        Trims the first n seconds from an audio file, then overwrites the file.
-        :param n: Seconds to trim at the start of the file
+        Trims the first n milliseconds from the recorded audio, in memory (see save).
+        :param n: Milliseconds to trim at the start of the audio
         :return: None
         """
 
-        audio = AudioSegment.from_wav(self.path)
-        audio = audio[n:]
-        audio.export(self.path, format="wav")
+        self.audio = self.audio[int(n * self.fs / 1000):]
+
+    def trim_silences(self, padding: float = 0.25, min_silence: float = 1.0) -> OffsetMap:
+        """
+        Removes the silences of the recorded audio, in memory (see save), so that they are neither uploaded nor billed.
+        :param padding: Audio kept before and after each region of speech (in seconds, default: 0.25)
+        :param min_silence: Minimum duration of the silences removed, once padded (in seconds, default: 1)
+        :return: OffsetMap converting times of the trimmed audio (e.g. of recognized words) into times of the recording
+        """
+
+        self.audio, offsets = compress_silences(self.audio,
+                                                self.fs,
+                                                detect_speech(self.audio, self.fs),
+                                                padding=padding,
+                                                min_silence=min_silence)
+        return offsets
 
 
 if __name__ == "__main__":
@@ -0,0 +1,37 @@
+"""
+This file contains the encoding of recorded audio in memory, in the formats accepted by Google Cloud Speech.
+"""
+
+import io
+import numpy as np
+import soundfile as sf
+
+# Google Cloud Speech encodings (see RecognitionConfig.AudioEncoding), as soundfile formats and subtypes
+AUDIO_ENCODINGS = {"LINEAR16": ("WAV", "PCM_16"),
+                   "FLAC": ("FLAC", "PCM_16"),
+                   "OGG_OPUS": ("OGG", "OPUS")}
+
+# Sampling rates supported by Opus (in Hertz)
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def encode_audio(samples: np.ndarray, samplerate: int, encoding: str = "LINEAR16") -> bytes:
+    """
+    Encodes mono samples as an audio file in memory: 16-bit WAV (LINEAR16), 16-bit FLAC (lossless, half to two thirds of
+    the size) or Opus in an Ogg container (OGG_OPUS, lossy, about a tenth of the size, but slower to encode).
+    :param samples: Mono samples (as np.ndarray, float in [-1, 1] or int16)
+    :param samplerate: Sampling rate (in Hertz)
+    :param encoding: Google Cloud Speech encoding (see AUDIO_ENCODINGS, default: 'LINEAR16')
+    :return: Content of the audio file (as bytes)
+    :raises ValueError for unsupported encodings, or sampling rates not supported by Opus
+    """
+
+    if encoding not in AUDIO_ENCODINGS:
+        raise ValueError("Unsupported audio encoding: {e}.".format(e=encoding))
+    elif encoding == "OGG_OPUS" and samplerate not in OPUS_SAMPLE_RATES:
+        raise ValueError("Opus does not support a sampling rate of {r} Hz.".format(r=samplerate))
+
+    audio_format, subtype = AUDIO_ENCODINGS[encoding]
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, samplerate, format=audio_format, subtype=subtype)
+    return buffer.getvalue()
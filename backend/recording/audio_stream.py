@@ -0,0 +1,218 @@
+"""
+This file contains the streaming acquisition of audio from the microphone, storing it in fixed-size chunks as it is
+captured, and optionally keeping the latest seconds captured before each recording (pre-roll).
+"""
+
+import threading
+import numpy as np
+import sounddevice as sd
+
+from typing import Any, List, Optional
+
+
+class ChunkBuffer:
+
+    def __init__(self, chunk_size: int, max_samples: Optional[int] = None):
+        """
+        Growable buffer of mono float32 samples, allocated one fixed-size chunk at a time, so that memory scales with the
+        length of the recording rather than with its maximum length.
+        :param chunk_size: Number of samples of each chunk
+        :param max_samples: Maximum number of samples stored, further ones being dropped (default: None, no limit)
+        :raises ValueError for invalid chunk size or maximum number of samples
+        """
+
+        if chunk_size < 1:
+            raise ValueError("Chunks must hold at least one sample.")
+        elif max_samples is not None and max_samples < 0:
+            raise ValueError("The maximum number of samples cannot be negative.")
+
+        self.chunk_size = chunk_size
+        self.max_samples = max_samples
+        self.__chunks: List[np.ndarray] = []
+        self.__length = 0
+
+    def append(self, samples: np.ndarray) -> int:
+        """
+        Copies samples at the end of the buffer (the caller may reuse its array afterwards).
+        :param samples: Mono samples (as np.ndarray, of shape (n,) or (n, 1))
+        :return: Number of samples stored (fewer than the ones given once max_samples is reached)
+        """
+
+        samples = samples.reshape(-1)
+        if self.max_samples is not None:
+            samples = samples[:self.max_samples - self.__length]
+
+        stored = 0
+        while stored < len(samples):
+            offset = self.__length % self.chunk_size
+            if offset == 0:
+                self.__chunks.append(np.empty(self.chunk_size, dtype=np.float32))
+            count = min(self.chunk_size - offset, len(samples) - stored)
+            self.__chunks[-1][offset:offset + count] = samples[stored:stored + count]
+            stored += count
+            self.__length += count
+        return stored
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def is_full(self) -> bool:
+        """
+        Checks whether max_samples have been stored.
+        :return: True if no further samples are stored, False otherwise
+        """
+
+        return self.max_samples is not None and self.__length >= self.max_samples
+
+    def to_array(self) -> np.ndarray:
+        """
+        Joins the chunks into a single array.
+        :return: Samples stored (as np.ndarray of float32)
+        """
+
+        if len(self.__chunks) == 0:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(self.__chunks)[:self.__length]
+
+
+class AudioStream:
+
+    def __init__(self, samplerate: int, pre_roll: float = 0.0, chunk_duration: float = 1.0):
+        """
+        Captures mono audio from the default input device through a sounddevice.InputStream, whose callback appends the
+        captured blocks to the buffer of the ongoing recording (if any). The stream may be kept open between
+        recordings, so that they start without waiting for the device.
+        :param samplerate: Sampling rate (in Hertz)
+        :param pre_roll: Time captured before each recording starts (in seconds, default: 0); if positive, the latest
+        pre_roll seconds captured while not recording are kept, and recordings start with them
+        :param chunk_duration: Duration of the chunks recordings are stored in (in seconds, default: 1)
+        :raises ValueError for invalid sampling rate, pre-roll or chunk duration values
+        """
+
+        if samplerate <= 0:
+            raise ValueError("The sampling rate must be positive.")
+        elif pre_roll < 0:
+            raise ValueError("The pre-roll cannot be negative.")
+        elif chunk_duration <= 0:
+            raise ValueError("The chunk duration must be positive.")
+
+        self.samplerate = samplerate
+        self.pre_roll = pre_roll
+        self.__chunk_size = max(1, int(chunk_duration * samplerate))
+        # Ring of the latest samples captured, written at __ring_end
+        self.__ring = np.zeros(int(pre_roll * samplerate), dtype=np.float32)
+        self.__ring_end = 0
+        self.__ring_count = 0
+        self.__lock = threading.Lock()
+        self.__stream: Optional[sd.InputStream] = None
+        self.__recording: Optional[ChunkBuffer] = None
+        self.stats = {"blocks": 0, "overflows": 0}
+
+    def __callback(self, indata: np.ndarray, frames: int, time: Any, status: sd.CallbackFlags) -> None:
+        """
+        Stores a block of captured samples (runs in the audio thread, hence never blocks for long).
+        :param indata: Captured samples (as np.ndarray, frames x 1), reused by the next call
+        :param frames: Number of samples captured
+        :param time: Timing information of the block (unused)
+        :param status: Errors of the stream, e.g. samples lost since the previous call
+        :return: None
+        """
+
+        if status.input_overflow:
+            self.stats["overflows"] += 1
+        self.stats["blocks"] += 1
+
+        with self.__lock:
+            if self.__recording is not None:
+                self.__recording.append(indata)
+            elif len(self.__ring) > 0:
+                self.__store_pre_roll(indata.reshape(-1))
+
+    def __store_pre_roll(self, samples: np.ndarray) -> None:
+        """
+        Copies samples into the pre-roll ring, overwriting the oldest ones.
+        :param samples: Mono samples (as np.ndarray)
+        :return: None
+        """
+
+        capacity = len(self.__ring)
+        samples = samples[-capacity:]
+        first = min(len(samples), capacity - self.__ring_end)
+        self.__ring[self.__ring_end:self.__ring_end + first] = samples[:first]
+        self.__ring[:len(samples) - first] = samples[first:]
+        self.__ring_end = (self.__ring_end + len(samples)) % capacity
+        self.__ring_count = min(capacity, self.__ring_count + len(samples))
+
+    def __latest_pre_roll(self) -> np.ndarray:
+        """
+        Returns the samples of the pre-roll ring, from the oldest to the newest one.
+        :return: Samples (as np.ndarray)
+        """
+
+        start = self.__ring_end - self.__ring_count
+        if start >= 0:
+            return self.__ring[start:self.__ring_end]
+        return np.concatenate((self.__ring[start:], self.__ring[:self.__ring_end]))
+
+    def start(self) -> None:
+        """
+        Opens the stream, if not open yet.
+        :return: None
+        """
+
+        if self.__stream is None:
+            self.__stream = sd.InputStream(samplerate=self.samplerate,
+                                           channels=1,
+                                           dtype="float32",
+                                           callback=self.__callback)
+            self.__stream.start()
+
+    def is_open(self) -> bool:
+        """
+        Checks whether the stream is capturing audio.
+        :return: True if the stream is open, False otherwise
+        """
+
+        return self.__stream is not None
+
+    def record(self, max_duration: Optional[float] = None) -> ChunkBuffer:
+        """
+        Starts storing the captured audio in a new buffer, starting with the pre-roll (opening the stream if needed).
+        :param max_duration: Maximum duration of the recording, pre-roll included (in seconds, default: None, no limit)
+        :return: ChunkBuffer filled as audio is captured, until stop_recording
+        :raises RuntimeError if a recording is already ongoing
+        """
+
+        self.start()
+        max_samples = int(max_duration * self.samplerate) if max_duration is not None else None
+        with self.__lock:
+            if self.__recording is not None:
+                raise RuntimeError("A recording is already ongoing.")
+            recording = ChunkBuffer(self.__chunk_size, max_samples)
+            if self.__ring_count > 0:
+                recording.append(self.__latest_pre_roll())
+                self.__ring_count = 0
+            self.__recording = recording
+        return recording
+
+    def stop_recording(self) -> Optional[ChunkBuffer]:
+        """
+        Stops storing the captured audio in the buffer of the ongoing recording, while the stream stays open.
+        :return: ChunkBuffer of the recording, or None if there was no ongoing recording
+        """
+
+        with self.__lock:
+            recording, self.__recording = self.__recording, None
+        return recording
+
+    def close(self) -> None:
+        """
+        Closes the stream, stopping the ongoing recording (if any).
+        :return: None
+        """
+
+        if self.__stream is not None:
+            self.__stream.stop()
+            self.__stream.close()
+            self.__stream = None
+        self.stop_recording()
@@ -0,0 +1,226 @@
+"""
+This file contains the management of the webcam across recordings, keeping it open (and optionally capturing) between
+them, so that recordings start as soon as they are requested.
+"""
+
+import cv2
+import threading
+
+from backend.recording.capture import CameraCapture
+from typing import Any, Callable, Optional, Tuple
+
+
+class CameraManager:
+
+    def __init__(self, device_index: int = 0,
+                 resolution: Tuple[int, int] = (640, 480),
+                 fps: float = 6,
+                 idle_timeout: Optional[float] = 60.0,
+                 pre_roll: float = 0.0,
+                 camera_factory: Optional[Callable[[], Any]] = None):
+        """
+        Keeps the webcam open between recordings, releasing it once it has not been used for idle_timeout seconds.
+        :param device_index: Index of the webcam (ignored if camera_factory is provided)
+        :param resolution: Resolution requested to the webcam (format: width x height)
+        :param fps: Capture rate (in frames per second)
+        :param idle_timeout: Time after the end of a recording after which the webcam is released (in seconds,
+        default: 60; None to keep it open until close())
+        :param pre_roll: Time captured before each recording starts (in seconds, default: 0); if positive, frames are
+        captured as long as the webcam is open, and recordings start with the latest pre_roll seconds
+        :param camera_factory: Function opening the camera, returning an object with the same read() and release()
+        methods of cv2.VideoCapture (default: None, the webcam at device_index; see SyntheticCamera)
+        :raises ValueError for invalid fps, idle timeout or pre-roll values
+        """
+
+        if fps <= 0:
+            raise ValueError("The capture rate must be positive.")
+        elif idle_timeout is not None and idle_timeout < 0:
+            raise ValueError("The idle timeout cannot be negative.")
+        elif pre_roll < 0:
+            raise ValueError("The pre-roll cannot be negative.")
+
+        self.device_index = device_index
+        self.resolution = resolution
+        self.fps = fps
+        self.idle_timeout = idle_timeout
+        self.pre_roll = pre_roll
+        self.__camera_factory = camera_factory or self.__open_webcam
+
+        self.__lock = threading.RLock()
+        self.__camera: Optional[Any] = None
+        self.__capture: Optional[CameraCapture] = None
+        self.__in_use = False
+        self.__opening: Optional[threading.Thread] = None
+        self.__idle_timer: Optional[threading.Timer] = None
+        self.__release_generation = 0
+        self.stats = {"opens": 0, "reuses": 0, "idle_releases": 0}
+
+    def __open_webcam(self) -> Any:
+        """
+        Opens the webcam at device_index.
+        :return: cv2.VideoCapture
+        :raises RuntimeError if the webcam cannot be opened
+        """
+
+        camera = cv2.VideoCapture(self.device_index)
+        if not camera.isOpened():
+            raise RuntimeError("Cannot open the webcam (device {d}).".format(d=self.device_index))
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        # Only the latest frame is buffered, so that frames are acquired when they are read
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return camera
+
+    def __open(self) -> None:
+        """
+        Opens the camera, if it is not open yet, and starts capturing if pre-rolling (the lock must be held).
+        :return: None
+        :raises RuntimeError if the camera cannot be opened
+        """
+
+        if self.__camera is None:
+            self.__camera = self.__camera_factory()
+            self.stats["opens"] += 1
+            history = int(round(self.pre_roll * self.fps))
+            self.__capture = CameraCapture(self.__camera, fps=self.fps, history=history)
+        else:
+            self.stats["reuses"] += 1
+
+        if self.pre_roll > 0 and not self.__capture.is_running():
+            self.__capture.start()
+
+    def __background_open(self) -> None:
+        """
+        Opens the camera, ignoring errors since acquire opens it again (runs in a background thread).
+        :return: None
+        """
+
+        with self.__lock:
+            try:
+                if self.__camera is None and not self.__in_use:
+                    self.__open()
+                    self.__schedule_release()
+            except Exception:
+                pass
+
+    def warm_up(self) -> None:
+        """
+        Opens the camera in background (e.g. when the application starts), so that the first recording does not wait
+        for it; it is released after idle_timeout seconds if no recording starts.
+        :return: None
+        """
+
+        with self.__lock:
+            if self.__camera is not None or (self.__opening is not None and self.__opening.is_alive()):
+                return
+            self.__opening = threading.Thread(target=self.__background_open, daemon=True)
+            self.__opening.start()
+
+    def acquire(self) -> CameraCapture:
+        """
+        Opens the camera (or reuses the open one) for a recording.
+        :return: CameraCapture of the camera, already running and holding the pre-roll frames in its history when
+        pre-rolling (see CameraCapture.subscribe), to be started by the caller otherwise
+        :raises RuntimeError if the camera is already in use or cannot be opened
+        """
+
+        opening = self.__opening
+        if opening is not None:
+            opening.join()
+        with self.__lock:
+            if self.__in_use:
+                raise RuntimeError("The camera is already in use.")
+            self.__cancel_release()
+            self.__open()
+            self.__in_use = True
+            return self.__capture
+
+    def release(self) -> None:
+        """
+        Ends a recording: capture stops unless pre-rolling, and the camera is released after idle_timeout seconds.
+        :return: None
+        """
+
+        with self.__lock:
+            if not self.__in_use:
+                return
+            self.__in_use = False
+            if self.pre_roll == 0:
+                self.__capture.stop()
+            self.__schedule_release()
+
+    def __cancel_release(self) -> None:
+        """
+        Cancels the pending idle release, if any (the lock must be held).
+        :return: None
+        """
+
+        self.__release_generation += 1
+        if self.__idle_timer is not None:
+            self.__idle_timer.cancel()
+            self.__idle_timer = None
+
+    def __schedule_release(self) -> None:
+        """
+        Schedules the idle release of the camera (the lock must be held).
+        :return: None
+        """
+
+        self.__cancel_release()
+        if self.idle_timeout is not None:
+            self.__idle_timer = threading.Timer(self.idle_timeout,
+                                                self.__idle_release,
+                                                args=(self.__release_generation,))
+            self.__idle_timer.daemon = True
+            self.__idle_timer.start()
+
+    def __idle_release(self, generation: int) -> None:
+        """
+        Releases the camera if no recording started in the meantime (runs in the timer thread).
+        :param generation: Number of releases scheduled or cancelled before the one of this timer
+        :return: None
+        """
+
+        with self.__lock:
+            # Timers cancelled while waiting for the lock are outdated
+            if self.__in_use or self.__camera is None or generation != self.__release_generation:
+                return
+            self.__idle_timer = None
+            self.__close()
+            self.stats["idle_releases"] += 1
+
+    def __close(self) -> None:
+        """
+        Stops capturing and releases the camera (the lock must be held).
+        :return: None
+        """
+
+        if self.__capture is not None:
+            self.__capture.stop()
+            self.__capture = None
+        if self.__camera is not None:
+            self.__camera.release()
+            self.__camera = None
+
+    def is_open(self) -> bool:
+        """
+        Checks whether the camera is open.
+        :return: True if open, False otherwise
+        """
+
+        with self.__lock:
+            return self.__camera is not None
+
+    def close(self) -> None:
+        """
+        Releases the camera immediately (e.g. when the application quits).
+        :return: None
+        """
+
+        opening = self.__opening
+        if opening is not None:
+            opening.join()
+        with self.__lock:
+            self.__cancel_release()
+            self.__in_use = False
+            self.__close()
@@ -0,0 +1,392 @@
+"""
+This file contains the acquisition of camera frames in a dedicated thread, on a fixed schedule, and the consumers of
+the frames acquired (encoder, frame ring, frame bus and preview).
+"""
+
+import time
+import queue
+import threading
+import collections
+import numpy as np
+import cv2
+
+from backend.recording.frame_ring import FrameRing
+from backend.recording.frame_bus import FrameBus
+from typing import Any, List, Optional, Tuple, Dict
+
+# Item put in consumer queues once capture stops
+END_OF_CAPTURE = None
+
+
+class CameraCapture:
+
+    def __init__(self, camera: Any, fps: float, history: int = 0):
+        """
+        Reads frames from a camera in a dedicated thread, one every 1/fps seconds, stamping each of them with the
+        (monotonic) time it was read at. Frames are delivered to the queues of the subscribed consumers, as tuples
+        (frame index, timestamp, frame), followed by END_OF_CAPTURE once capture stops.
+        :param camera: Camera to read frames from (e.g. cv2.VideoCapture: read() returns a Tuple (success, frame))
+        :param fps: Capture rate (in frames per second)
+        :param history: Number of latest frames kept to be replayed to new consumers, e.g. to pre-roll recordings
+        (default: 0)
+        :raises ValueError for invalid fps or history values
+        """
+
+        if fps <= 0:
+            raise ValueError("The capture rate must be positive.")
+        elif history < 0:
+            raise ValueError("The history cannot be negative.")
+
+        self.camera = camera
+        self.fps = fps
+        self.start_time: Optional[float] = None
+        self.__subscribers: List[Tuple[queue.Queue, bool]] = []
+        self.__thread: Optional[threading.Thread] = None
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__history = collections.deque(maxlen=history)
+        self.stats = {"frames": 0, "late": 0, "failed_reads": 0, "dropped": 0}
+
+    def subscribe(self, maxsize: int = 64, drop_oldest: bool = False, replay_history: bool = False) -> queue.Queue:
+        """
+        Creates the queue of a consumer, which must consume it until END_OF_CAPTURE (or unsubscribe). Capture never
+        waits for consumers: frames not fitting in a full queue are dropped (counted by stats['dropped']).
+        :param maxsize: Maximum number of frames in the queue
+        :param drop_oldest: Whether to make room for new frames by dropping the oldest ones, e.g. for consumers only
+        interested in the latest frame (default: False, new frames are dropped)
+        :param replay_history: Whether the queue starts with the frames kept in history, each frame being delivered
+        exactly once (default: False)
+        :return: Queue of (frame index, timestamp, frame) tuples
+        """
+
+        frames = queue.Queue(maxsize=maxsize)
+        with self.__lock:
+            if replay_history:
+                for item in list(self.__history)[-maxsize:]:
+                    frames.put_nowait(item)
+            self.__subscribers.append((frames, drop_oldest))
+        return frames
+
+    def unsubscribe(self, frames: queue.Queue, end: bool = False) -> None:
+        """
+        Stops delivering frames to a consumer queue, while capture goes on for the other consumers.
+        :param frames: Queue returned by subscribe
+        :param end: Whether to put END_OF_CAPTURE in the queue, for consumers waiting for it (default: False)
+        :return: None
+        """
+
+        with self.__lock:
+            subscribers = [(q, drop_oldest) for q, drop_oldest in self.__subscribers if q is frames]
+            self.__subscribers = [(q, drop_oldest) for q, drop_oldest in self.__subscribers if q is not frames]
+        if end:
+            for q, drop_oldest in subscribers:
+                self.__put(q, drop_oldest, END_OF_CAPTURE)
+
+    def __deliver(self, item: Optional[Tuple[int, float, np.ndarray]]) -> None:
+        """
+        Puts an item in the queue of every consumer, without blocking (except for END_OF_CAPTURE, when the queue of a
+        consumer not dropping the oldest frames is full).
+        :param item: Frame tuple, or END_OF_CAPTURE
+        :return: None
+        """
+
+        with self.__lock:
+            if item is not END_OF_CAPTURE and self.__history.maxlen > 0:
+                self.__history.append(item)
+            subscribers = list(self.__subscribers)
+        for frames, drop_oldest in subscribers:
+            self.__put(frames, drop_oldest, item)
+
+    def __put(self, frames: queue.Queue, drop_oldest: bool, item: Optional[Tuple[int, float, np.ndarray]]) -> None:
+        """
+        Puts an item in the queue of a consumer (see __deliver).
+        :param frames: Queue of the consumer
+        :param drop_oldest: Whether to make room for the item by dropping the oldest ones
+        :param item: Frame tuple, or END_OF_CAPTURE
+        :return: None
+        """
+
+        try:
+            frames.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+
+        if drop_oldest:
+            while True:
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    frames.put_nowait(item)
+                    break
+                except queue.Full:
+                    continue
+        elif item is END_OF_CAPTURE:
+            # Consumers wait for the end of capture, hence it waits for room instead of being dropped
+            frames.put(item)
+        else:
+            self.stats["dropped"] += 1
+
+    def __capture(self) -> None:
+        """
+        Reads frames on a deadline-based schedule, skipping the deadlines already missed instead of catching up
+        (runs in the capture thread).
+        :return: None
+        """
+
+        period = 1 / self.fps
+        deadline = self.start_time
+        index = 0
+        try:
+            while not self.__stop.is_set():
+                delay = deadline - time.monotonic()
+                if delay > 0 and self.__stop.wait(delay):
+                    break
+
+                success, frame = self.camera.read()
+                timestamp = time.monotonic()
+                if not success:
+                    self.stats["failed_reads"] += 1
+                else:
+                    self.__deliver((index, timestamp, frame))
+                    self.stats["frames"] += 1
+                    index += 1
+
+                deadline += period
+                if timestamp > deadline:
+                    # Reading took longer than a period: the schedule restarts from the next deadline in the future
+                    missed = int((timestamp - deadline) // period) + 1
+                    self.stats["late"] += missed
+                    deadline += missed * period
+        finally:
+            self.__deliver(END_OF_CAPTURE)
+
+    def start(self) -> None:
+        """
+        Starts capturing frames.
+        :return: None
+        :raises RuntimeError if capture is already running
+        """
+
+        if self.is_running():
+            raise RuntimeError("Capture is already running.")
+
+        self.__stop.clear()
+        self.start_time = time.monotonic()
+        self.__thread = threading.Thread(target=self.__capture, daemon=True)
+        self.__thread.start()
+
+    def is_running(self) -> bool:
+        """
+        Checks whether frames are being captured.
+        :return: True if capture is running, False otherwise
+        """
+
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def stop(self) -> None:
+        """
+        Stops capturing frames, waiting for the frame being read (if any); the camera is not released.
+        :return: None
+        """
+
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+class EncoderConsumer:
+
+    def __init__(self, frames: queue.Queue, writer: Any):
+        """
+        Writes captured frames to a video in a dedicated thread, until capture stops.
+        :param frames: Consumer queue (see CameraCapture.subscribe)
+        :param writer: Video writer (e.g. cv2.VideoWriter: write(frame) encodes a frame)
+        """
+
+        self.__frames = frames
+        self.__writer = writer
+        self.timestamps: List[float] = []
+        self.__thread = threading.Thread(target=self.__encode, daemon=True)
+        self.__thread.start()
+
+    def __encode(self) -> None:
+        """
+        Encodes frames as they are captured (runs in the encoder thread).
+        :return: None
+        """
+
+        while True:
+            item = self.__frames.get()
+            if item is END_OF_CAPTURE:
+                break
+            _, timestamp, frame = item
+            self.__writer.write(frame)
+            self.timestamps.append(timestamp)
+
+    def join(self) -> None:
+        """
+        Waits for every captured frame to be written (capture must have been stopped).
+        :return: None
+        """
+
+        self.__thread.join()
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.timestamps)
+
+
+class RingConsumer:
+
+    def __init__(self, frames: queue.Queue, ring: FrameRing):
+        """
+        Copies captured frames into a frame ring in a dedicated thread, until capture stops.
+        :param frames: Consumer queue (see CameraCapture.subscribe)
+        :param ring: FrameRing storing the frames, along with their capture timestamps
+        """
+
+        self.__frames = frames
+        self.__ring = ring
+        self.frame_count = 0
+        self.__thread = threading.Thread(target=self.__store, daemon=True)
+        self.__thread.start()
+
+    def __store(self) -> None:
+        """
+        Stores frames as they are captured (runs in the consumer thread).
+        :return: None
+        """
+
+        while True:
+            item = self.__frames.get()
+            if item is END_OF_CAPTURE:
+                break
+            _, timestamp, frame = item
+            self.__ring.append(frame, timestamp)
+            self.frame_count += 1
+
+    def join(self) -> None:
+        """
+        Waits for every captured frame to be stored (capture must have been stopped).
+        :return: None
+        """
+
+        self.__thread.join()
+
+
+class BusConsumer:
+
+    def __init__(self, frames: queue.Queue, bus: FrameBus, timeout: float = 1.0):
+        """
+        Publishes captured frames on a frame bus in a dedicated thread, until capture stops, then closes the bus.
+        Frames wait for the bus consumer to free a slot, up to timeout seconds each, after which they are dropped
+        (counted by stats['dropped']), so that a stalled consumer never blocks recording.
+        :param frames: Consumer queue (see CameraCapture.subscribe)
+        :param bus: FrameBus to write (this consumer is its producer)
+        :param timeout: Maximum time a frame waits for a free slot (in seconds, default: 1)
+        """
+
+        self.__frames = frames
+        self.__bus = bus
+        self.__timeout = timeout
+        self.timestamps: List[float] = []
+        self.stats = {"dropped": 0}
+        self.__thread = threading.Thread(target=self.__publish, daemon=True)
+        self.__thread.start()
+
+    def __publish(self) -> None:
+        """
+        Publishes frames as they are captured (runs in the consumer thread).
+        :return: None
+        """
+
+        try:
+            while True:
+                item = self.__frames.get()
+                if item is END_OF_CAPTURE:
+                    break
+                _, timestamp, frame = item
+                slot = self.__bus.reserve(self.__timeout)
+                if slot is None:
+                    self.stats["dropped"] += 1
+                    continue
+                if frame.shape == slot.shape:
+                    slot[...] = frame
+                else:
+                    cv2.resize(frame, self.__bus.resolution, dst=slot)
+                self.__bus.commit(timestamp)
+                self.timestamps.append(timestamp)
+        finally:
+            self.__bus.close_writer()
+
+    def join(self) -> None:
+        """
+        Waits for every captured frame to be published (capture must have been stopped).
+        :return: None
+        """
+
+        self.__thread.join()
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.timestamps)
+
+
+class PreviewConsumer:
+
+    def __init__(self, frames: queue.Queue, max_fps: float):
+        """
+        Hands out the latest captured frame at most max_fps times per second, e.g. to a GUI polling it from its own
+        event loop without ever blocking.
+        :param frames: Consumer queue, keeping only the latest frame (see CameraCapture.subscribe, drop_oldest)
+        :param max_fps: Maximum preview rate (in frames per second)
+        :raises ValueError for invalid max_fps values
+        """
+
+        if max_fps <= 0:
+            raise ValueError("The preview rate must be positive.")
+
+        self.__frames = frames
+        self.__interval = 1 / max_fps
+        self.__last_time = None
+        self.stats: Dict[str, int] = {"shown": 0, "skipped": 0}
+
+    def poll(self) -> Optional[np.ndarray]:
+        """
+        Returns the latest frame captured since the previous call, if at least 1/max_fps seconds have passed.
+        :return: Frame (as np.ndarray), or None if there is no new frame to show yet
+        """
+
+        now = time.monotonic()
+        if self.__last_time is not None and now - self.__last_time < self.__interval:
+            return None
+
+        latest = None
+        while True:
+            try:
+                item = self.__frames.get_nowait()
+            except queue.Empty:
+                break
+            if item is END_OF_CAPTURE:
+                break
+            if latest is not None:
+                self.stats["skipped"] += 1
+            latest = item
+
+        if latest is None:
+            return None
+        self.__last_time = now
+        self.stats["shown"] += 1
+        return latest[2]
+
+    @property
+    def interval(self) -> float:
+        """
+        Minimum time between two previewed frames (in seconds).
+        """
+
+        return self.__interval
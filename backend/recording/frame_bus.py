@@ -0,0 +1,250 @@
+"""
+This file contains a bus of video frames in shared memory, so that recording, Google MediaPipe and gesture identification
+exchange frames without encoding them, while running at the same time in different processes.
+"""
+
+import multiprocessing
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: buses cannot be created, while the modules referring to them can still be imported
+    shared_memory = None
+
+from typing import Optional, Tuple
+
+# Fields of the control block, shared by producer and consumer
+CONTROL_FIELDS = 4
+WRITE_SEQ, READ_SEQ, END_SEQ = 0, 1, 2
+
+# Alignment of the arrays within the shared memory block (in bytes)
+ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class FrameBus:
+
+    def __init__(self, slots: int, resolution: Tuple[int, int]):
+        """
+        Ring of fixed-size BGR frame slots in shared memory, passed from a single producer to a single consumer along
+        with their sequence numbers and timestamps. Producers wait for a free slot when the ring is full (backpressure),
+        and consumers get views of the slots, which are reused only once released.
+        The bus is shared with other processes by passing it to them when they are started (e.g. as an argument of
+        multiprocessing.Process); the process creating it must unlink it once done.
+        :param slots: Number of frame slots
+        :param resolution: Resolution of the frames (format: width x height)
+        :raises ValueError, RuntimeError for invalid number of slots or resolution values, or Python versions lacking
+        shared memory (before 3.8)
+        """
+
+        if shared_memory is None:
+            raise RuntimeError("The frame bus requires Python 3.8+.")
+        elif slots < 1:
+            raise ValueError("The bus must have at least one slot.")
+        elif len(resolution) != 2 or min(resolution) <= 0:
+            raise ValueError("The resolution must contain a positive width and height.")
+
+        self.slots = slots
+        self.resolution = tuple(resolution)
+        # Semaphores of spawn contexts can be passed to processes started by any method
+        context = multiprocessing.get_context("spawn")
+        self.__free = context.Semaphore(slots)
+        self.__filled = context.Semaphore(0)
+        self.__memory = shared_memory.SharedMemory(create=True, size=self.__layout()[-1])
+        self.__owner = True
+        self.__map()
+        self.__control[:] = [0, 0, -1, 0]
+        self.stats = {"written": 0, "read": 0, "backpressure": 0}
+
+    def __layout(self) -> Tuple[int, int, int, int]:
+        """
+        Computes the offsets of the arrays within the shared memory block.
+        :return: Tuple (sequence numbers offset, timestamps offset, frames offset, total size), in bytes
+        """
+
+        width, height = self.resolution
+        seqs = _aligned(CONTROL_FIELDS * 8)
+        timestamps = _aligned(seqs + self.slots * 8)
+        frames = _aligned(timestamps + self.slots * 8)
+        return seqs, timestamps, frames, frames + self.slots * width * height * 3
+
+    def __map(self) -> None:
+        """
+        Maps the arrays of the bus onto its shared memory block.
+        :return: None
+        """
+
+        width, height = self.resolution
+        seqs, timestamps, frames, _ = self.__layout()
+        buffer = self.__memory.buf
+        self.__control = np.ndarray((CONTROL_FIELDS,), dtype=np.int64, buffer=buffer)
+        self.__seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buffer, offset=seqs)
+        self.__timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buffer, offset=timestamps)
+        self.__frames = np.ndarray((self.slots, height, width, 3), dtype=np.uint8, buffer=buffer, offset=frames)
+        self.__reserved: Optional[int] = None
+        self.__held = 0
+
+    def __getstate__(self) -> dict:
+        return {"slots": self.slots,
+                "resolution": self.resolution,
+                "name": self.__memory.name,
+                "free": self.__free,
+                "filled": self.__filled}
+
+    def __setstate__(self, state: dict) -> None:
+        self.slots = state["slots"]
+        self.resolution = state["resolution"]
+        self.__free = state["free"]
+        self.__filled = state["filled"]
+        self.__memory = shared_memory.SharedMemory(name=state["name"])
+        self.__owner = False
+        self.__map()
+        self.stats = {"written": 0, "read": 0, "backpressure": 0}
+
+    # --- Producer ---
+    def reserve(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Waits for a free slot, so that the producer writes the next frame straight into it (then calls commit).
+        :param timeout: Maximum time to wait (in seconds, default: None, no limit)
+        :return: View of the slot (as np.ndarray, height x width x 3), or None if the timeout expired
+        """
+
+        if not self.__free.acquire(block=False):
+            self.stats["backpressure"] += 1
+            if not self.__free.acquire(timeout=timeout):
+                return None
+
+        self.__reserved = int(self.__control[WRITE_SEQ])
+        return self.__frames[self.__reserved % self.slots]
+
+    def commit(self, timestamp: float) -> int:
+        """
+        Publishes the frame written into the reserved slot.
+        :param timestamp: Capture time of the frame (in seconds)
+        :return: Sequence number of the frame
+        :raises RuntimeError if no slot was reserved
+        """
+
+        if self.__reserved is None:
+            raise RuntimeError("No slot was reserved.")
+
+        seq, self.__reserved = self.__reserved, None
+        slot = seq % self.slots
+        self.__seqs[slot] = seq
+        self.__timestamps[slot] = timestamp
+        self.__control[WRITE_SEQ] = seq + 1
+        self.__filled.release()
+        self.stats["written"] += 1
+        return seq
+
+    def discard(self) -> None:
+        """
+        Gives the reserved slot back without publishing it (e.g. when the frame cannot be completed).
+        :return: None
+        """
+
+        if self.__reserved is not None:
+            self.__reserved = None
+            self.__free.release()
+
+    def put(self, frame: np.ndarray, timestamp: float, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Copies a frame into the next free slot (see reserve for producers able to write frames in place).
+        :param frame: BGR frame (as np.ndarray, height x width x 3)
+        :param timestamp: Capture time of the frame (in seconds)
+        :param timeout: Maximum time to wait for a free slot (in seconds, default: None, no limit)
+        :return: Sequence number of the frame, or None if the timeout expired
+        :raises ValueError for frames of a different resolution
+        """
+
+        if frame.shape != self.__frames.shape[1:]:
+            raise ValueError("The frame does not match the resolution of the bus.")
+
+        slot = self.reserve(timeout)
+        if slot is None:
+            return None
+        slot[...] = frame
+        return self.commit(timestamp)
+
+    def close_writer(self) -> None:
+        """
+        Marks the end of the frames, once the consumer reads every frame already published.
+        :return: None
+        """
+
+        self.__control[END_SEQ] = self.__control[WRITE_SEQ]
+        self.__filled.release()
+
+    # --- Consumer ---
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[int, float, np.ndarray]]:
+        """
+        Waits for the next frame. Its slot is not reused until released, hence the view stays valid until then.
+        :param timeout: Maximum time to wait (in seconds, default: None, no limit)
+        :return: Tuple (sequence number, timestamp, view of the BGR frame), or None once the producer closed the bus
+        :raises TimeoutError, RuntimeError if the timeout expires or the sequence numbers do not match
+        """
+
+        if not self.__filled.acquire(timeout=timeout):
+            raise TimeoutError("No frame received within {t} seconds.".format(t=timeout))
+
+        seq = int(self.__control[READ_SEQ])
+        end = int(self.__control[END_SEQ])
+        if 0 <= end <= seq:
+            # The end stays visible to further calls
+            self.__filled.release()
+            return None
+
+        slot = seq % self.slots
+        if self.__seqs[slot] != seq:
+            raise RuntimeError("Frame {s} was overwritten before being read.".format(s=seq))
+        self.__control[READ_SEQ] = seq + 1
+        self.__held += 1
+        self.stats["read"] += 1
+        return seq, float(self.__timestamps[slot]), self.__frames[slot]
+
+    def release(self, count: int = 1) -> None:
+        """
+        Gives the oldest slots read back to the producer; their views must no longer be used.
+        :param count: Number of slots to release (default: 1)
+        :return: None
+        :raises ValueError if fewer slots are held
+        """
+
+        if not 0 <= count <= self.__held:
+            raise ValueError("Cannot release more slots than the ones held.")
+
+        self.__held -= count
+        for _ in range(count):
+            self.__free.release()
+
+    @property
+    def held(self) -> int:
+        """
+        Number of slots read and not released yet.
+        """
+
+        return self.__held
+
+    # --- --- ---
+
+    def close(self) -> None:
+        """
+        Detaches this process from the shared memory (views of the slots must no longer be used).
+        :return: None
+        """
+
+        self.__control = self.__seqs = self.__timestamps = self.__frames = None
+        self.__memory.close()
+
+    def unlink(self) -> None:
+        """
+        Destroys the shared memory, once every process closed the bus (only the process creating it may unlink it).
+        :return: None
+        """
+
+        if self.__owner:
+            self.__memory.unlink()
@@ -0,0 +1,134 @@
+"""
+This file contains a fixed-size ring buffer of video frames, preallocated once, so that recordings can be kept in memory
+and handed to the processing pipeline without encoding them.
+"""
+
+import threading
+import numpy as np
+import cv2
+
+from backend.mediapipe.frame_source import RAW_HEADER
+from typing import Iterator, List, Tuple, BinaryIO
+
+
+class FrameRing:
+
+    def __init__(self, capacity: int, resolution: Tuple[int, int]):
+        """
+        Ring buffer of BGR frames along with their capture timestamps, stored in a single preallocated uint8 array.
+        Once full, new frames overwrite the oldest ones (counted by stats['overwritten']). Frames take width x height x 3
+        bytes each (e.g. about 5.3 MB per second at 640x480 and 6 FPS); memory is committed as frames are written.
+        :param capacity: Maximum number of frames kept
+        :param resolution: Resolution of the frames (format: width x height); frames of a different resolution are
+        resized when appended
+        :raises ValueError for invalid capacity or resolution values
+        """
+
+        if capacity < 1:
+            raise ValueError("The ring must hold at least one frame.")
+        elif len(resolution) != 2 or min(resolution) <= 0:
+            raise ValueError("The resolution must contain a positive width and height.")
+
+        self.capacity = capacity
+        self.resolution = tuple(resolution)
+        width, height = self.resolution
+        self.__frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self.__timestamps = np.empty(capacity, dtype=np.float64)
+        self.__first = 0
+        self.__count = 0
+        self.__lock = threading.Lock()
+        self.stats = {"frames": 0, "overwritten": 0, "resized": 0}
+
+    def append(self, frame: np.ndarray, timestamp: float) -> None:
+        """
+        Copies a frame into the ring (the caller may reuse its array afterwards).
+        :param frame: BGR frame (as np.ndarray, height x width x 3)
+        :param timestamp: Capture time of the frame (in seconds)
+        :return: None
+        """
+
+        with self.__lock:
+            slot = (self.__first + self.__count) % self.capacity
+            if self.__count == self.capacity:
+                self.__first = (self.__first + 1) % self.capacity
+                self.stats["overwritten"] += 1
+            else:
+                self.__count += 1
+
+        if frame.shape == self.__frames.shape[1:]:
+            self.__frames[slot] = frame
+        else:
+            cv2.resize(frame, self.resolution, dst=self.__frames[slot])
+            self.stats["resized"] += 1
+        self.__timestamps[slot] = timestamp
+        self.stats["frames"] += 1
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __ranges(self) -> List[Tuple[int, int]]:
+        """
+        Computes the slots holding the frames, from the oldest to the newest one.
+        :return: List of (at most two) contiguous ranges of slots, as tuples (start, stop)
+        """
+
+        stop = self.__first + self.__count
+        if stop <= self.capacity:
+            return [(self.__first, stop)]
+        return [(self.__first, self.capacity), (0, stop - self.capacity)]
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Returns a frame, without copying it (the view is overwritten once the ring wraps around).
+        :param index: Index of the frame, 0 being the oldest one in the ring
+        :return: BGR frame (as np.ndarray)
+        :raises IndexError for indices out of range
+        """
+
+        if not 0 <= index < self.__count:
+            raise IndexError("Frame index out of range.")
+        return self.__frames[(self.__first + index) % self.capacity]
+
+    def timestamps(self) -> np.ndarray:
+        """
+        Returns the capture timestamps of the frames, from the oldest to the newest one.
+        :return: Timestamps (in seconds, as np.ndarray)
+        """
+
+        return np.concatenate([self.__timestamps[start:stop] for start, stop in self.__ranges()])
+
+    def __iter__(self) -> Iterator[Tuple[float, np.ndarray]]:
+        """
+        Iterates over the frames, without copying them.
+        :return: Iterator over Tuples (timestamp, BGR frame as np.ndarray)
+        """
+
+        for start, stop in self.__ranges():
+            for slot in range(start, stop):
+                yield float(self.__timestamps[slot]), self.__frames[slot]
+
+    def write_raw(self, stream: BinaryIO, fps: float) -> int:
+        """
+        Writes the frames as a raw BGR stream, after a header line (see RAW_HEADER), e.g. to feed MediaPipe's
+        --raw_input_path; contiguous frames are written at once, without copying them.
+        :param stream: Binary stream to write
+        :param fps: Frames per second reported by the header
+        :return: Number of frames written
+        """
+
+        width, height = self.resolution
+        stream.write(RAW_HEADER.format(width=width, height=height, fps=fps, frames=self.__count).encode())
+        for start, stop in self.__ranges():
+            stream.write(memoryview(self.__frames[start:stop]).cast("B"))
+        stream.flush()
+        return self.__count
+
+    def clear(self) -> None:
+        """
+        Empties the ring, keeping its memory for the next frames.
+        :return: None
+        """
+
+        with self.__lock:
+            self.__first = 0
+            self.__count = 0
@@ -0,0 +1,64 @@
+"""
+This file contains a stand-in for a webcam, generating frames instead of acquiring them (e.g. to exercise recording
+without a camera).
+"""
+
+import time
+import numpy as np
+
+from typing import Tuple
+
+
+class SyntheticCamera:
+
+    def __init__(self, resolution: Tuple[int, int] = (640, 480),
+                 open_delay: float = 0.0,
+                 read_delay: float = 0.0):
+        """
+        Camera generating frames with a square moving across a gradient, whose position encodes the frame index.
+        Implements the subset of cv2.VideoCapture used by the recording code.
+        :param resolution: Resolution of the frames (format: width x height)
+        :param open_delay: Time spent "negotiating the device" when opened (in seconds, default: 0)
+        :param read_delay: Time spent reading each frame (in seconds, default: 0)
+        """
+
+        time.sleep(open_delay)
+        self.resolution = resolution
+        self.read_delay = read_delay
+        self.frames_read = 0
+        self.__opened = True
+        width, height = resolution
+        self.__background = np.repeat(np.linspace(0, 255, width, dtype=np.uint8)[np.newaxis, :, np.newaxis],
+                                      height, axis=0).repeat(3, axis=2)
+
+    def isOpened(self) -> bool:
+        return self.__opened
+
+    def set(self, prop_id: int, value: float) -> bool:
+        """
+        Accepts any property, as cv2.VideoCapture does for properties the device does not support.
+        :return: False
+        """
+
+        return False
+
+    def read(self) -> (bool, np.ndarray):
+        """
+        Generates the next frame.
+        :return: Tuple (success, BGR frame as np.ndarray), success being False once released
+        """
+
+        if not self.__opened:
+            return False, None
+
+        time.sleep(self.read_delay)
+        width, height = self.resolution
+        frame = self.__background.copy()
+        side = max(1, min(width, height) // 8)
+        x = (self.frames_read * side) % max(1, width - side)
+        frame[:side, x:x + side] = (0, 0, 255)
+        self.frames_read += 1
+        return True, frame
+
+    def release(self) -> None:
+        self.__opened = False
@@ -3,28 +3,55 @@ This file contains source code for all the video processing involved in this pro
 """
 
 import time
+import math
 import os
 import cv2
 import tkinter as tk
 from PIL import Image, ImageTk
 from backend.recording.audio import Audio
-from typing import Tuple, Optional, Any
+from backend.recording.capture import CameraCapture, EncoderConsumer, RingConsumer, BusConsumer, PreviewConsumer
+from backend.recording.camera_manager import CameraManager
+from backend.recording.frame_ring import FrameRing
+from backend.recording.frame_bus import FrameBus
+from typing import Tuple, Optional, Any, List
 
 
 class Video:
 
     def __init__(self,
-                 path: str,
+                 path: Optional[str],
                  fps: float = 6,
                  resolution: Tuple[int, int] = (640, 480),
-                 root_window: Optional[Any] = None):
+                 root_window: Optional[Any] = None,
+                 preview_fps: Optional[float] = None,
+                 encoder_queue_size: int = 64,
+                 camera_manager: Optional[CameraManager] = None,
+                 ring_duration: Optional[float] = None,
+                 frame_bus: Optional[FrameBus] = None):
         """
-        :param path: the path where the video will be stored in.
+        :param path: the path where the video will be stored in (None not to encode it, if kept in memory or published).
         :param fps: the frequency (rate) at which consecutive video frames are acquired.
         :param resolution: the resolution at which the video frames are acquired.
         :param root_window: Tkinter root window (if any)
+        :param preview_fps: the maximum rate at which the recording window is refreshed (default: None, same as fps).
+        :param encoder_queue_size: the maximum number of frames waiting to be encoded, beyond which frames are dropped
+        (default: 64).
+        :param camera_manager: the manager keeping the webcam open between recordings (default: None, the webcam is
+        opened by start and released by stop); its frame rate overrides fps, and its pre-roll frames start the video.
+        :param ring_duration: the maximum duration of the video kept in memory, in a FrameRing preallocated by start
+        (in seconds, default: None, frames are only encoded); the oldest frames are overwritten beyond it.
+        :param frame_bus: the bus where frames are published as they are acquired, e.g. for processing them while
+        recording (default: None); the bus is closed by stop, and frames are dropped while it has no free slots.
+        Frames are acquired and encoded in dedicated threads (see CameraCapture), the Tkinter event loop only showing
+        the latest frame.
+        :raises ValueError if the video is neither stored, kept in memory nor published, or for invalid ring durations
         """
 
+        if path is None and ring_duration is None and frame_bus is None:
+            raise ValueError("The video must be either stored in a file, kept in memory or published.")
+        elif ring_duration is not None and ring_duration <= 0:
+            raise ValueError("The duration kept in memory must be positive.")
+
         self.device_index = 0
         self.fps = fps  # fps should be the minimum constant rate at which the camera can record
         self.fourcc = "MP4V"  # capture images (with no decrease in speed over time; testing is required)
@@ -35,6 +62,23 @@ class Video:
         self.video_out = None
         self.frame_counts = 1
         self.start_time = time.time()
+        self.preview_fps = preview_fps or fps
+        self.encoder_queue_size = encoder_queue_size
+        self.timestamps: List[float] = []
+        self.ring_duration = ring_duration
+        self.frame_ring: Optional[FrameRing] = None
+        self.capture: Optional[CameraCapture] = None
+        self.__encoder: Optional[EncoderConsumer] = None
+        self.__ring_consumer: Optional[RingConsumer] = None
+        self.__ring_frames = None
+        self.frame_bus = frame_bus
+        self.__bus_consumer: Optional[BusConsumer] = None
+        self.__bus_frames = None
+        self.__preview: Optional[PreviewConsumer] = None
+        self.__camera_manager = camera_manager
+        self.__encoder_frames = None
+        self.__preview_frames = None
+        self.__record_start = None
 
         self.__root_window = root_window
         self.tk_window = None
@@ -43,14 +87,15 @@ class Video:
 
     def record(self) -> None:
         """
-        Writes on file the video frame by frame showing to the user a recording window during the process.
+        Shows the latest acquired frame in the recording window, then reschedules itself on the Tkinter event loop
+        (frames are acquired and written by the capture and encoder threads).
         """
 
-        ret, video_frame = self.video_cap.read()
-        if ret:
-            self.video_out.write(video_frame)
-            self.frame_counts += 1
-            time.sleep(0.16)
+        if self.capture is None:
+            return
+
+        video_frame = self.__preview.poll()
+        if video_frame is not None:
             preview_color = cv2.cvtColor(video_frame, cv2.COLOR_BGR2RGB)
 
             img = Image.fromarray(preview_color)
@@ -58,23 +103,60 @@ class Video:
             self.tk_label.imgtk = imgtk
             self.tk_label.configure(image=imgtk)
 
-            self.tk_label.after(10, self.record)
+        self.tk_label.after(max(1, int(self.__preview.interval * 1000)), self.record)
+
+    def get_duration(self) -> float:
+        """
+        Returns the duration of the recorded video, as it will be reported by its container.
+        :return: a float indicating the video duration (in seconds).
+        """
 
-            cv2.waitKey(1)
+        return (self.frame_counts - 1) / self.fps
 
     def stop(self) -> None:
         """
-        Stops the video recording.
+        Stops the video recording, waiting for the acquired frames to be written (stored in frame_ring, if kept in
+        memory, and published, if a frame bus is provided).
         """
 
+        capture, self.capture = self.capture, None
         if self.__root_window is None:
             self.tk_window.quit()
         else:
             self.tk_window.destroy()
 
-        self.video_out.release()
-        self.video_cap.release()
-        cv2.destroyAllWindows()
+        if self.__camera_manager is None:
+            capture.stop()
+        else:
+            # Capture goes on (e.g. pre-rolling the next recording) until the manager releases the webcam
+            capture.unsubscribe(self.__preview_frames)
+            for frames in (self.__encoder_frames, self.__ring_frames, self.__bus_frames):
+                if frames is not None:
+                    capture.unsubscribe(frames, end=True)
+            self.__camera_manager.release()
+
+        if self.__bus_consumer is not None:
+            self.__bus_consumer.join()
+        if self.__ring_consumer is not None:
+            self.__ring_consumer.join()
+        if self.__encoder is not None:
+            self.__encoder.join()
+            self.video_out.release()
+
+        # Frames kept in memory take precedence over the encoded ones, which take precedence over the published ones
+        if self.__ring_consumer is not None:
+            self.frame_counts = 1 + self.__ring_consumer.frame_count
+            timestamps = self.frame_ring.timestamps().tolist()
+        elif self.__encoder is not None:
+            self.frame_counts = 1 + self.__encoder.frame_count
+            timestamps = self.__encoder.timestamps
+        else:
+            self.frame_counts = 1 + self.__bus_consumer.frame_count
+            timestamps = self.__bus_consumer.timestamps
+        # Pre-roll frames have negative timestamps
+        self.timestamps = [timestamp - self.__record_start for timestamp in timestamps]
+        if self.video_cap is not None:
+            self.video_cap.release()
 
     def start(self) -> None:
         """
@@ -93,10 +175,43 @@ class Video:
         self.tk_label = tk.Label(self.tk_frame)
         self.tk_label.grid(row=0, column=0)
 
-        self.video_cap = cv2.VideoCapture(self.device_index)
-        self.video_out = cv2.VideoWriter(self.video_filename, self.video_writer, self.fps, self.frameSize)
+        if self.__camera_manager is None:
+            self.video_cap = cv2.VideoCapture(self.device_index)
+            # Only the latest frame is buffered, so that frames are acquired when they are read
+            self.video_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self.capture = CameraCapture(self.video_cap, fps=self.fps)
+        else:
+            self.video_cap = None
+            self.capture = self.__camera_manager.acquire()
+            self.fps = self.capture.fps
         self.frame_counts = 1
+        self.timestamps = []
         self.start_time = time.time()
+        self.__record_start = time.monotonic()
+
+        self.__encoder = None
+        self.__encoder_frames = None
+        if self.video_filename is not None:
+            self.video_out = cv2.VideoWriter(self.video_filename, self.video_writer, self.fps, self.frameSize)
+            self.__encoder_frames = self.capture.subscribe(maxsize=self.encoder_queue_size, replay_history=True)
+            self.__encoder = EncoderConsumer(self.__encoder_frames, self.video_out)
+        self.__ring_consumer = None
+        self.__ring_frames = None
+        if self.ring_duration is not None:
+            # The ring is allocated before capture starts, frames being copied into it as they are acquired
+            self.frame_ring = FrameRing(capacity=int(math.ceil(self.ring_duration * self.fps)),
+                                        resolution=self.frameSize)
+            self.__ring_frames = self.capture.subscribe(maxsize=self.encoder_queue_size, replay_history=True)
+            self.__ring_consumer = RingConsumer(self.__ring_frames, self.frame_ring)
+        self.__bus_consumer = None
+        self.__bus_frames = None
+        if self.frame_bus is not None:
+            self.__bus_frames = self.capture.subscribe(maxsize=self.encoder_queue_size, replay_history=True)
+            self.__bus_consumer = BusConsumer(self.__bus_frames, self.frame_bus)
+        self.__preview_frames = self.capture.subscribe(maxsize=1, drop_oldest=True)
+        self.__preview = PreviewConsumer(self.__preview_frames, max_fps=self.preview_fps)
+        if not self.capture.is_running():
+            self.capture.start()
 
         self.record()
         if self.__root_window is None:
@@ -0,0 +1,123 @@
+"""
+This file contains the energy-based voice activity detection used to remove long silences from recorded audio, and the
+mapping of times of the trimmed audio back to times of the recording.
+"""
+
+import bisect
+import numpy
+
+from typing import List, Tuple
+
+
+def detect_speech(samples: numpy.ndarray,
+                  fs: int,
+                  frame_duration: float = 0.03,
+                  margin_db: float = 12.0,
+                  min_level_db: float = -55.0) -> List[Tuple[int, int]]:
+    """
+    Finds the regions of speech in a recording by their energy: frames louder than the noise floor (the 10th percentile of
+    frame energies) by at least margin_db are considered speech.
+    :param samples: Mono samples (as a Numpy array of floats in [-1, 1])
+    :param fs: Sampling rate (in Hertz)
+    :param frame_duration: Duration of the frames energy is measured on (in seconds, default: 0.03)
+    :param margin_db: Minimum energy of speech above the noise floor (in dB, default: 12)
+    :param min_level_db: Minimum energy of speech (in dBFS, default: -55), e.g. for recordings of digital silence
+    :return: List of regions of speech, as Tuples (first sample, sample after the last one)
+    """
+
+    frame_size = max(1, int(frame_duration * fs))
+    frames = len(samples) // frame_size
+    if frames == 0:
+        return []
+
+    power = numpy.mean(numpy.square(samples[:frames * frame_size].reshape(frames, frame_size), dtype=numpy.float64),
+                       axis=1)
+    energy = 10 * numpy.log10(power + 1e-12)
+    threshold = max(numpy.percentile(energy, 10) + margin_db, min_level_db)
+    speech = numpy.concatenate(([False], energy > threshold, [False]))
+
+    # Edges of the runs of speech frames
+    edges = numpy.flatnonzero(speech[1:] != speech[:-1])
+    return [(int(start) * frame_size, min(int(stop) * frame_size, len(samples)))
+            for start, stop in zip(edges[::2], edges[1::2])]
+
+
+class OffsetMap:
+
+    def __init__(self, segments: List[Tuple[float, float, float]]):
+        """
+        Maps times of a recording whose silences were removed back to times of the original recording.
+        :param segments: List of segments kept, as Tuples (start in the trimmed recording, start in the original
+        recording, duration), all in seconds and ordered by start
+        """
+
+        self.segments = segments
+        self.__starts = [start for start, _, _ in segments]
+
+    def to_original(self, timing: float, end: bool = False) -> float:
+        """
+        Converts a time of the trimmed recording into a time of the original recording.
+        :param timing: Time in the trimmed recording (in seconds)
+        :param end: Whether the time ends an interval, e.g. a word (default: False); times on the boundary between two
+        segments are mapped to the end of the first one if so, to the start of the second one otherwise
+        :return: Time in the original recording (in seconds)
+        """
+
+        if len(self.segments) == 0:
+            return timing
+
+        search = bisect.bisect_left if end else bisect.bisect_right
+        index = max(0, search(self.__starts, timing) - 1)
+        start, original_start, duration = self.segments[index]
+        # Times at the end of a segment stay within it, rather than jumping over the silence removed
+        return original_start + min(max(timing - start, 0.0), duration)
+
+    @property
+    def removed(self) -> float:
+        """
+        Total duration of the silences removed, up to the end of the last segment kept (in seconds).
+        """
+
+        if len(self.segments) == 0:
+            return 0.0
+        start, original_start, duration = self.segments[-1]
+        return original_start - start
+
+
+def compress_silences(samples: numpy.ndarray,
+                      fs: int,
+                      regions: List[Tuple[int, int]],
+                      padding: float = 0.25,
+                      min_silence: float = 1.0) -> (numpy.ndarray, OffsetMap):
+    """
+    Removes the silences between regions of speech, keeping padding seconds of audio around each region, so that words
+    are not cut and pauses between phrases are shortened rather than removed.
+    :param samples: Mono samples (as a Numpy array)
+    :param fs: Sampling rate (in Hertz)
+    :param regions: Regions of speech, as Tuples (first sample, sample after the last one) (see detect_speech)
+    :param padding: Audio kept before and after each region of speech (in seconds, default: 0.25)
+    :param min_silence: Minimum duration of the silences removed, once padded (in seconds, default: 1)
+    :return: Tuple containing at positions:
+            - 0: Samples of the regions kept, one after the other
+            - 1: OffsetMap converting times of the trimmed samples into times of the original ones
+    """
+
+    if len(regions) == 0:
+        return samples, OffsetMap([(0.0, 0.0, len(samples) / fs)])
+
+    pad = int(padding * fs)
+    gap = int(min_silence * fs)
+    kept = []
+    for start, stop in regions:
+        start, stop = max(0, start - pad), min(len(samples), stop + pad)
+        if len(kept) > 0 and start - kept[-1][1] < gap:
+            kept[-1] = (kept[-1][0], stop)
+        else:
+            kept.append((start, stop))
+
+    segments = []
+    position = 0
+    for start, stop in kept:
+        segments.append((position / fs, start / fs, (stop - start) / fs))
+        position += stop - start
+    return numpy.concatenate([samples[start:stop] for start, stop in kept]), OffsetMap(segments)
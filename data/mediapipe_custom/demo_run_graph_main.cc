@@ -18,6 +18,7 @@
 #include "mediapipe/framework/calculator_framework.h"
 #include "mediapipe/framework/formats/image_frame.h"
 #include "mediapipe/framework/formats/image_frame_opencv.h"
+#include "mediapipe/framework/formats/landmark.pb.h"
 #include "mediapipe/framework/port/commandlineflags.h"
 #include "mediapipe/framework/port/file_helpers.h"
 #include "mediapipe/framework/port/opencv_highgui_inc.h"
@@ -25,6 +26,14 @@
 #include "mediapipe/framework/port/opencv_video_inc.h"
 #include "mediapipe/framework/port/parse_text_proto.h"
 #include "mediapipe/framework/port/status.h"
+#include <cmath>
+#include <cstdio>
+#include <cstdint>
+#include <cstdlib>
+#include <iostream>
+#include <map>
+#include <mutex>
+#include <string>
 #include <vector>
 using namespace std;
 
@@ -37,6 +46,9 @@ bool pcond=0;
 
 constexpr char kInputStream[] = "input_video";
 constexpr char kOutputStream[] = "output_video";
+constexpr char kLandmarksStream[] = "multi_hand_landmarks";
+constexpr uint32_t kLandmarksVersion = 1;
+constexpr uint32_t kLandmarksPerHand = 21;
 constexpr char kWindowName[] = "MediaPipe";
 
 DEFINE_string(
@@ -48,6 +60,166 @@ DEFINE_string(input_video_path, "",
 DEFINE_string(output_video_path, "",
               "Full path of where to save result (.mp4 only). "
               "If not provided, show result in a window.");
+DEFINE_string(raw_input_path, "",
+              "Full path of raw BGR frames to load instead of a video ('-' "
+              "for stdin, e.g. a FIFO otherwise), after a "
+              "'RAW <width> <height> <fps> <frames>' header line "
+              "(see raw_output_path). Not available with --serve.");
+DEFINE_string(raw_output_path, "",
+              "Full path of where to stream rendered frames as raw BGR bytes "
+              "('-' for stdout, e.g. a FIFO otherwise), after a "
+              "'RAW <width> <height> <fps> <frames>' header line. "
+              "If provided without output_video_path, no video is saved.");
+DEFINE_string(landmarks_output_path, "",
+              "Full path of where to save the normalized coordinates of hand "
+              "landmarks of every frame, as a binary file (see WriteLandmarks).");
+DEFINE_int32(frame_stride, 1,
+             "Number of frames to advance by, processing one frame every "
+             "frame_stride: outputs have a frame rate frame_stride times "
+             "lower.");
+DEFINE_bool(serve, false,
+            "Whether to keep the graph running, processing the videos requested "
+            "on stdin (one 'RUN <input>\\t<output>[\\t<raw output>"
+            "[\\t<landmarks output>]]' line per video, any output may be "
+            "empty; 'PING' for health checks, 'QUIT' to exit). Replies are "
+            "written to stdout.");
+
+// Hand landmarks observed on the graph, as (x, y, z) values of each hand,
+// indexed by timestamp. Frames with no hands have no entry.
+struct LandmarkRecorder {
+  std::mutex mutex;
+  std::map<int64, std::vector<float>> landmarks;
+};
+
+::mediapipe::Status ObserveLandmarks(mediapipe::CalculatorGraph& graph,
+                                     LandmarkRecorder& recorder) {
+  return graph.ObserveOutputStream(
+      kLandmarksStream,
+      [&recorder](const mediapipe::Packet& packet) -> ::mediapipe::Status {
+        const auto& hands =
+            packet.Get<std::vector<mediapipe::NormalizedLandmarkList>>();
+        std::vector<float> values;
+        for (const auto& hand : hands) {
+          for (int i = 0; i < hand.landmark_size(); ++i) {
+            values.push_back(hand.landmark(i).x());
+            values.push_back(hand.landmark(i).y());
+            values.push_back(hand.landmark(i).z());
+          }
+        }
+        std::lock_guard<std::mutex> lock(recorder.mutex);
+        recorder.landmarks[packet.Timestamp().Value()] = std::move(values);
+        return ::mediapipe::OkStatus();
+      });
+}
+
+// Writes the landmarks of frames [first_timestamp, first_timestamp + frames)
+// to a binary file (native little-endian): the 'MPLM' magic, then uint32
+// version, uint32 frames, uint32 landmarks per hand, float32 fps, uint32
+// width, uint32 height; then, for each frame, uint32 hands followed by
+// hands x landmarks x 3 float32 normalized (x, y, z) values.
+bool WriteLandmarks(const std::string& path, LandmarkRecorder& recorder,
+                    int64 first_timestamp, uint32_t frames, float fps,
+                    const cv::Size& size) {
+  FILE* file = std::fopen(path.c_str(), "wb");
+  if (file == nullptr) return false;
+
+  const uint32_t width = size.width, height = size.height;
+  std::fwrite("MPLM", 1, 4, file);
+  std::fwrite(&kLandmarksVersion, sizeof(uint32_t), 1, file);
+  std::fwrite(&frames, sizeof(uint32_t), 1, file);
+  std::fwrite(&kLandmarksPerHand, sizeof(uint32_t), 1, file);
+  std::fwrite(&fps, sizeof(float), 1, file);
+  std::fwrite(&width, sizeof(uint32_t), 1, file);
+  std::fwrite(&height, sizeof(uint32_t), 1, file);
+
+  std::lock_guard<std::mutex> lock(recorder.mutex);
+  for (uint32_t frame = 0; frame < frames; ++frame) {
+    const auto entry = recorder.landmarks.find(first_timestamp + frame);
+    uint32_t hands = 0;
+    if (entry != recorder.landmarks.end()) {
+      hands = entry->second.size() / (kLandmarksPerHand * 3);
+    }
+    std::fwrite(&hands, sizeof(uint32_t), 1, file);
+    if (hands > 0) {
+      std::fwrite(entry->second.data(), sizeof(float),
+                  hands * kLandmarksPerHand * 3, file);
+    }
+  }
+  return std::fclose(file) == 0;
+}
+
+// Frame rate and number of frames of the outputs, given the ones of the input
+// (see frame_stride).
+double StridedFps(double fps) { return fps / FLAGS_frame_stride; }
+double StridedFrames(double frames) {
+  return std::ceil(frames / FLAGS_frame_stride);
+}
+
+// Opens the raw frame stream ('-' for stdout) and writes its header.
+FILE* OpenRawOutput(const std::string& path, const cv::Size& size, double fps,
+                    double frames) {
+  FILE* raw = path == "-" ? stdout : std::fopen(path.c_str(), "wb");
+  if (raw != nullptr) {
+    std::fprintf(raw, "RAW %d %d %f %lld\n", size.width, size.height, fps,
+                 static_cast<long long>(frames));
+  }
+  return raw;
+}
+
+// Writes a BGR frame to the raw frame stream, skipping row padding.
+void WriteRawFrame(FILE* raw, const cv::Mat& frame) {
+  const size_t row_bytes = frame.cols * frame.elemSize();
+  if (frame.isContinuous()) {
+    std::fwrite(frame.data, 1, row_bytes * frame.rows, raw);
+  } else {
+    for (int row = 0; row < frame.rows; ++row) {
+      std::fwrite(frame.ptr(row), 1, row_bytes, raw);
+    }
+  }
+}
+
+// Raw BGR frames read from a stream, after the same header of raw outputs.
+struct RawInput {
+  FILE* file = nullptr;
+  cv::Size size;
+  double fps = 0;
+  long long frames = 0;
+
+  // Opens the stream ('-' for stdin) and reads its header.
+  bool Open(const std::string& path) {
+    file = path == "-" ? stdin : std::fopen(path.c_str(), "rb");
+    if (file == nullptr) return false;
+    int width = 0, height = 0;
+    if (std::fscanf(file, "RAW %d %d %lf %lld", &width, &height, &fps,
+                    &frames) != 4 ||
+        std::fgetc(file) != '\n' || width <= 0 || height <= 0 || fps <= 0) {
+      Close();
+      return false;
+    }
+    size = cv::Size(width, height);
+    return true;
+  }
+
+  // Reads the next frame, leaving it empty at the end of the stream.
+  void Read(cv::Mat& frame) {
+    frame.create(size, CV_8UC3);
+    const size_t bytes = frame.total() * frame.elemSize();
+    if (std::fread(frame.data, 1, bytes, file) != bytes) frame.release();
+  }
+
+  void Close() {
+    if (file != nullptr && file != stdin) std::fclose(file);
+    file = nullptr;
+  }
+};
+
+void CloseRawOutput(FILE* raw) {
+  if (raw == stdout) {
+    std::fflush(raw);
+  } else if (raw != nullptr) {
+    std::fclose(raw);
+  }
+}
 
 ::mediapipe::Status RunMPPGraph() {
   std::string calculator_graph_config_contents;
@@ -60,30 +232,46 @@ DEFINE_string(output_video_path, "",
           calculator_graph_config_contents);
 
   LOG(INFO) << "Initialize the calculator graph.";
+  LandmarkRecorder recorder;
   mediapipe::CalculatorGraph graph;
   MP_RETURN_IF_ERROR(graph.Initialize(config));
+  const bool save_landmarks = !FLAGS_landmarks_output_path.empty();
+  if (save_landmarks) {
+    MP_RETURN_IF_ERROR(ObserveLandmarks(graph, recorder));
+  }
 
   LOG(INFO) << "Initialize the camera or load the video.";
   cv::VideoCapture capture;
-  const bool load_video = !FLAGS_input_video_path.empty();
-  if (load_video) {
+  RawInput raw_input;
+  const bool load_raw = !FLAGS_raw_input_path.empty();
+  const bool load_video = !FLAGS_input_video_path.empty() || load_raw;
+  if (load_raw) {
+    RET_CHECK(raw_input.Open(FLAGS_raw_input_path));
+  } else if (load_video) {
     capture.open(FLAGS_input_video_path);
+    RET_CHECK(capture.isOpened());
   } else {
     capture.open(0);
+    RET_CHECK(capture.isOpened());
   }
-  RET_CHECK(capture.isOpened());
+  const double input_fps =
+      load_raw ? raw_input.fps : capture.get(cv::CAP_PROP_FPS);
+  const double input_frames =
+      load_raw ? raw_input.frames : capture.get(cv::CAP_PROP_FRAME_COUNT);
 
   cv::VideoWriter writer;
+  FILE* raw = nullptr;
   const bool save_video = !FLAGS_output_video_path.empty();
-  if (save_video) {
-    LOG(INFO) << "Prepare video writer.";
-    cv::Mat test_frame;
+  const bool stream_raw = !FLAGS_raw_output_path.empty();
+  cv::Mat test_frame;
+  if (load_raw) {
+    // Raw frames cannot be rewound, and their size is in the header
+    test_frame = cv::Mat(raw_input.size, CV_8UC3);
+  } else if (save_video || stream_raw || save_landmarks) {
     capture.read(test_frame);                    // Consume first frame.
     capture.set(cv::CAP_PROP_POS_AVI_RATIO, 0);  // Rewind to beginning.
-    writer.open(FLAGS_output_video_path,
-                mediapipe::fourcc('a', 'v', 'c', '1'),  // .mp4
-                capture.get(cv::CAP_PROP_FPS), test_frame.size());
-    RET_CHECK(writer.isOpened());
+    // The video writer and the raw frame stream are opened along with the
+    // first output frame, which may be smaller than the input ones.
   } else {
     cv::namedWindow(kWindowName, /*flags=WINDOW_AUTOSIZE*/ 1);
 #if (CV_MAJOR_VERSION >= 3) && (CV_MINOR_VERSION >= 2)
@@ -100,12 +288,18 @@ DEFINE_string(output_video_path, "",
 
   LOG(INFO) << "Start grabbing and processing frames.";
   size_t frame_timestamp = 0;
+  size_t read_frames = 0;
   bool grab_frames = true;
   while (grab_frames) {
     // Capture opencv camera or video frame.
     cv::Mat camera_frame_raw;
-    capture >> camera_frame_raw;
+    if (load_raw) {
+      raw_input.Read(camera_frame_raw);
+    } else {
+      capture >> camera_frame_raw;
+    }
     if (camera_frame_raw.empty()) break;  // End of video.
+    if (read_frames++ % FLAGS_frame_stride != 0) continue;
     cv::Mat camera_frame;
     cv::cvtColor(camera_frame_raw, camera_frame, cv::COLOR_BGR2RGB);
     if (!load_video) {
@@ -132,8 +326,22 @@ DEFINE_string(output_video_path, "",
     // Convert back to opencv for display or saving.
     cv::Mat output_frame_mat = mediapipe::formats::MatView(&output_frame);
     cv::cvtColor(output_frame_mat, output_frame_mat, cv::COLOR_RGB2BGR);
-    if (save_video) {
-      writer.write(output_frame_mat);
+    if (save_video && !writer.isOpened()) {
+      LOG(INFO) << "Prepare video writer.";
+      writer.open(FLAGS_output_video_path,
+                  mediapipe::fourcc('a', 'v', 'c', '1'),  // .mp4
+                  StridedFps(input_fps), output_frame_mat.size());
+      RET_CHECK(writer.isOpened());
+    }
+    if (stream_raw && raw == nullptr) {
+      LOG(INFO) << "Prepare raw frame stream.";
+      raw = OpenRawOutput(FLAGS_raw_output_path, output_frame_mat.size(),
+                          StridedFps(input_fps), StridedFrames(input_frames));
+      RET_CHECK(raw != nullptr);
+    }
+    if (save_video || stream_raw || save_landmarks) {
+      if (save_video) writer.write(output_frame_mat);
+      if (stream_raw) WriteRawFrame(raw, output_frame_mat);
     } else {
       cv::imshow(kWindowName, output_frame_mat);
       // Press any key to exit.
@@ -143,7 +351,177 @@ DEFINE_string(output_video_path, "",
   }
 
   LOG(INFO) << "Shutting down.";
+  raw_input.Close();
+  if (writer.isOpened()) writer.release();
+  if (stream_raw && raw == nullptr) {
+    // No frames: readers still expect a header
+    raw = OpenRawOutput(FLAGS_raw_output_path, test_frame.size(),
+                        StridedFps(input_fps), 0);
+  }
+  CloseRawOutput(raw);
+  MP_RETURN_IF_ERROR(graph.CloseInputStream(kInputStream));
+  MP_RETURN_IF_ERROR(graph.WaitUntilDone());
+  if (save_landmarks) {
+    LOG(INFO) << "Save landmarks.";
+    RET_CHECK(WriteLandmarks(FLAGS_landmarks_output_path, recorder, 0,
+                             frame_timestamp, StridedFps(input_fps),
+                             test_frame.size()));
+  }
+  return ::mediapipe::OkStatus();
+}
+
+// Processes a video through an already running graph, writing the rendered
+// frames to output_path and/or streaming them to raw_output_path, and the hand
+// landmarks to landmarks_output_path (empty paths are skipped). Timestamps continue from the previous videos, since the graph
+// is never restarted. Only graph failures are returned as errors: videos
+// which cannot be read or written are reported through `message`.
+::mediapipe::Status ProcessVideo(mediapipe::CalculatorGraph& graph,
+                                 mediapipe::OutputStreamPoller& poller,
+                                 const std::string& input_path,
+                                 const std::string& output_path,
+                                 const std::string& raw_output_path,
+                                 const std::string& landmarks_output_path,
+                                 LandmarkRecorder& recorder,
+                                 size_t& frame_timestamp, size_t& frames,
+                                 std::string& message) {
+  cv::VideoCapture capture;
+  capture.open(input_path);
+  if (!capture.isOpened()) {
+    message = "cannot open " + input_path;
+    return ::mediapipe::OkStatus();
+  }
+
+  cv::Mat test_frame;
+  capture.read(test_frame);                    // Consume first frame.
+  capture.set(cv::CAP_PROP_POS_AVI_RATIO, 0);  // Rewind to beginning.
+  const double fps = StridedFps(capture.get(cv::CAP_PROP_FPS));
+  // Stdout carries the replies to requests, hence frames need a FIFO
+  if (raw_output_path == "-") {
+    message = "cannot write " + raw_output_path;
+    return ::mediapipe::OkStatus();
+  }
+
+  // The video writer and the raw frame stream are opened along with the first
+  // output frame, which may be smaller than the input ones.
+  cv::VideoWriter writer;
+  FILE* raw = nullptr;
+  size_t read_frames = 0;
+  while (true) {
+    cv::Mat camera_frame_raw;
+    capture >> camera_frame_raw;
+    if (camera_frame_raw.empty()) break;  // End of video.
+    if (read_frames++ % FLAGS_frame_stride != 0) continue;
+    cv::Mat camera_frame;
+    cv::cvtColor(camera_frame_raw, camera_frame, cv::COLOR_BGR2RGB);
+
+    // Wrap Mat into an ImageFrame.
+    auto input_frame = absl::make_unique<mediapipe::ImageFrame>(
+        mediapipe::ImageFormat::SRGB, camera_frame.cols, camera_frame.rows,
+        mediapipe::ImageFrame::kDefaultAlignmentBoundary);
+    cv::Mat input_frame_mat = mediapipe::formats::MatView(input_frame.get());
+    camera_frame.copyTo(input_frame_mat);
+
+    // Send image packet into the graph.
+    MP_RETURN_IF_ERROR(graph.AddPacketToInputStream(
+        kInputStream, mediapipe::Adopt(input_frame.release())
+                          .At(mediapipe::Timestamp(frame_timestamp++))));
+
+    // Get the graph result packet, or stop if that fails.
+    mediapipe::Packet packet;
+    RET_CHECK(poller.Next(&packet));
+    auto& output_frame = packet.Get<mediapipe::ImageFrame>();
+
+    cv::Mat output_frame_mat = mediapipe::formats::MatView(&output_frame);
+    cv::cvtColor(output_frame_mat, output_frame_mat, cv::COLOR_RGB2BGR);
+    if (!output_path.empty() && !writer.isOpened() && message.empty()) {
+      writer.open(output_path,
+                  mediapipe::fourcc('a', 'v', 'c', '1'),  // .mp4
+                  fps, output_frame_mat.size());
+      if (!writer.isOpened()) message = "cannot write " + output_path;
+    }
+    if (!raw_output_path.empty() && raw == nullptr && message.empty()) {
+      raw = OpenRawOutput(raw_output_path, output_frame_mat.size(), fps,
+                          StridedFrames(capture.get(cv::CAP_PROP_FRAME_COUNT)));
+      if (raw == nullptr) message = "cannot write " + raw_output_path;
+    }
+    if (writer.isOpened()) writer.write(output_frame_mat);
+    if (raw != nullptr) WriteRawFrame(raw, output_frame_mat);
+    frames++;
+  }
+
   if (writer.isOpened()) writer.release();
+  if (!raw_output_path.empty() && raw == nullptr && message.empty()) {
+    // No frames: readers still expect a header
+    raw = OpenRawOutput(raw_output_path, test_frame.size(), fps, 0);
+    if (raw == nullptr) message = "cannot write " + raw_output_path;
+  }
+  CloseRawOutput(raw);
+
+  // Landmarks of the last frames may still be in flight
+  MP_RETURN_IF_ERROR(graph.WaitUntilIdle());
+  const int64 first_timestamp = frame_timestamp - frames;
+  if (!landmarks_output_path.empty() && message.empty() &&
+      !WriteLandmarks(landmarks_output_path, recorder, first_timestamp, frames,
+                      fps, test_frame.size())) {
+    message = "cannot write " + landmarks_output_path;
+  }
+  std::lock_guard<std::mutex> lock(recorder.mutex);
+  recorder.landmarks.clear();
+  return ::mediapipe::OkStatus();
+}
+
+// Loads the graph once, then processes the videos requested on stdin.
+::mediapipe::Status ServeMPPGraph() {
+  std::string calculator_graph_config_contents;
+  MP_RETURN_IF_ERROR(mediapipe::file::GetContents(
+      FLAGS_calculator_graph_config_file, &calculator_graph_config_contents));
+  mediapipe::CalculatorGraphConfig config =
+      mediapipe::ParseTextProtoOrDie<mediapipe::CalculatorGraphConfig>(
+          calculator_graph_config_contents);
+
+  LOG(INFO) << "Initialize the calculator graph.";
+  LandmarkRecorder recorder;
+  mediapipe::CalculatorGraph graph;
+  MP_RETURN_IF_ERROR(graph.Initialize(config));
+  MP_RETURN_IF_ERROR(ObserveLandmarks(graph, recorder));
+  ASSIGN_OR_RETURN(mediapipe::OutputStreamPoller poller,
+                   graph.AddOutputStreamPoller(kOutputStream));
+  MP_RETURN_IF_ERROR(graph.StartRun({}));
+  std::cout << "READY" << std::endl;
+
+  size_t frame_timestamp = 0;
+  std::string line;
+  while (std::getline(std::cin, line)) {
+    if (line == "PING") {
+      std::cout << "PONG" << std::endl;
+    } else if (line == "QUIT") {
+      break;
+    } else if (line.rfind("RUN ", 0) == 0 && line.find('\t') != std::string::npos) {
+      // Tab-separated input path and outputs, trailing outputs being optional
+      std::vector<std::string> fields;
+      size_t start = 4;
+      for (size_t end = line.find('\t'); end != std::string::npos;
+           start = end + 1, end = line.find('\t', start)) {
+        fields.push_back(line.substr(start, end - start));
+      }
+      fields.push_back(line.substr(start));
+      fields.resize(4);
+      size_t frames = 0;
+      std::string message;
+      MP_RETURN_IF_ERROR(ProcessVideo(graph, poller, fields[0], fields[1],
+                                      fields[2], fields[3], recorder,
+                                      frame_timestamp, frames, message));
+      if (message.empty()) {
+        std::cout << "DONE " << frames << std::endl;
+      } else {
+        std::cout << "ERROR " << message << std::endl;
+      }
+    } else {
+      std::cout << "ERROR unknown command" << std::endl;
+    }
+  }
+
+  LOG(INFO) << "Shutting down.";
   MP_RETURN_IF_ERROR(graph.CloseInputStream(kInputStream));
   return graph.WaitUntilDone();
 }
@@ -158,9 +536,18 @@ int main(int argc, char** argv) {
   }
   
   gflags::ParseCommandLineFlags(&argc, &argv, true);
-  ::mediapipe::Status run_status = RunMPPGraph();
+  if (FLAGS_frame_stride < 1) {
+    LOG(ERROR) << "frame_stride must be at least 1.";
+    return EXIT_FAILURE;
+  }
+  if (FLAGS_serve && !FLAGS_raw_input_path.empty()) {
+    LOG(ERROR) << "raw_input_path cannot be used with serve.";
+    return EXIT_FAILURE;
+  }
+  ::mediapipe::Status run_status = FLAGS_serve ? ServeMPPGraph() : RunMPPGraph();
   if (!run_status.ok()) {
     LOG(ERROR) << "Failed to run the graph: " << run_status.message();
+    return EXIT_FAILURE;
   } else {
     LOG(INFO) << "Success!";
   }
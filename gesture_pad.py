@@ -17,8 +17,13 @@ class GesturePad:
                           gestures_dir="tmp/integration_frames",
                           gesture_prefix="image",
                           root_window=self.__root,
-                          debug=False)
+                          debug=False,
+                          background_build=True,
+                          persistent_mediapipe=True,
+                          raw_frames=True,
+                          keep_camera_warm=True)
         self.__backend = backend
+        self.__root.protocol("WM_DELETE_WINDOW", self.__quitApplication)
 
         self.__file = None
         # default window width and height
@@ -97,6 +102,7 @@ class GesturePad:
         self.__thisTextArea.config(yscrollcommand=self.__thisScrollBar.set)
 
     def __quitApplication(self):
+        self.__backend.close()
         self.__root.destroy()
 
     def __openFile(self):
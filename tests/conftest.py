@@ -0,0 +1,84 @@
+"""
+This file contains the fixtures shared by the tests, e.g. a short video and the command of the fake MediaPipe worker.
+"""
+
+import os
+import sys
+import stat
+import shutil
+import numpy as np
+import imageio
+import pytest
+
+from backend.mediapipe.mediapipe_helper import GRAPH_SUBPATH
+from typing import List
+
+# Root of the repository, from which the fake MediaPipe worker is run as a module
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VIDEO_FPS = 6
+VIDEO_FRAMES = 10
+VIDEO_SIZE = (64, 48)
+
+
+def fake_worker_command(*flags: str) -> List[str]:
+    """
+    Builds the command running the fake MediaPipe worker (see fake_mediapipe_worker.py).
+    :param flags: Command line flags of the worker
+    :return: Command, as a list of arguments
+    """
+
+    return [sys.executable, "-m", "backend.mediapipe.fake_mediapipe_worker", *flags]
+
+
+@pytest.fixture
+def worker_env() -> dict:
+    """
+    Environment in which the fake MediaPipe worker finds the backend package.
+    """
+
+    return dict(os.environ, PYTHONPATH=REPO_DIR)
+
+
+@pytest.fixture
+def video_path(tmp_path) -> str:
+    """
+    Short video of VIDEO_FRAMES frames, each of a different gray level.
+    """
+
+    path = str(tmp_path / "video.mp4")
+    width, height = VIDEO_SIZE
+    with imageio.get_writer(path, fps=VIDEO_FPS) as writer:
+        for i in range(VIDEO_FRAMES):
+            writer.append_data(np.full((height, width, 3), i * 20, dtype=np.uint8))
+    return path
+
+
+@pytest.fixture
+def fake_mediapipe_dir(tmp_path, monkeypatch) -> str:
+    """
+    MediaPipe installation directory, containing the patched graph, whose build (through a fake bazel on PATH) installs
+    the fake worker as the multi-hand tracking binary.
+    """
+
+    mediapipe_dir = tmp_path / "mediapipe"
+    mediapipe_dir.mkdir()
+    (mediapipe_dir / "WORKSPACE").touch()
+    graph_path = mediapipe_dir / GRAPH_SUBPATH
+    graph_path.parent.mkdir(parents=True)
+    shutil.copyfile(os.path.join(REPO_DIR, "data", "mediapipe_custom", os.path.basename(GRAPH_SUBPATH)), graph_path)
+
+    binary = "#!/bin/sh\nexec {python} -m backend.mediapipe.fake_mediapipe_worker \"$@\"\n"
+    binary = binary.format(python=sys.executable)
+    bazel = tmp_path / "bin" / "bazel"
+    bazel.parent.mkdir()
+    bazel.write_text("#!/bin/sh\n"
+                     "d=bazel-bin/mediapipe/examples/desktop/multi_hand_tracking\n"
+                     "mkdir -p $d\n"
+                     "cat > $d/multi_hand_tracking_cpu <<'EOF'\n{binary}EOF\n"
+                     "chmod +x $d/multi_hand_tracking_cpu\n".format(binary=binary))
+    bazel.chmod(bazel.stat().st_mode | stat.S_IEXEC)
+
+    monkeypatch.setenv("PATH", str(bazel.parent) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("PYTHONPATH", REPO_DIR)
+    return str(mediapipe_dir)
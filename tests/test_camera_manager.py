@@ -0,0 +1,123 @@
+"""
+This file contains the tests of CameraManager, run on a SyntheticCamera standing in for the webcam.
+"""
+
+import time
+import queue
+import pytest
+
+from backend.recording.camera_manager import CameraManager
+from backend.recording.synthetic_camera import SyntheticCamera
+
+
+def make_manager(**kwargs) -> CameraManager:
+    return CameraManager(camera_factory=lambda: SyntheticCamera(resolution=(64, 48)), **kwargs)
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_warm_up_then_acquire_reuses_camera():
+    manager = make_manager(idle_timeout=None)
+    try:
+        manager.warm_up()
+        assert wait_until(manager.is_open)
+
+        manager.acquire()
+        assert manager.stats["opens"] == 1
+        assert manager.stats["reuses"] == 1
+        manager.release()
+
+        # Later recordings keep reusing the open camera
+        manager.acquire()
+        manager.release()
+        assert manager.stats["opens"] == 1
+        assert manager.stats["reuses"] == 2
+    finally:
+        manager.close()
+    assert not manager.is_open()
+
+
+def test_idle_release():
+    manager = make_manager(idle_timeout=0.2)
+    try:
+        manager.acquire()
+        manager.release()
+        assert manager.is_open()
+        assert wait_until(lambda: not manager.is_open())
+        assert manager.stats["idle_releases"] == 1
+
+        # The camera is opened again by the next recording
+        manager.acquire()
+        assert manager.stats["opens"] == 2
+        manager.release()
+    finally:
+        manager.close()
+
+
+def test_acquire_cancels_idle_release():
+    manager = make_manager(idle_timeout=0.3)
+    try:
+        manager.acquire()
+        manager.release()
+        time.sleep(0.1)
+        manager.acquire()
+        # The timer scheduled by the first release would have expired by now
+        time.sleep(0.5)
+        assert manager.is_open()
+        assert manager.stats["idle_releases"] == 0
+        assert manager.stats["opens"] == 1
+        assert manager.stats["reuses"] == 1
+        manager.release()
+    finally:
+        manager.close()
+
+
+def test_pre_roll_replayed_once():
+    fps = 20
+    manager = make_manager(idle_timeout=None, fps=fps, pre_roll=0.5)
+    history = int(round(0.5 * fps))
+    try:
+        manager.warm_up()
+        assert wait_until(manager.is_open)
+        capture = manager.acquire()
+        assert capture.is_running()
+        # Frames captured before the recording fill the history
+        assert wait_until(lambda: capture.stats["frames"] > history)
+
+        frames = capture.subscribe(maxsize=64, replay_history=True)
+        live = capture.subscribe(maxsize=64)
+        indices = [frames.get(timeout=5)[0] for _ in range(2 * history)]
+        live_first = live.get(timeout=5)[0]
+
+        # The history is replayed first, then live frames follow without gaps nor duplicates
+        assert indices == list(range(indices[0], indices[0] + 2 * history))
+        assert live_first - indices[0] == history
+        manager.release()
+
+        # Nothing is replayed twice to the same consumer
+        with pytest.raises(queue.Empty):
+            while True:
+                index = frames.get_nowait()[0]
+                assert index not in indices
+    finally:
+        manager.close()
+
+
+def test_acquire_in_use_raises():
+    manager = make_manager(idle_timeout=None)
+    try:
+        manager.acquire()
+        with pytest.raises(RuntimeError, match="already in use"):
+            manager.acquire()
+        manager.release()
+        manager.acquire()
+        manager.release()
+    finally:
+        manager.close()
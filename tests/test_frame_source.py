@@ -0,0 +1,123 @@
+"""
+This file contains the tests of RawFrameSource, reading frames from in-memory streams and from the fake MediaPipe
+worker through a FIFO.
+"""
+
+import io
+import numpy as np
+import pytest
+
+from backend.mediapipe.frame_source import RAW_HEADER, RawFrameSource
+from backend.mediapipe.mediapipe_helper import MediaPipeHelper
+from tests.conftest import VIDEO_FRAMES, VIDEO_SIZE
+
+WIDTH, HEIGHT, FPS = 4, 2, 6.0
+
+
+class Stream(io.BytesIO):
+
+    def __init__(self, header: str, frames: int, extra_bytes: int = 0):
+        """
+        Raw frame stream, each frame filled with its index in the blue channel.
+        :param header: Header line of the stream
+        :param frames: Number of complete frames in the stream
+        :param extra_bytes: Number of bytes of a truncated frame following the complete ones
+        """
+
+        data = np.zeros((frames, HEIGHT, WIDTH, 3), dtype=np.uint8)
+        data[..., 0] = np.arange(frames, dtype=np.uint8)[:, np.newaxis, np.newaxis]
+        super(Stream, self).__init__(header.encode() + data.tobytes() + bytes(extra_bytes))
+
+
+class CloseCounter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self) -> None:
+        self.calls += 1
+
+
+def header(frames: int) -> str:
+    return RAW_HEADER.format(width=WIDTH, height=HEIGHT, fps=FPS, frames=frames)
+
+
+def test_valid_stream():
+    stream, on_close = Stream(header(3), 3), CloseCounter()
+    source = RawFrameSource(stream, on_close=on_close)
+    assert (source.total_frames, source.size, source.duration) == (3, (WIDTH, HEIGHT), 0.5)
+
+    frames = [*source]
+    assert [index for index, _ in frames] == [0, 1, 2]
+    # BGR frames are yielded in RGB order
+    for index, frame in frames:
+        assert frame.shape == (HEIGHT, WIDTH, 3)
+        assert np.all(frame[..., 2] == index) and np.all(frame[..., :2] == 0)
+    assert source.timestamp(2) == pytest.approx(2 / FPS)
+    assert stream.closed and on_close.calls == 1
+
+
+def test_truncated_last_frame():
+    stream, on_close = Stream(header(3), 2, extra_bytes=WIDTH * HEIGHT), CloseCounter()
+    source = RawFrameSource(stream, on_close=on_close)
+    assert len([*source]) == 2
+    assert stream.closed and on_close.calls == 1
+
+
+@pytest.mark.parametrize("line", ["NOT A RAW HEADER\n",
+                                  "RAW 4 2 6.0\n",
+                                  "RAW four 2 6.0 3\n",
+                                  "RAW 4 2 0 3\n",
+                                  ""])
+def test_bad_header(line):
+    stream, on_close = Stream(line, 3), CloseCounter()
+    with pytest.raises(RuntimeError, match="Invalid raw frame stream header"):
+        RawFrameSource(stream, on_close=on_close)
+    assert stream.closed and on_close.calls == 1
+
+
+@pytest.mark.parametrize("frames", [0, 3])
+def test_unknown_frame_count(frames):
+    stream, on_close = Stream(header(0), frames), CloseCounter()
+    source = RawFrameSource(stream, on_close=on_close)
+
+    assert len([*source]) == frames
+    assert stream.closed and on_close.calls == 1
+    if frames > 0:
+        assert source.total_frames == frames
+        assert source.duration == pytest.approx(frames / FPS)
+        assert source.timestamp(frames - 1) == pytest.approx((frames - 1) / FPS)
+
+
+def test_on_close_error_is_raised():
+    def fail() -> None:
+        raise RuntimeError("producer failed")
+
+    with pytest.raises(RuntimeError, match="producer failed"):
+        RawFrameSource(Stream("", 0), on_close=fail)
+
+
+@pytest.fixture
+def persistent_helper(fake_mediapipe_dir):
+    helper = MediaPipeHelper(mediapipe_dir=fake_mediapipe_dir, persistent=True)
+    yield helper
+    helper.close()
+
+
+def test_fifo_stream(persistent_helper, video_path):
+    source = persistent_helper.stream(video_path)
+    assert source.size == VIDEO_SIZE
+
+    frames = [frame for _, frame in source]
+    assert len(frames) == VIDEO_FRAMES
+    # Gray levels of the video survive encoding within a few levels
+    levels = [float(frame.mean()) for frame in frames]
+    assert levels == pytest.approx([i * 20 for i in range(VIDEO_FRAMES)], abs=4)
+
+
+def test_fifo_stream_worker_fails_before_opening(persistent_helper, video_path, tmp_path):
+    with pytest.raises(RuntimeError, match="MediaPipe cannot process the video"):
+        persistent_helper.stream(str(tmp_path / "missing.mp4"))
+
+    # The worker is left ready for the next video
+    assert len([*persistent_helper.stream(video_path)]) == VIDEO_FRAMES
@@ -0,0 +1,77 @@
+"""
+This file contains the tests of MediaPipeRunner and MediaPipePool, run against the fake MediaPipe binary.
+"""
+
+import os
+import time
+import pytest
+
+from backend.mediapipe.mediapipe_runner import MediaPipeRunner, MediaPipePool
+from backend.mediapipe.mediapipe_helper import MediaPipeHelper
+from tests.conftest import REPO_DIR, fake_worker_command
+
+
+def make_runner(worker_env: dict, *flags: str) -> MediaPipeRunner:
+    return MediaPipeRunner(command=fake_worker_command(*flags), cwd=REPO_DIR, env=worker_env)
+
+
+@pytest.fixture
+def broken_video_path(tmp_path) -> str:
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"not a video")
+    return str(path)
+
+
+def test_run_succeeds(worker_env, video_path, tmp_path):
+    output_path = str(tmp_path / "output.mp4")
+    make_runner(worker_env).run(video_path, output_path=output_path, timeout=30.0)
+    assert os.path.getsize(output_path) > 0
+
+
+def test_unreadable_input_raises(worker_env, broken_video_path, tmp_path):
+    with pytest.raises(RuntimeError):
+        make_runner(worker_env).run(broken_video_path, output_path=str(tmp_path / "output.mp4"), timeout=30.0)
+
+
+def test_failure_partway_raises(worker_env, video_path, tmp_path):
+    output_path = str(tmp_path / "output.mp4")
+    with pytest.raises(RuntimeError):
+        make_runner(worker_env, "--fail_after=3").run(video_path, output_path=output_path, timeout=30.0)
+    # The graph failed after writing part of the output
+    assert os.path.isfile(output_path)
+
+
+def test_pool_reports_failures(worker_env, video_path, broken_video_path, tmp_path):
+    jobs = [(video_path, str(tmp_path / "output.mp4"), None),
+            (broken_video_path, str(tmp_path / "broken_output.mp4"), None)]
+    with MediaPipePool(make_runner(worker_env), max_concurrent=2) as pool:
+        errors = pool.map(jobs, timeout=30.0)
+
+    assert errors[0] is None
+    assert isinstance(errors[1], RuntimeError)
+
+
+def test_helper_reports_failures(fake_mediapipe_dir, video_path, broken_video_path, tmp_path):
+    helper = MediaPipeHelper(mediapipe_dir=fake_mediapipe_dir)
+    with pytest.raises(RuntimeError):
+        helper.run(broken_video_path, output_dir=str(tmp_path / "broken_output.mp4"), timeout=30.0)
+
+    errors = helper.run_many([(video_path, str(tmp_path / "output.mp4"), None),
+                              (broken_video_path, str(tmp_path / "broken_output.mp4"), None)],
+                             timeout=30.0)
+    assert errors[0] is None
+    assert isinstance(errors[1], RuntimeError)
+
+
+def test_pool_close_cancels_queued_videos(worker_env, video_path, tmp_path):
+    pool = MediaPipePool(make_runner(worker_env, "--run_delay=30"), max_concurrent=1)
+    futures = [pool.submit(video_path, output_path=str(tmp_path / "output_{i}.mp4".format(i=i))) for i in range(3)]
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    pool.close(cancel=True)
+    assert time.monotonic() - start < 10.0
+
+    with pytest.raises(RuntimeError):
+        futures[0].result()
+    assert all(future.cancelled() for future in futures[1:])
@@ -0,0 +1,89 @@
+"""
+This file contains the tests of MediaPipeWorker, run against the fake MediaPipe worker in --serve mode.
+"""
+
+import pytest
+
+from backend.mediapipe.mediapipe_worker import MediaPipeWorker
+from tests.conftest import REPO_DIR, VIDEO_FRAMES, fake_worker_command
+
+
+def start_worker(worker_env: dict, *flags: str, **kwargs) -> MediaPipeWorker:
+    return MediaPipeWorker(command=fake_worker_command("--serve", *flags),
+                           cwd=REPO_DIR,
+                           env=worker_env,
+                           start_timeout=30.0,
+                           **kwargs)
+
+
+def test_health_check(worker_env):
+    worker = start_worker(worker_env)
+    assert not worker.health_check()
+
+    worker.start()
+    try:
+        assert worker.is_alive()
+        assert worker.health_check()
+    finally:
+        worker.stop()
+
+    assert not worker.is_alive()
+    assert not worker.health_check()
+
+
+def test_process_reports_frame_count(worker_env, video_path, tmp_path):
+    worker = start_worker(worker_env)
+    output_path = str(tmp_path / "output.mp4")
+    try:
+        assert worker.process(input_path=video_path, output_path=output_path) == VIDEO_FRAMES
+        # The graph is loaded once for every video
+        assert worker.process(input_path=video_path) == VIDEO_FRAMES
+        assert worker.restarts == 0
+    finally:
+        worker.stop()
+
+    with open(video_path, "rb") as input_file, open(output_path, "rb") as output_file:
+        assert input_file.read() == output_file.read()
+
+
+def test_process_error_keeps_worker(worker_env, tmp_path):
+    worker = start_worker(worker_env)
+    try:
+        with pytest.raises(RuntimeError, match="MediaPipe worker failed"):
+            worker.process(input_path=str(tmp_path / "missing.mp4"))
+        assert worker.health_check()
+        assert worker.restarts == 0
+    finally:
+        worker.stop()
+
+
+def test_crash_restarts_once(worker_env, video_path):
+    worker = start_worker(worker_env, "--crash_after", "0")
+    try:
+        with pytest.raises(RuntimeError, match="exited"):
+            worker.process(input_path=video_path)
+        assert worker.restarts == 1
+    finally:
+        worker.stop()
+
+
+def test_timeout_kills_worker(worker_env, video_path):
+    worker = start_worker(worker_env, "--run_delay", "30")
+    try:
+        worker.start()
+        with pytest.raises(TimeoutError):
+            worker.process(input_path=video_path, timeout=0.5)
+        assert not worker.is_alive()
+    finally:
+        worker.stop()
+
+
+def test_start_timeout(worker_env):
+    worker = MediaPipeWorker(command=fake_worker_command("--serve", "--startup_delay", "30"),
+                             cwd=REPO_DIR,
+                             env=worker_env,
+                             start_timeout=0.5,
+                             max_restarts=0)
+    with pytest.raises(RuntimeError, match="cannot be started"):
+        worker.start()
+    assert not worker.is_alive()
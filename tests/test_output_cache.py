@@ -0,0 +1,158 @@
+"""
+This file contains the tests of OutputCache, and of the caching of MediaPipe outputs by MediaPipeHelper, run against
+the fake MediaPipe binary.
+"""
+
+import os
+import stat
+import shutil
+import pytest
+
+from backend.mediapipe.output_cache import OutputCache
+from backend.mediapipe.mediapipe_helper import MediaPipeHelper, MEDIAPIPE_SUBPATH, TARGET
+
+
+def write_file(path, size: int, fill: bytes = b"x") -> str:
+    path.write_bytes(fill * size)
+    return str(path)
+
+
+def age_entries(cache_dir: str) -> None:
+    # Entries are ordered by last use time, set far apart so that the order does not depend on timer resolution
+    for i, name in enumerate(sorted(os.listdir(cache_dir))):
+        os.utime(os.path.join(cache_dir, name), (1000 + i, 1000 + i))
+
+
+def test_hits_and_misses(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    video = write_file(tmp_path / "video.mp4", 100, b"v")
+    landmarks = write_file(tmp_path / "landmarks.bin", 10, b"l")
+    outputs = {cache.key(video, "fp", "video"): str(tmp_path / "out_video.mp4"),
+               cache.key(video, "fp", "landmarks"): str(tmp_path / "out_landmarks.bin")}
+    video_key, landmarks_key = outputs
+
+    assert not cache.get(outputs)
+    cache.put(video_key, video)
+    # A run counts as a hit only if all of its outputs are cached
+    assert not cache.get(outputs)
+    assert not os.path.exists(outputs[video_key])
+    cache.put(landmarks_key, landmarks)
+    assert cache.get(outputs)
+
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+    with open(outputs[video_key], "rb") as f:
+        assert f.read() == b"v" * 100
+    with open(outputs[landmarks_key], "rb") as f:
+        assert f.read() == b"l" * 10
+
+
+def test_keys_depend_on_content_and_fingerprint(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    first = write_file(tmp_path / "first.mp4", 10, b"a")
+    copy = str(tmp_path / "copy.mp4")
+    shutil.copyfile(first, copy)
+    other = write_file(tmp_path / "other.mp4", 10, b"b")
+
+    assert cache.key(first, "fp", "video") == cache.key(copy, "fp", "video")
+    assert cache.key(first, "fp", "video") != cache.key(other, "fp", "video")
+    assert cache.key(first, "fp", "video") != cache.key(first, "other_fp", "video")
+    assert cache.key(first, "fp", "video") != cache.key(first, "fp", "landmarks")
+
+
+def test_lru_eviction(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    cache = OutputCache(cache_dir, max_size=300)
+    for name in ["a", "b", "c"]:
+        cache.put(name, write_file(tmp_path / name, 100))
+    age_entries(cache_dir)
+    assert cache.size() == 300
+
+    # Using 'a' makes 'b' the least recently used entry
+    assert cache.get({"a": str(tmp_path / "a_out")})
+    cache.put("d", write_file(tmp_path / "d", 100))
+
+    assert [key for key, _, _ in cache.entries()][-2:] == ["a", "d"]
+    assert not cache.contains("b")
+    assert cache.contains("c")
+    assert cache.size() <= 300
+    assert cache.stats["evictions"] == 1
+
+
+def test_oversized_entry_is_evicted(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"), max_size=50)
+    cache.put("big", write_file(tmp_path / "big", 100))
+
+    assert not cache.contains("big")
+    assert cache.size() == 0
+
+
+def test_put_is_atomic(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    cache = OutputCache(cache_dir)
+    cache.put("key", write_file(tmp_path / "old", 10, b"o"))
+
+    def failing_copy(source: str, destination: str) -> None:
+        with open(destination, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(shutil, "copyfile", failing_copy)
+    with pytest.raises(OSError):
+        cache.put("key", write_file(tmp_path / "new", 10, b"n"))
+    with pytest.raises(OSError):
+        cache.put("other", write_file(tmp_path / "new", 10, b"n"))
+    monkeypatch.undo()
+
+    # Neither partial copies nor temporary files are left behind, and the previous entry is untouched
+    assert sorted(os.listdir(cache_dir)) == ["key"]
+    with open(os.path.join(cache_dir, "key"), "rb") as f:
+        assert f.read() == b"o" * 10
+
+
+def replace_binary(mediapipe_dir: str, script: str) -> None:
+    binary = os.path.join(mediapipe_dir, "bazel-bin", MEDIAPIPE_SUBPATH, TARGET)
+    with open(binary, "w") as f:
+        f.write(script)
+    os.chmod(binary, os.stat(binary).st_mode | stat.S_IEXEC)
+
+
+def test_helper_caches_successful_runs(fake_mediapipe_dir, video_path, tmp_path):
+    helper = MediaPipeHelper(mediapipe_dir=fake_mediapipe_dir, cache_dir=str(tmp_path / "cache"))
+    output_path = str(tmp_path / "output.mp4")
+
+    helper.run(video_path, output_dir=output_path, timeout=30.0)
+    os.remove(output_path)
+    helper.run(video_path, output_dir=output_path, timeout=30.0)
+
+    assert os.path.getsize(output_path) > 0
+    assert helper.cache_stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_helper_does_not_cache_failed_runs(fake_mediapipe_dir, video_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    helper = MediaPipeHelper(mediapipe_dir=fake_mediapipe_dir, cache_dir=cache_dir)
+    with open(os.path.join(fake_mediapipe_dir, "bazel-bin", MEDIAPIPE_SUBPATH, TARGET)) as f:
+        script = f.read()
+    # The graph fails partway through the video, leaving a truncated output
+    replace_binary(fake_mediapipe_dir, script.replace('"$@"', '--fail_after=3 "$@"'))
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            helper.run(video_path, output_dir=str(tmp_path / "output.mp4"), timeout=30.0)
+    assert helper.cache_stats()["hits"] == 0
+    assert os.listdir(cache_dir) == []
+
+
+def test_helper_does_not_cache_empty_outputs(fake_mediapipe_dir, video_path, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    helper = MediaPipeHelper(mediapipe_dir=fake_mediapipe_dir, cache_dir=cache_dir)
+    # The binary exits successfully, producing an empty output video
+    replace_binary(fake_mediapipe_dir, "#!/bin/sh\n"
+                                       "for a in \"$@\"; do\n"
+                                       "  case $a in --output_video_path=*) : > \"${a#*=}\";; esac\n"
+                                       "done\n")
+
+    for _ in range(2):
+        helper.run(video_path, output_dir=str(tmp_path / "output.mp4"), timeout=30.0)
+    assert helper.cache_stats()["hits"] == 0
+    assert os.listdir(cache_dir) == []
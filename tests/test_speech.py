@@ -0,0 +1,102 @@
+"""
+This file contains the tests of SpeechClient, sending audio to FakeSpeechClient in each encoding accepted by Google
+Cloud Speech.
+"""
+
+import numpy as np
+import pytest
+
+from backend.clients.speech import SpeechClient
+from backend.clients.fake_speech import FakeSpeechClient
+from backend.recording.audio_encoding import AUDIO_ENCODINGS, encode_audio
+
+RATE = 16000
+DURATION = 3.0
+
+
+@pytest.fixture(scope="module")
+def samples():
+    t = np.arange(int(DURATION * RATE)) / RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+@pytest.mark.parametrize("encoding", ["LINEAR16", "FLAC", "OGG_OPUS"])
+def test_process_audio_config_matches_content(samples, encoding):
+    fake = FakeSpeechClient()
+    client = SpeechClient(client=fake)
+    content = encode_audio(samples, RATE, encoding)
+
+    operation = client.process_audio(audio_content=content, encoding=encoding, sample_rate=RATE)
+
+    request = fake.requests[-1]
+    assert request["config"]["encoding"] == encoding
+    assert request["config"]["sample_rate_hertz"] == RATE == request["samplerate"]
+    assert request["format"] == AUDIO_ENCODINGS[encoding][0]
+    assert request["config"]["enable_word_time_offsets"]
+    assert request["bytes"] == len(content)
+    assert request["duration"] == pytest.approx(DURATION, abs=0.05)
+    assert client.get_words(operation) == [("word0", 0.0, 1.0), ("word1", 1.0, 2.0), ("word2", 2.0, 3.0)]
+
+
+def test_compressed_encodings_are_smaller(samples):
+    sizes = {encoding: len(encode_audio(samples, RATE, encoding)) for encoding in AUDIO_ENCODINGS}
+    assert sizes["OGG_OPUS"] < sizes["FLAC"] < sizes["LINEAR16"]
+
+
+def test_process_audio_from_path(samples, tmp_path):
+    fake = FakeSpeechClient()
+    path = tmp_path / "audio.wav"
+    path.write_bytes(encode_audio(samples, RATE, "LINEAR16"))
+
+    SpeechClient(client=fake).process_audio(audio_path=str(path))
+
+    request = fake.requests[-1]
+    assert request["config"]["encoding"] == "LINEAR16"
+    assert "sample_rate_hertz" not in request["config"]
+    assert request["samplerate"] == RATE
+
+
+@pytest.mark.parametrize("content_encoding, encoding", [("FLAC", "LINEAR16"),
+                                                        ("LINEAR16", "FLAC"),
+                                                        ("LINEAR16", "OGG_OPUS")])
+def test_mismatching_encoding_is_rejected(samples, content_encoding, encoding):
+    fake = FakeSpeechClient()
+    content = encode_audio(samples, RATE, content_encoding)
+
+    with pytest.raises(ValueError):
+        SpeechClient(client=fake).process_audio(audio_content=content, encoding=encoding, sample_rate=RATE)
+    assert fake.requests == []
+
+
+@pytest.mark.parametrize("encoding", ["LINEAR16", "FLAC", "OGG_OPUS"])
+def test_mismatching_sample_rate_is_rejected(samples, encoding):
+    fake = FakeSpeechClient()
+    content = encode_audio(samples, RATE, encoding)
+
+    with pytest.raises(ValueError):
+        SpeechClient(client=fake).process_audio(audio_content=content, encoding=encoding, sample_rate=8000)
+    assert fake.requests == []
+
+
+def test_opus_without_sample_rate_raises(samples):
+    fake = FakeSpeechClient()
+    content = encode_audio(samples, RATE, "OGG_OPUS")
+
+    with pytest.raises(ValueError):
+        SpeechClient(client=fake).process_audio(audio_content=content, encoding="OGG_OPUS")
+    assert fake.requests == []
+
+
+def test_missing_audio_raises():
+    with pytest.raises(ValueError):
+        SpeechClient(client=FakeSpeechClient()).process_audio()
+
+
+def test_get_words_sub_second_offsets(samples):
+    fake = FakeSpeechClient(word_duration=0.75)
+    client = SpeechClient(client=fake)
+    operation = client.process_audio(audio_content=encode_audio(samples, RATE, "LINEAR16"))
+
+    words = client.get_words(operation)
+    assert [w for w, _, _ in words] == ["word0", "word1", "word2", "word3"]
+    assert [(s, e) for _, s, e in words] == pytest.approx([(0.0, 0.75), (0.75, 1.5), (1.5, 2.25), (2.25, 3.0)])
@@ -0,0 +1,125 @@
+"""
+This file contains the tests of the silence removal applied before word recognition, from the detection of speech to
+the mapping of word timings back to the recording.
+"""
+
+import numpy as np
+import pytest
+
+from backend.clients.speech import SpeechClient
+from backend.clients.fake_speech import FakeSpeechClient
+from backend.recording.audio_encoding import encode_audio
+from backend.recording.voice_activity import OffsetMap, detect_speech, compress_silences
+
+RATE = 16000
+# Duration of the frames energy is measured on (see detect_speech)
+FRAME = 0.03
+
+
+def recording(duration: float, bursts: list, seed: int = 0) -> np.ndarray:
+    """
+    Synthesizes faint background noise, with a loud tone for each burst of speech.
+    :param duration: Duration of the recording (in seconds)
+    :param bursts: List of bursts of speech, as tuples (start, stop) (in seconds)
+    :param seed: Seed of the noise
+    :return: Samples (as np.ndarray of float32)
+    """
+
+    samples = 0.001 * np.random.default_rng(seed).standard_normal(int(duration * RATE))
+    for start, stop in bursts:
+        t = np.arange(int(start * RATE), int(stop * RATE)) / RATE
+        samples[int(start * RATE):int(stop * RATE)] += 0.3 * np.sin(2 * np.pi * 220 * t)
+    return samples.astype(np.float32)
+
+
+def test_detect_speech_finds_bursts():
+    regions = detect_speech(recording(9.0, [(2.0, 3.0), (6.0, 7.0)]), RATE)
+
+    assert len(regions) == 2
+    for (start, stop), (expected_start, expected_stop) in zip(regions, [(2.0, 3.0), (6.0, 7.0)]):
+        assert start / RATE == pytest.approx(expected_start, abs=FRAME)
+        assert stop / RATE == pytest.approx(expected_stop, abs=FRAME)
+
+
+def test_silences_around_bursts_are_removed():
+    samples = recording(9.0, [(2.0, 3.0), (6.0, 7.0)])
+    trimmed, offsets = compress_silences(samples, RATE, detect_speech(samples, RATE), padding=0.25, min_silence=1.0)
+
+    # Leading, middle and trailing silences are removed, keeping 0.25 s around each burst
+    assert len(trimmed) / RATE == pytest.approx(2 * (1.0 + 2 * 0.25), abs=4 * FRAME)
+    assert len(offsets.segments) == 2
+    assert offsets.segments[0][1] == pytest.approx(1.75, abs=FRAME)
+    assert offsets.segments[1][1] == pytest.approx(5.75, abs=FRAME)
+    # Leading silence (1.75 s) and middle one (2.5 s), up to the last segment
+    assert offsets.removed == pytest.approx(1.75 + 2.5, abs=2 * FRAME)
+    # Samples are kept as they were recorded
+    start = int(offsets.segments[1][0] * RATE)
+    original_start = int(round(offsets.segments[1][1] * RATE))
+    assert np.array_equal(trimmed[start:start + 100], samples[original_start:original_start + 100])
+
+
+def test_short_gaps_are_merged():
+    samples = recording(8.0, [(2.0, 3.0), (3.8, 4.8)])
+    regions = detect_speech(samples, RATE)
+    assert len(regions) == 2
+
+    # The padded gap (0.3 s) is shorter than min_silence
+    trimmed, offsets = compress_silences(samples, RATE, regions, padding=0.25, min_silence=1.0)
+    assert len(offsets.segments) == 1
+    assert offsets.segments[0][1] == pytest.approx(1.75, abs=FRAME)
+    assert len(trimmed) / RATE == pytest.approx(4.8 + 0.25 - 1.75, abs=2 * FRAME)
+
+
+@pytest.mark.parametrize("samples", [np.zeros(3 * RATE, dtype=np.float32), recording(3.0, [])],
+                         ids=["digital_silence", "noise"])
+def test_silent_recording_is_unchanged(samples):
+    regions = detect_speech(samples, RATE)
+    trimmed, offsets = compress_silences(samples, RATE, regions)
+
+    assert regions == []
+    assert trimmed is samples
+    assert offsets.removed == 0.0
+    assert offsets.to_original(1.234) == pytest.approx(1.234)
+
+
+@pytest.fixture
+def offsets() -> OffsetMap:
+    # Speech from 2 s to 3.5 s and from 6 s to 7.5 s, kept with 0.25 s of padding: 2 s segments
+    regions = [(2 * RATE, int(3.5 * RATE)), (6 * RATE, int(7.5 * RATE))]
+    _, offsets = compress_silences(np.zeros(9 * RATE, dtype=np.float32), RATE, regions, padding=0.25)
+    assert offsets.segments == [(0.0, 1.75, 2.0), (2.0, 5.75, 2.0)]
+    return offsets
+
+
+@pytest.mark.parametrize("timing, expected", [(0.0, 1.75),
+                                              # Within the padding before and after the first region
+                                              (0.1, 1.85),
+                                              (1.9, 3.65),
+                                              # Within the padding before the second region
+                                              (2.1, 5.85),
+                                              # Within the second region
+                                              (3.0, 6.75)])
+def test_to_original(offsets, timing, expected):
+    assert offsets.to_original(timing) == pytest.approx(expected)
+    assert offsets.to_original(timing, end=True) == pytest.approx(expected)
+
+
+def test_to_original_on_boundary(offsets):
+    # Starts on the boundary belong to the second segment, ends to the first one
+    assert offsets.to_original(2.0) == pytest.approx(5.75)
+    assert offsets.to_original(2.0, end=True) == pytest.approx(3.75)
+    # Times past the last segment stay at its end
+    assert offsets.to_original(4.0, end=True) == pytest.approx(7.75)
+    assert offsets.to_original(5.0) == pytest.approx(7.75)
+
+
+def test_word_timings_refer_to_recording(offsets):
+    client = SpeechClient(client=FakeSpeechClient(word_duration=1.0))
+    operation = client.process_audio(audio_content=encode_audio(np.zeros(4 * RATE, dtype=np.float32), RATE))
+
+    words = client.get_words(operation, offsets=offsets)
+    # The word ending on the boundary between the segments ends before the silence removed
+    assert [(start, end) for _, start, end in words] == pytest.approx([(1.75, 2.75),
+                                                                       (2.75, 3.75),
+                                                                       (5.75, 6.75),
+                                                                       (6.75, 7.75)])